@@ -0,0 +1,75 @@
+"""add borrowed_books indexes
+
+Revision ID: 00b154549e22
+Revises: 352d7bdf27d2
+Create Date: 2026-10-18 09:27:40.118533
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "00b154549e22"
+down_revision: Union[str, None] = "352d7bdf27d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_borrowed_books_reader_id_return_date",
+            "borrowed_books",
+            ["reader_id", "return_date"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_borrowed_books_book_id",
+            "borrowed_books",
+            ["book_id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # частичный индекс только по открытым выдачам
+        op.create_index(
+            "ix_borrowed_books_open_loans",
+            "borrowed_books",
+            ["reader_id"],
+            unique=False,
+            postgresql_where=sa.text("return_date IS NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_borrowed_books_borrow_date_id",
+            "borrowed_books",
+            ["borrow_date", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in (
+            "ix_borrowed_books_borrow_date_id",
+            "ix_borrowed_books_open_loans",
+            "ix_borrowed_books_book_id",
+            "ix_borrowed_books_reader_id_return_date",
+        ):
+            op.drop_index(
+                name,
+                table_name="borrowed_books",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -0,0 +1,48 @@
+"""add book search indexes
+
+Revision ID: 352d7bdf27d2
+Revises: 3ecd43347253
+Create Date: 2026-10-18 09:02:11.412307
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "352d7bdf27d2"
+down_revision: Union[str, None] = "3ecd43347253"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # выражение должно совпадать с SEARCH_VECTOR в app/crud/crud_books.py,
+    # иначе планировщик не сможет использовать индекс
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_search "
+            "ON books USING gin (to_tsvector('simple', "
+            "coalesce(title, '') || ' ' || coalesce(author, '') || ' ' "
+            "|| coalesce(description, '')))"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_title_trgm "
+            "ON books USING gin (title gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_author_trgm "
+            "ON books USING gin (author gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_books_author_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_books_title_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_books_search")
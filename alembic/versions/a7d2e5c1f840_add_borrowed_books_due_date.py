@@ -0,0 +1,61 @@
+"""add borrowed_books due_date and overdue flag
+
+Revision ID: a7d2e5c1f840
+Revises: f1c8a3d6e27b
+Create Date: 2026-10-18 17:12:40.903117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a7d2e5c1f840"
+down_revision: Union[str, None] = "f1c8a3d6e27b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "borrowed_books",
+        sa.Column("due_date", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "borrowed_books",
+        sa.Column("overdue_flagged_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    # у старых выдач срок считается от даты выдачи (LOAN_PERIOD_DAYS по умолчанию)
+    op.execute(
+        "UPDATE borrowed_books SET due_date = borrow_date + interval '14 days' "
+        "WHERE due_date IS NULL"
+    )
+
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        # частичный индекс только по открытым выдачам
+        op.create_index(
+            "ix_borrowed_books_open_due_date",
+            "borrowed_books",
+            ["due_date", "id"],
+            unique=False,
+            postgresql_where=sa.text("return_date IS NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_borrowed_books_open_due_date",
+            table_name="borrowed_books",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("borrowed_books", "overdue_flagged_at")
+    op.drop_column("borrowed_books", "due_date")
@@ -0,0 +1,66 @@
+"""split book copies into total_copies and available_copies
+
+Revision ID: b93d5f0e2c68
+Revises: e4a2c9b71f35
+Create Date: 2026-10-18 14:26:52.184096
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b93d5f0e2c68"
+down_revision: Union[str, None] = "e4a2c9b71f35"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # copies всегда означало экземпляры на полке; отрицательные значения
+    # оставлены гонкой при выдаче - на полке таких книг нет
+    op.execute("UPDATE books SET copies = 0 WHERE copies IS NULL OR copies < 0")
+    with op.batch_alter_table("books") as batch_op:
+        batch_op.alter_column(
+            "copies",
+            new_column_name="available_copies",
+            existing_type=sa.Integer(),
+            nullable=False,
+        )
+        batch_op.add_column(sa.Column("total_copies", sa.Integer(), nullable=True))
+
+    # всего экземпляров = на полке + на руках
+    op.execute("""
+        UPDATE books SET total_copies = available_copies + (
+            SELECT count(*) FROM borrowed_books
+            WHERE borrowed_books.book_id = books.id
+              AND borrowed_books.return_date IS NULL
+        )
+        """)
+    with op.batch_alter_table("books") as batch_op:
+        batch_op.alter_column(
+            "total_copies",
+            existing_type=sa.Integer(),
+            nullable=False,
+            server_default=sa.text("1"),
+        )
+        batch_op.create_check_constraint(
+            "ck_books_available_copies",
+            "available_copies >= 0 AND available_copies <= total_copies",
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("books") as batch_op:
+        batch_op.drop_constraint("ck_books_available_copies", type_="check")
+        batch_op.drop_column("total_copies")
+        batch_op.alter_column(
+            "available_copies",
+            new_column_name="copies",
+            existing_type=sa.Integer(),
+            nullable=True,
+        )
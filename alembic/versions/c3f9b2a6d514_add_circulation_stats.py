@@ -0,0 +1,100 @@
+"""add circulation stats rollups
+
+Revision ID: c3f9b2a6d514
+Revises: a7d2e5c1f840
+Create Date: 2026-10-18 18:40:27.651204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c3f9b2a6d514"
+down_revision: Union[str, None] = "a7d2e5c1f840"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "daily_circulation",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("issued", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("returned", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("day"),
+    )
+    op.create_table(
+        "monthly_book_circulation",
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("book_id", sa.Integer(), nullable=False),
+        sa.Column("issues", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("month", "book_id"),
+    )
+    op.create_index(
+        "ix_monthly_book_circulation_top",
+        "monthly_book_circulation",
+        ["month", "issues", "book_id"],
+        unique=False,
+    )
+    op.create_table(
+        "monthly_reader_circulation",
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("reader_id", sa.Integer(), nullable=False),
+        sa.Column("issues", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("month", "reader_id"),
+    )
+    op.create_index(
+        "ix_monthly_reader_circulation_top",
+        "monthly_reader_circulation",
+        ["month", "issues", "reader_id"],
+        unique=False,
+    )
+    op.create_table(
+        "circulation_stats_state",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("issued_id", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("pending_issued_id", sa.Integer(), nullable=True),
+        sa.Column("returned_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("returned_id", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("pending_returned_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("refreshed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        # частичный индекс только по возвращенным книгам
+        op.create_index(
+            "ix_borrowed_books_return_date_id",
+            "borrowed_books",
+            ["return_date", "id"],
+            unique=False,
+            postgresql_where=sa.text("return_date IS NOT NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_borrowed_books_return_date_id",
+            table_name="borrowed_books",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_table("circulation_stats_state")
+    op.drop_index(
+        "ix_monthly_reader_circulation_top", table_name="monthly_reader_circulation"
+    )
+    op.drop_table("monthly_reader_circulation")
+    op.drop_index(
+        "ix_monthly_book_circulation_top", table_name="monthly_book_circulation"
+    )
+    op.drop_table("monthly_book_circulation")
+    op.drop_table("daily_circulation")
@@ -0,0 +1,80 @@
+"""add book ratings
+
+Revision ID: d8e1f4a7b392
+Revises: c3f9b2a6d514
+Create Date: 2026-10-18 20:12:45.318207
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d8e1f4a7b392"
+down_revision: Union[str, None] = "c3f9b2a6d514"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# то же выражение, что models.RATING_AVERAGE
+RATING_AVERAGE = (
+    "coalesce((rating_sum * 1.0) / CAST(nullif(rating_count, 0) AS NUMERIC), 0)"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # колонки со значением по умолчанию добавляются без перезаписи таблицы
+    op.add_column(
+        "books",
+        sa.Column("rating_sum", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "books",
+        sa.Column("rating_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.create_table(
+        "book_ratings",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("book_id", sa.Integer(), nullable=True),
+        sa.Column("reader_id", sa.Integer(), nullable=True),
+        sa.Column("rating", sa.Integer(), nullable=False),
+        sa.Column(
+            "rated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.CheckConstraint(
+            "rating >= 1 AND rating <= 5", name="ck_book_ratings_rating"
+        ),
+        sa.ForeignKeyConstraint(["book_id"], ["books.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["reader_id"], ["readers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("book_id", "reader_id", name="uq_book_ratings_book_reader"),
+    )
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_books_rating_average",
+            "books",
+            [sa.text(RATING_AVERAGE), "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_books_rating_average",
+            table_name="books",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_table("book_ratings")
+    op.drop_column("books", "rating_count")
+    op.drop_column("books", "rating_sum")
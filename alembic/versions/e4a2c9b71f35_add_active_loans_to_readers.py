@@ -0,0 +1,53 @@
+"""add active_loans to readers
+
+Revision ID: e4a2c9b71f35
+Revises: 5b7e0d3c6a41
+Create Date: 2026-10-18 13:41:07.553390
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e4a2c9b71f35"
+down_revision: Union[str, None] = "5b7e0d3c6a41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "readers",
+        sa.Column("active_loans", sa.Integer(), server_default="0", nullable=False),
+    )
+
+    # заполняем счётчик по уже существующим выдачам
+    # у читателя могло оказаться больше 3 открытых выдач (гонка до user-004):
+    # счётчик ставится в лимит, иначе не пройдет CHECK ниже
+    # (python -m app.reconcile покажет таких читателей как over_limit)
+    op.execute("""
+        UPDATE readers SET active_loans = (
+            SELECT CASE WHEN count(*) > 3 THEN 3 ELSE count(*) END
+            FROM borrowed_books
+            WHERE borrowed_books.reader_id = readers.id
+              AND borrowed_books.return_date IS NULL
+        )
+        """)
+    # batch: в SQLite ограничение добавляется пересозданием таблицы,
+    # в PostgreSQL это обычный ALTER TABLE
+    with op.batch_alter_table("readers") as batch_op:
+        batch_op.create_check_constraint(
+            "ck_readers_active_loans",
+            "active_loans >= 0 AND active_loans <= 3",
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("readers") as batch_op:
+        batch_op.drop_constraint("ck_readers_active_loans", type_="check")
+        batch_op.drop_column("active_loans")
@@ -0,0 +1,88 @@
+"""add books catalogue indexes
+
+Revision ID: f1c8a3d6e27b
+Revises: b93d5f0e2c68
+Create Date: 2026-10-18 16:05:11.482913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f1c8a3d6e27b"
+down_revision: Union[str, None] = "b93d5f0e2c68"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, columns in (
+            ("ix_books_title_id", ["title", "id"]),
+            ("ix_books_author_year", ["author", "year"]),
+            ("ix_books_year_id", ["year", "id"]),
+        ):
+            op.create_index(
+                name,
+                "books",
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        # частичный индекс только по книгам в наличии
+        op.create_index(
+            "ix_books_available_id",
+            "books",
+            ["id"],
+            unique=False,
+            postgresql_where=sa.text("available_copies > 0"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # одиночные индексы покрываются составными с той же первой колонкой
+        for name in ("ix_books_title", "ix_books_author"):
+            op.drop_index(
+                name,
+                table_name="books",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_books_author",
+            "books",
+            ["author"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_books_title",
+            "books",
+            ["title"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        for name in (
+            "ix_books_available_id",
+            "ix_books_year_id",
+            "ix_books_author_year",
+            "ix_books_title_id",
+        ):
+            op.drop_index(
+                name,
+                table_name="books",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -0,0 +1,84 @@
+# Пересчет статистики выдач для /stats/*.
+#
+# Агрегаты (по дням, по книгам и читателям за месяц) дополняются только
+# новыми строками borrowed_books: выдачами после последнего учтенного id и
+# возвратами после последнего учтенного (return_date, id). Каждая порция
+# из STATS_REFRESH_BATCH_SIZE строк - отдельная короткая транзакция.
+# Строки учитываются с задержкой на один пересчет, поэтому транзакции,
+# которые шли во время пересчета, не теряются.
+#
+# В приложении запускается раз в STATS_REFRESH_INTERVAL секунд; вручную:
+#
+#   python -m app.analytics            # учесть новые строки
+#   python -m app.analytics --rebuild  # пересчитать всю историю
+
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+from app.core.config import settings
+from app.crud import crud_stats
+from app.database import run_in_new_session
+
+logger = logging.getLogger("app.analytics")
+
+
+# учесть все накопившиеся строки порциями и сдвинуть границы
+async def refresh_circulation_stats(
+    batch_size: int = settings.STATS_REFRESH_BATCH_SIZE,
+    now: Optional[datetime] = None,
+) -> dict:
+    result = {"issued": 0, "returned": 0}
+    for key, refresh in (
+        ("issued", crud_stats.refresh_issued_stats),
+        ("returned", crud_stats.refresh_returned_stats),
+    ):
+        while True:
+            count = await run_in_new_session(refresh, batch_size)
+            result[key] += count
+            if count < batch_size:
+                break
+    await run_in_new_session(crud_stats.advance_stats_pending, now or datetime.utcnow())
+    return result
+
+
+# полный пересчет всей истории
+async def rebuild_circulation_stats(
+    batch_size: int = settings.STATS_REFRESH_BATCH_SIZE,
+) -> dict:
+    await run_in_new_session(crud_stats.reset_circulation_stats, datetime.utcnow())
+    return await refresh_circulation_stats(batch_size)
+
+
+# периодический пересчет, запускается при старте приложения
+# ошибка одного прохода не останавливает следующие
+async def run_stats_refresher(interval: float, batch_size: int) -> None:
+    while True:
+        try:
+            counts = await refresh_circulation_stats(batch_size)
+            logger.info(
+                "circulation stats: %d issues, %d returns",
+                counts["issued"],
+                counts["returned"],
+            )
+        except Exception:
+            logger.exception("circulation stats refresh failed")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Пересчет статистики выдач для /stats/*."
+    )
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.STATS_REFRESH_BATCH_SIZE
+    )
+    args = parser.parse_args()
+    if args.rebuild:
+        counts = asyncio.run(rebuild_circulation_stats(args.batch_size))
+    else:
+        counts = asyncio.run(refresh_circulation_stats(args.batch_size))
+    print(json.dumps(counts, indent=2))
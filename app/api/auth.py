@@ -1,35 +1,75 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app import schemas as s
 from app.crud import crud_users as crud
-from app.database import get_db
+from app.database import get_db, run_db, run_db_and_release, run_in_new_session
 from app.models import User
-from app.auth import pwd_context, create_access_token
+from app.auth import check_hashing_capacity, create_user_token, get_current_user
+from app.auth import hash_password_async, verify_password_async
+from app.auth import hash_password, hashing_pool, needs_rehash
+from app.core.hashing import PoolBusyError
 
 router = APIRouter()
 
 
 # эндпоинт для регистрации библиотекаря
 @router.post("/register", response_model=s.UserResponse)
-def register_user(user: s.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.create_user(db=db, user=user)
+async def register_user(user: s.UserCreate, db: Session = Depends(get_db)):
+    # хеширование выполняется в отдельном пуле, чтобы не блокировать event loop
+    hashed_password = await hash_password_async(user.password)
+    db_user = await run_db(
+        db, crud.create_user, user=user, hashed_password=hashed_password
+    )
     if db_user is None:
         raise HTTPException(status_code=400, detail="User already exists")
     return s.UserResponse(id=db_user.id, email=db_user.email)
 
 
+# пересчёт хеша с текущей стоимостью bcrypt после успешного логина
+# выполняется в фоне, после отправки ответа
+# если пул хеширования занят, пропускаем: хеш пересчитается при следующем логине
+async def rehash_password(user_id: int, old_hash: str, password: str) -> None:
+    try:
+        new_hash = await hashing_pool.run(hash_password, password)
+    except PoolBusyError:
+        return
+    await run_in_new_session(crud.update_password_hash, user_id, old_hash, new_hash)
+
+
 # эндпоинт для логина
 @router.post("/login")
-def login(user: s.UserLogin, db: Session = Depends(get_db)) -> dict:
+async def login(
+    user: s.UserLogin,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+) -> dict:
+    # при перегрузке отвечаем 503 еще до запроса в БД
+    check_hashing_capacity()
+
     # ищем по email
-    db_user = db.query(User).filter(User.email == user.email).first()
+    # соединение с БД на время bcrypt не нужно, сразу возвращаем его в пул
+    db_user = await run_db_and_release(db, crud.get_user_by_email, user.email)
     if db_user is None:
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     # проверяем пароль
-    if not pwd_context.verify(user.password, db_user.hashed_password):
+    if not await verify_password_async(user.password, db_user.hashed_password):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
+    # хеш с устаревшей стоимостью пересчитываем в фоне
+    if needs_rehash(db_user.hashed_password):
+        background_tasks.add_task(
+            rehash_password, db_user.id, db_user.hashed_password, user.password
+        )
+
     # создаем и отправляем токен
-    access_token = create_access_token(data={"sub": db_user.email})
+    access_token = create_user_token(db_user)
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+# эндпоинт для выхода: отзывает все токены библиотекаря
+@router.post("/logout", status_code=204)
+async def logout(
+    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+) -> None:
+    await run_db(db, crud.revoke_tokens, current_user.id)
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+import io
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi import UploadFile
 from sqlalchemy.orm import Session
 from app import schemas as s
 from app.crud import crud_books as crud
-from app.database import get_db
+from app.database import get_db, run_db
 from app.auth import get_current_user
+from app.book_import import detect_format, import_books
+from app.http_cache import make_etag, not_modified
 from app.models import User
+from app.pagination import decode_id_cursor, decode_sort_cursor, set_next_cursor
 
 router = APIRouter(prefix="/books", tags=["books"])
 
@@ -22,56 +28,183 @@ def check_empty(books):
 
 # создать новую книгу
 @router.post("/", response_model=s.BookResponse, status_code=201)
-def create_book(
+async def create_book(
     book: s.BookCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    return crud.create_book(db, book)
+    return await run_db(db, crud.create_book, book)
+
+
+# массовый импорт книг из CSV (с заголовком) или NDJSON
+# существующие книги с тем же isbn обновляются
+# файл читается построчно и пишется пачками, целиком в память не загружается
+@router.post("/import", response_model=s.BookImportReport)
+async def import_books_file(
+    file: UploadFile,
+    format: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    fmt = detect_format(format, file.content_type, file.filename)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Unsupported import format")
+
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return await run_db(db, import_books, stream, fmt)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    finally:
+        stream.detach()
 
 
 # получить список книг
+# фильтры: author, year_from, year_to, available; сортировка: sort=title
+# или sort=-year (по убыванию), допустимые колонки - crud.BOOK_SORT_COLUMNS
+# курсор следующей страницы возвращается в заголовке X-Next-Cursor,
+# его нужно передать в параметре after вместе с теми же фильтрами и сортировкой
+# ETag строится по параметрам запроса и версиям книг страницы,
+# при совпадении с If-None-Match отдаётся 304 без сериализации
 @router.get("/", response_model=list[s.BookResponse])
-def read_books(
+async def read_books(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
+    author: Optional[str] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    available: Optional[bool] = None,
+    sort: str = "id",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    sort_column, _ = crud.parse_book_sort(sort)
+    if sort_column == "id":
+        last_id = decode_id_cursor(after)
+        cursor = None if last_id is None else (last_id,)
+
+        def sort_key(book):
+            return (book.id,)
+
+    else:
+        value_type = crud.BOOK_SORT_COLUMNS[sort_column].type.python_type
+        cursor = decode_sort_cursor(after, value_type)
+
+        def sort_key(book):
+            return getattr(book, sort_column), book.id
+
+    books = await run_db(
+        db,
+        crud.get_all_books,
+        skip=skip,
+        limit=limit,
+        after=cursor,
+        author=author,
+        year_from=year_from,
+        year_to=year_to,
+        available=available,
+        sort=sort,
+    )
+    check_empty(books)
+    set_next_cursor(response, books, limit, key=sort_key)
+    etag = make_etag(
+        "books",
+        skip,
+        limit,
+        after,
+        author,
+        year_from,
+        year_to,
+        available,
+        sort,
+        [(book.id, book.version) for book in books],
+    )
+    return not_modified(request, response, etag) or books
+
+
+# поиск книг по названию, автору и описанию с сортировкой по релевантности
+@router.get("/search", response_model=list[s.BookResponse])
+async def search_books(
+    q: str = Query(min_length=1),
+    limit: int = Query(20, ge=1, le=100),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    books = crud.get_all_books(db, skip=skip, limit=limit)
-    return check_empty(books)
+    return await run_db(db, crud.search_books, q, limit=limit)
+
+
+# наличие экземпляров для нескольких книг одним запросом:
+# /books/availability?ids=1&ids=2
+@router.get("/availability", response_model=list[s.BookAvailability])
+async def read_books_availability(
+    ids: list[int] = Query(min_length=1, max_length=200),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    return await run_db(db, crud.get_books_availability, ids)
+
+
+# книги с самой высокой средней оценкой
+# min_ratings отсекает книги с небольшим числом оценок
+@router.get("/top-rated", response_model=list[s.BookResponse])
+async def read_top_rated_books(
+    limit: int = Query(10, ge=1, le=100),
+    min_ratings: int = Query(1, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    return await run_db(db, crud.get_top_rated_books, limit, min_ratings)
 
 
 # получить книгу по ID
+# с ETag по версии книги, при совпадении с If-None-Match отдаётся 304
 @router.get("/{book_id}", response_model=s.BookResponse)
-def read_book(
+async def read_book(
     book_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    book = crud.get_book(db, book_id)
-    return check_empty(book)
+    book = check_empty(await run_db(db, crud.get_book_cached, book_id))
+    etag = make_etag("book", book.id, book.version)
+    return not_modified(request, response, etag) or book
 
 
 # обновить книгу
 @router.put("/{book_id}", response_model=s.BookResponse)
-def update_book(
+async def update_book(
     book_id: int,
     book_data: s.BookCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    updated_book = crud.update_book(db, book_id, book_data)
+    updated_book = await run_db(db, crud.update_book, book_id, book_data)
     return check_empty(updated_book)
 
 
 # удалить книгу
 # возвращает удаленную книгу
 @router.delete("/{book_id}", response_model=s.BookResponse)
-def delete_book(
+async def delete_book(
     book_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    deleted_book = crud.delete_book(db, book_id)
+    deleted_book = await run_db(db, crud.delete_book, book_id)
     return check_empty(deleted_book)
+
+
+# оценить книгу (1-5) от имени читателя, который ее брал и вернул
+# повторная оценка того же читателя заменяет прежнюю
+@router.put("/{book_id}/rating", response_model=s.BookResponse)
+async def rate_book(
+    book_id: int,
+    rating: s.BookRatingCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    return await run_db(db, crud.rate_book, book_id, rating.reader_id, rating.rating)
@@ -1,58 +1,161 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.borrow_export import EXPORT_FORMATS, aiter_export, iter_export
+from app.core.config import settings
+from app.database import get_db, run_db
 from app.dependencies import get_current_user
 from app import schemas as s
 from app.crud import crud_borrowed_books as crud
 from app.models import User
+from app.pagination import decode_borrow_cursor, set_next_cursor
 
 router = APIRouter(prefix="/borrow", tags=["borrow"])
 
 
 # выдача книги
 @router.post("/", response_model=s.BorrowedBookResponse, status_code=201)
-def borrow_book(
+async def borrow_book(
     book_id: int,
     reader_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    return crud.issue_book(
-        db=db, book_id=book_id, reader_id=reader_id, user_id=current_user.id
+    return await run_db(
+        db,
+        crud.issue_book,
+        book_id=book_id,
+        reader_id=reader_id,
+        user_id=current_user.id,
     )
 
 
 # возврат книги
 @router.put("/return", response_model=s.BorrowedBookResponse)
-def return_borrowed_book(
+async def return_borrowed_book(
     data: s.ReturnBookRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    return crud.return_book(
-        db=db, reader_id=data.reader_id, book_id=data.book_id, bbook_id=data.bbook_id
+    return await run_db(
+        db,
+        crud.return_book,
+        reader_id=data.reader_id,
+        book_id=data.book_id,
+        bbook_id=data.bbook_id,
+    )
+
+
+# пакетная выдача нескольких книг одному читателю
+# книги, которые нельзя выдать, не мешают выдаче остальных:
+# по каждой книге возвращается результат или причина отказа
+@router.post("/batch", response_model=list[s.BatchItemResult])
+async def borrow_books_batch(
+    data: s.BatchCheckoutRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    return await run_db(
+        db,
+        crud.issue_books,
+        reader_id=data.reader_id,
+        book_ids=data.book_ids,
+        user_id=current_user.id,
+    )
+
+
+# пакетный возврат нескольких выдач одного читателя
+@router.put("/return/batch", response_model=list[s.BatchItemResult])
+async def return_borrowed_books_batch(
+    data: s.BatchReturnRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    return await run_db(
+        db, crud.return_books, reader_id=data.reader_id, bbook_ids=data.bbook_ids
     )
 
 
 # получить все выданные книги
+# курсор следующей страницы возвращается в заголовке X-Next-Cursor,
+# его нужно передать в параметре after
 @router.get("/", response_model=list[s.BorrowedBookResponse])
-def get_all_borrowed_books(
+async def get_all_borrowed_books(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    return crud.get_all_borrowed_books(db, skip=skip, limit=limit)
+    borrowed_books = await run_db(
+        db,
+        crud.get_all_borrowed_books,
+        skip=skip,
+        limit=limit,
+        after=decode_borrow_cursor(after),
+    )
+    set_next_cursor(
+        response,
+        borrowed_books,
+        limit,
+        key=lambda bbook: (bbook.borrow_date, bbook.id),
+    )
+    return borrowed_books
+
+
+# потоковая выгрузка истории выдач в NDJSON или CSV
+# с полями книги и читателя, фильтр по дате выдачи [date_from, date_to)
+@router.get("/export")
+async def export_borrowed_books(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+):
+    export = aiter_export if settings.ASYNC_DB else iter_export
+    return StreamingResponse(
+        export(format, date_from, date_to),
+        media_type=EXPORT_FORMATS[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="borrowed_books.{format}"'
+        },
+    )
+
+
+# просроченные выдачи (не возвращены, срок прошел) по (due_date, id)
+# курсор следующей страницы возвращается в заголовке X-Next-Cursor
+@router.get("/overdue", response_model=list[s.BorrowedBookResponse])
+async def get_overdue_books(
+    response: Response,
+    limit: int = 100,
+    after: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    overdue = await run_db(
+        db,
+        crud.get_overdue_books,
+        datetime.utcnow(),
+        limit=limit,
+        after=decode_borrow_cursor(after),
+    )
+    set_next_cursor(
+        response, overdue, limit, key=lambda bbook: (bbook.due_date, bbook.id)
+    )
+    return overdue
 
 
 # получить выданную книгу по ID
 @router.get("/{borrowed_book_id}", response_model=s.BorrowedBookResponse)
-def get_borrowed_book(
+async def get_borrowed_book(
     borrowed_book_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    borrowed_book = crud.get_borrowed_book(db, borrowed_book_id)
+    borrowed_book = await run_db(db, crud.get_borrowed_book, borrowed_book_id)
     if not borrowed_book:
         raise HTTPException(status_code=404, detail="Borrowed book not found")
     return borrowed_book
@@ -60,14 +163,14 @@ def get_borrowed_book(
 
 # обновить выданную книгу
 @router.put("/{borrowed_book_id}", response_model=s.BorrowedBookResponse)
-def update_borrowed_book(
+async def update_borrowed_book(
     borrowed_book_id: int,
     borrowed_book_data: s.BorrowedBookUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    updated_borrowed_book = crud.update_borrowed_book(
-        db, borrowed_book_id, borrowed_book_data
+    updated_borrowed_book = await run_db(
+        db, crud.update_borrowed_book, borrowed_book_id, borrowed_book_data
     )
 
     if not updated_borrowed_book:
@@ -78,12 +181,12 @@ def update_borrowed_book(
 
 # удалить выданную книгу
 @router.delete("/{borrowed_book_id}", response_model=s.BorrowedBookResponse)
-def delete_borrowed_book(
+async def delete_borrowed_book(
     borrowed_book_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    borrowed_book = crud.get_borrowed_book(db, borrowed_book_id)
+    borrowed_book = await run_db(db, crud.get_borrowed_book, borrowed_book_id)
     if not borrowed_book:
         raise HTTPException(status_code=404, detail="Borrowed book not found")
 
@@ -91,7 +194,9 @@ def delete_borrowed_book(
     if borrowed_book.return_date is None:
         raise HTTPException(status_code=400, detail="Borrowed book not returned yet")
 
-    deleted_borrowed_book = crud.delete_borrowed_book(db, borrowed_book_id)
+    deleted_borrowed_book = await run_db(
+        db, crud.delete_borrowed_book, borrowed_book_id
+    )
     if not deleted_borrowed_book:
         raise HTTPException(status_code=500, detail="Failed to delete borrowed book")
     return deleted_borrowed_book
@@ -99,12 +204,12 @@ def delete_borrowed_book(
 
 # Получить все книги, выданные читателю в данный момент
 @router.get("/reader/{reader_id}/unreturn", response_model=list[s.BorrowedBookResponse])
-def get_borrowed_books_by_reader(
+async def get_borrowed_books_by_reader(
     reader_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    borrowed_books = crud.get_unreturned_books_by_reader(db, reader_id)
+    borrowed_books = await run_db(db, crud.get_unreturned_books_by_reader, reader_id)
     if not borrowed_books:
         raise HTTPException(
             status_code=404, detail="No borrowed books found for this reader"
@@ -114,12 +219,12 @@ def get_borrowed_books_by_reader(
 
 # Получить все книги, когда либо выданные читателю
 @router.get("/reader/{reader_id}/all", response_model=list[s.BorrowedBookResponse])
-def get_all_borrowed_books_by_reader(
+async def get_all_borrowed_books_by_reader(
     reader_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    borrowed_books = crud.get_all_borrowed_books_by_reader(db, reader_id)
+    borrowed_books = await run_db(db, crud.get_all_borrowed_books_by_reader, reader_id)
 
     if not borrowed_books:
         raise HTTPException(
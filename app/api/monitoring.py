@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from app import database
+from app.auth import get_current_user, hashing_pool, principal_cache
+from app.auth import verified_token_cache
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.pool import pool_stats
+from app.crud.crud_books import book_cache
+from app.crud.crud_readers import reader_cache
+from app.models import User
+
+router = APIRouter(tags=["monitoring"])
+
+
+# статистика кешей (попадания, промахи, вытеснения)
+@router.get("/cache-stats")
+async def cache_stats(current_user: User = Depends(get_current_user)) -> dict:
+    return {
+        "principals": principal_cache.stats(),
+        "verified_tokens": verified_token_cache.stats(),
+        "books": book_cache.stats(),
+        "readers": reader_cache.stats(),
+    }
+
+
+# состояние пулов соединений: занятые, overflow, время ожидания
+@router.get("/pool-stats")
+async def get_pool_stats(current_user: User = Depends(get_current_user)) -> dict:
+    stats = {"sync": pool_stats(database.engine.pool)}
+    if database.async_engine is not None:
+        stats["async"] = pool_stats(database.async_engine.pool)
+    return stats
+
+
+# пул хеширования паролей: задачи в работе, выполненные и отклоненные (503)
+@router.get("/hashing-stats")
+async def get_hashing_stats(current_user: User = Depends(get_current_user)) -> dict:
+    return hashing_pool.stats()
+
+
+# метрики запросов в текстовом формате Prometheus
+# без авторизации, как принято для Prometheus; доступно при METRICS_ENABLED
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
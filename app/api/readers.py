@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from app import schemas as s
 from app.crud import crud_readers as crud
-from app.database import get_db
+from app.database import get_db, run_db
+from app.http_cache import make_etag, not_modified
 from app.models import User
 from app.auth import get_current_user
+from app.pagination import decode_id_cursor, set_next_cursor
 
 router = APIRouter(prefix="/readers", tags=["readers"])
 
@@ -23,60 +26,79 @@ def check_empty(readers):
 
 
 # получить список читателей
+# at_limit=true: только читатели, которым больше нельзя выдавать книги
+# курсор следующей страницы возвращается в заголовке X-Next-Cursor,
+# его нужно передать в параметре after
 @router.get("/", response_model=list[s.ReaderResponse])
-def read_readers(
+async def read_readers(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
+    at_limit: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    readers = crud.get_all_readers(db, skip=skip, limit=limit)
+    readers = await run_db(
+        db,
+        crud.get_all_readers,
+        skip=skip,
+        limit=limit,
+        after=decode_id_cursor(after),
+        at_limit=at_limit,
+    )
+    set_next_cursor(response, readers, limit, key=lambda reader: (reader.id,))
     return check_empty(readers)
 
 
 # получить читателя по ID
+# с ETag по версии читателя, при совпадении с If-None-Match отдаётся 304
 @router.get("/{reader_id}", response_model=s.ReaderResponse)
-def get_reader(
+async def get_reader(
     reader_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    reader = crud.get_reader(db, reader_id)
-    return check_empty(reader)
+    reader = check_empty(await run_db(db, crud.get_reader_cached, reader_id))
+    etag = make_etag("reader", reader.id, reader.version)
+    return not_modified(request, response, etag) or reader
 
 
 # создать читателя
 @router.post("/", response_model=s.ReaderResponse, status_code=201)
-def create_reader(
+async def create_reader(
     reader: s.ReaderCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    db_reader = crud.create_reader(db, reader)
+    db_reader = await run_db(db, crud.create_reader, reader)
     if not db_reader:
         raise HTTPException(status_code=400, detail="Failed to create reader")
+    return db_reader
 
 
 # обновить читателя
 @router.put("/{reader_id}", response_model=s.ReaderResponse)
-def update_reader(
+async def update_reader(
     reader_id: int,
     reader_data: s.ReaderUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    updated_reader = crud.update_reader(db, reader_id, reader_data)
+    updated_reader = await run_db(db, crud.update_reader, reader_id, reader_data)
     return check_empty(updated_reader)
 
 
 # удалить читателя
 @router.delete("/{reader_id}", status_code=204)
-def delete_reader(
+async def delete_reader(
     reader_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    success = crud.delete_reader(db, reader_id)
+    success = await run_db(db, crud.delete_reader, reader_id)
     if not success:
         raise HTTPException(status_code=404, detail="Reader not found")
     return {"message": "Reader deleted successfully"}
@@ -0,0 +1,70 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app import schemas as s
+from app.crud import crud_stats as crud
+from app.database import get_db, run_db
+from app.dependencies import get_current_user
+from app.models import User
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+# самый длинный период для /stats/daily
+MAX_DAILY_RANGE = 366
+
+
+# вспомогательная функция
+# месяц в виде YYYY-MM, по умолчанию текущий
+def parse_month(month: Optional[str]) -> date:
+    if month is None:
+        return datetime.utcnow().date().replace(day=1)
+    try:
+        return datetime.strptime(month, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month, expected YYYY-MM")
+
+
+# эндпоинты читают только агрегаты, поэтому время ответа не зависит
+# от размера истории выдач; данные отстают на один-два пересчета
+
+
+# самые выдаваемые книги за месяц
+@router.get("/top-books", response_model=list[s.TopBook])
+async def top_books(
+    month: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    return await run_db(db, crud.get_top_books, parse_month(month), limit=limit)
+
+
+# читатели с наибольшим числом выдач за месяц
+@router.get("/top-readers", response_model=list[s.TopReader])
+async def top_readers(
+    month: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    return await run_db(db, crud.get_top_readers, parse_month(month), limit=limit)
+
+
+# выдачи и возвраты по дням, по умолчанию за последние 30 дней
+@router.get("/daily", response_model=list[s.DailyCirculation])
+async def daily_circulation(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+    if (date_to - date_from).days >= MAX_DAILY_RANGE:
+        raise HTTPException(
+            status_code=400, detail=f"Period is longer than {MAX_DAILY_RANGE} days"
+        )
+    return await run_db(db, crud.get_daily_circulation, date_from, date_to)
@@ -1,15 +1,22 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+import time
+from typing import Optional
+from app.core.cache import TTLCache
+from app.core.hashing import BoundedExecutor, PoolBusyError
 from app.core.config import settings
-from app.database import get_db
+from app.database import get_db, run_db
 from app.models import User
 
 # хеширование пароля
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
 
 
 def hash_password(password: str) -> str:
@@ -20,6 +27,51 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+# хеш с устаревшей схемой или стоимостью, отличной от BCRYPT_ROUNDS
+# (проверка только разбирает хеш, bcrypt не запускается)
+def needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+
+# bcrypt выполняется в отдельном ограниченном пуле,
+# чтобы всплеск логинов не занимал event loop и общий пул потоков
+hashing_pool = BoundedExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    name="password-hashing",
+)
+
+
+hashing_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many authentication requests, try again later",
+    headers={"Retry-After": "1"},
+)
+
+
+async def run_hashing(fn, *args):
+    try:
+        return await hashing_pool.run(fn, *args)
+    except PoolBusyError:
+        raise hashing_busy_exception
+
+
+# отклонить запрос сразу, если очередь хеширования уже заполнена
+def check_hashing_capacity() -> None:
+    try:
+        hashing_pool.check_capacity()
+    except PoolBusyError:
+        raise hashing_busy_exception
+
+
+async def hash_password_async(password: str) -> str:
+    return await run_hashing(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_hashing(verify_password, plain_password, hashed_password)
+
+
 # функция для генерации JWT токена
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=1)):
     to_encode = data.copy()
@@ -31,11 +83,110 @@ def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=1
     return encoded_jwt
 
 
+# токен библиотекаря: кроме email содержит id и версию токенов
+# по id пользователь берётся из кеша без поиска по email,
+# а увеличение token_version отзывает все ранее выданные токены
+def create_user_token(user: User) -> str:
+    return create_access_token(
+        data={"sub": user.email, "uid": user.id, "ver": user.token_version}
+    )
+
+
 # функция проверки токена
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# уже проверенные токены и их claims, чтобы не считать HMAC на каждый запрос
+# запись живёт не дольше срока действия токена
+verified_token_cache = TTLCache(
+    maxsize=settings.VERIFIED_TOKEN_CACHE_SIZE,
+    ttl=settings.VERIFIED_TOKEN_CACHE_TTL,
+)
+
+# кеш пользователей по id (или email для старых токенов без id),
+# чтобы не ходить в users на каждый запрос
+principal_cache = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+# число сбросов кеша пользователей: запрос кладёт пользователя в кеш,
+# только если пока он читал его из БД, сбросов не было
+principal_invalidations = 0
+
+
+# сбросить кеш для пользователя (удаление, смена пароля, отзыв токенов)
+def invalidate_principal(user_id: int) -> None:
+    global principal_invalidations
+    principal_invalidations += 1
+    principal_cache.discard_if(lambda user: user.id == user_id)
+
+
+# изменённые пользователи запоминаются при flush, а кеш сбрасывается после commit:
+# до commit параллельный запрос ещё читает старую строку и положил бы её
+# обратно в кеш, и отозванный токен продолжал бы работать
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _remember_changed_user(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is None:
+        invalidate_principal(target.id)
+    else:
+        session.info.setdefault("changed_users", set()).add(target.id)
+
 
-def get_current_user(
+# массовые update/delete по users не вызывают события маппера,
+# поэтому в этом случае после commit сбрасываем кеш целиком
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_bulk_users_change(orm_execute_state):
+    if (
+        orm_execute_state.is_update or orm_execute_state.is_delete
+    ) and orm_execute_state.bind_mapper is User.__mapper__:
+        orm_execute_state.session.info["clear_principals"] = True
+
+
+# после отката запомненные изменения не удаляются: лишний сброс кеша безвреден
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    global principal_invalidations
+    if session.info.pop("clear_principals", False):
+        principal_invalidations += 1
+        principal_cache.clear()
+    for user_id in session.info.pop("changed_users", ()):
+        invalidate_principal(user_id)
+
+
+# загрузка пользователя по id или email для кеша
+# объект отвязывается от сессии запроса, чтобы commit в ней
+# не сделал его атрибуты устаревшими для следующих запросов
+def load_principal(
+    db: Session, email: Optional[str] = None, user_id: Optional[int] = None
+) -> Optional[User]:
+    query = db.query(User)
+    if user_id is not None:
+        query = query.filter(User.id == user_id)
+    else:
+        query = query.filter(User.email == email)
+    user = query.first()
+    if user is not None:
+        db.expunge(user)
+    return user
+
+
+# claims токена: из кеша проверенных токенов или после проверки подписи
+def verify_token(token: str) -> Optional[dict]:
+    payload = verified_token_cache.get(token)
+    if payload is not None:
+        return payload
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+        )
+    except JWTError:
+        return None
+    verified_token_cache.set(token, payload, ttl=payload.get("exp", 0) - time.time())
+    return payload
+
+
+async def get_current_user(
     token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
 ):
     credentials_exception = HTTPException(
@@ -43,17 +194,33 @@ def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    payload = verify_token(token)
+    if payload is None:
+        raise credentials_exception
+    # срок действия проверяем и для токена из кеша
+    if payload.get("exp", 0) <= time.time():
+        raise credentials_exception
+
+    user_id: Optional[int] = payload.get("uid")
+    email: Optional[str] = payload.get("sub")
+    if user_id is None and email is None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
+    # токены без id (выданные до появления uid) ищутся по email
+    key = ("uid", user_id) if user_id is not None else ("sub", email)
+    user = principal_cache.get(key)
     if user is None:
+        invalidations = principal_invalidations
+        if user_id is not None:
+            user = await run_db(db, load_principal, user_id=user_id)
+        else:
+            user = await run_db(db, load_principal, email)
+        if user is None:
+            raise credentials_exception
+        if invalidations == principal_invalidations:
+            principal_cache.set(key, user)
+
+    # токен выдан до отзыва (у старых токенов версия 0)
+    if payload.get("ver", 0) != user.token_version:
         raise credentials_exception
     return user
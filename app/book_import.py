@@ -0,0 +1,119 @@
+import csv
+import json
+from typing import IO, Iterator, Optional
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from app import schemas as s
+from app.crud import crud_books
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# сколько строк валидируется и записывается за один INSERT
+IMPORT_CHUNK_SIZE = 1000
+
+# ограничение на размер отчёта об ошибках
+MAX_IMPORT_ERRORS = 1000
+
+
+# определяем формат по явному параметру, content-type или имени файла
+def detect_format(
+    fmt: Optional[str], content_type: Optional[str], filename: Optional[str]
+) -> Optional[str]:
+    if fmt:
+        return fmt if fmt in IMPORT_FORMATS else None
+    content_type = (content_type or "").lower()
+    filename = (filename or "").lower()
+    if "csv" in content_type or filename.endswith(".csv"):
+        return "csv"
+    if "ndjson" in content_type or filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
+
+
+# строки CSV с заголовком, пустые значения считаются отсутствующими
+# возвращает (номер строки, словарь или текст ошибки разбора)
+def iter_csv_rows(stream: IO[str]) -> Iterator[tuple[int, object]]:
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {k: v for k, v in row.items() if v not in ("", None)}
+
+
+# один json-объект на строку, пустые строки пропускаются
+def iter_ndjson_rows(stream: IO[str]) -> Iterator[tuple[int, object]]:
+    for line_num, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_num, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_num, "Row must be a JSON object"
+            continue
+        yield line_num, row
+
+
+# потоковый импорт: файл читается построчно, книги валидируются
+# и записываются пачками по chunk_size, каждая пачка - отдельная транзакция
+def import_books(
+    db: Session,
+    stream: IO[str],
+    fmt: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> dict:
+
+    rows = iter_csv_rows(stream) if fmt == "csv" else iter_ndjson_rows(stream)
+    report = {"total": 0, "imported": 0, "failed": 0, "errors": []}
+
+    def add_error(line_num, error):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_IMPORT_ERRORS:
+            report["errors"].append({"row": line_num, "error": error})
+
+    # пачка записывается одним upsert; в отчет попадают только записанные
+    # строки, остальные - в ошибки с причиной
+    def write_chunk(chunk):
+        # в таблице isbn хранится строкой
+        last_row = {}
+        for line_num, book in chunk:
+            if book.isbn is not None:
+                isbn = str(book.isbn)
+                if isbn in last_row:
+                    add_error(
+                        last_row[isbn],
+                        f"Duplicate isbn {isbn}: replaced by row {line_num}",
+                    )
+                last_row[isbn] = line_num
+        written = crud_books.upsert_books(db, [book for _, book in chunk])
+        report["imported"] += len(written)
+        for isbn in sorted(last_row.keys() - set(written), key=last_row.get):
+            add_error(
+                last_row[isbn],
+                "total_copies is less than the number of copies on loan",
+            )
+
+    chunk = []
+    for line_num, row in rows:
+        report["total"] += 1
+        if isinstance(row, str):
+            add_error(line_num, row)
+            continue
+        try:
+            chunk.append((line_num, s.BookCreate(**row)))
+        except ValidationError as e:
+            add_error(
+                line_num,
+                "; ".join(
+                    f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                    for err in e.errors()
+                ),
+            )
+            continue
+        if len(chunk) >= chunk_size:
+            write_chunk(chunk)
+            chunk = []
+
+    write_chunk(chunk)
+    report["errors_truncated"] = report["failed"] > len(report["errors"])
+    return report
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Iterator, Optional
+from app import database
+from app.crud import crud_borrowed_books
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+EXPORT_COLUMNS = [
+    "id",
+    "borrow_date",
+    "return_date",
+    "book_id",
+    "book_title",
+    "book_author",
+    "book_isbn",
+    "reader_id",
+    "reader_name",
+    "reader_email",
+    "user_id",
+]
+
+# сколько строк читается с серверного курсора и отдаётся клиенту за раз
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# форматирование пачки строк в один фрагмент ответа
+def render_rows(rows, fmt: str) -> str:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps(
+                {col: _value(row[col]) for col in EXPORT_COLUMNS}, ensure_ascii=False
+            )
+            + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([[_value(row[col]) for col in EXPORT_COLUMNS] for row in rows])
+    return buffer.getvalue()
+
+
+def render_header(fmt: str) -> str:
+    if fmt != "csv":
+        return ""
+    return render_rows([{col: col for col in EXPORT_COLUMNS}], fmt)
+
+
+# выгрузка идёт из собственной сессии: зависимость get_db закрывает сессию
+# раньше, чем StreamingResponse дочитает генератор
+# yield_per включает серверный курсор, поэтому память не растёт с размером выгрузки
+def iter_export(
+    fmt: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> Iterator[str]:
+
+    query = crud_borrowed_books.borrowed_books_export_query(date_from, date_to)
+    db = database.SessionLocal()
+    try:
+        yield render_header(fmt)
+        result = db.execute(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        for rows in result.mappings().partitions():
+            yield render_rows(rows, fmt)
+    finally:
+        db.close()
+
+
+# то же самое для асинхронного режима (AsyncSession.stream)
+async def aiter_export(
+    fmt: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> AsyncIterator[str]:
+
+    query = crud_borrowed_books.borrowed_books_export_query(date_from, date_to)
+    async with database.AsyncSessionLocal() as db:
+        yield render_header(fmt)
+        result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for rows in result.mappings().partitions():
+            yield render_rows(rows, fmt)
@@ -0,0 +1,217 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# метка сброшенной записи
+TOMBSTONE = "__tombstone__"
+
+logger = logging.getLogger("app.cache")
+
+
+# ограниченный по размеру LRU-кеш с временем жизни записей
+# потокобезопасный: синхронные эндпоинты выполняются в пуле потоков
+# при tombstone_ttl > 0 pop и clear оставляют метку: в течение tombstone_ttl
+# секунд set по этому ключу (после clear - по любому) игнорируется,
+# чтобы запрос, прочитавший данные до изменения, не положил их обратно
+class TTLCache:
+    def __init__(
+        self, maxsize: int = 1024, ttl: float = 60.0, tombstone_ttl: float = 0.0
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self._data: OrderedDict = OrderedDict()
+        self._cleared_until = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # возвращает значение или None, если записи нет или она устарела
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            if value is TOMBSTONE:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # ttl можно передать явно, чтобы запись не пережила, например, срок токена
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if now < self._cleared_until or (
+                entry is not None and entry[0] is TOMBSTONE and entry[1] > now
+            ):
+                return
+            self._put(key, value, now + ttl)
+
+    def _put(self, key: Hashable, value: Any, expires_at: float) -> None:
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            if self.tombstone_ttl > 0 and self.maxsize > 0:
+                self._put(key, TOMBSTONE, time.monotonic() + self.tombstone_ttl)
+            else:
+                self._data.pop(key, None)
+
+    # удалить все записи, значения которых подходят под условие
+    def discard_if(self, predicate: Callable[[Any], bool]) -> None:
+        with self._lock:
+            for key in [
+                k
+                for k, (v, _) in self._data.items()
+                if v is not TOMBSTONE and predicate(v)
+            ]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._cleared_until = time.monotonic() + self.tombstone_ttl
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+# кеш в Redis (или совместимом хранилище) для нескольких процессов приложения
+# значения хранятся в JSON, поэтому класть можно только простые данные
+# ошибки Redis при чтении и записи не ломают запрос: это просто промах
+# ошибки при сбросе тоже: сброс выполняется после commit, изменение уже
+# сохранено, а устаревшая запись живет не дольше ttl
+# метки сброса (tombstone_ttl) работают так же, как в TTLCache, но общие
+# для всех процессов: запись кладется с NX и не заменяет метку
+class RedisCache:
+    def __init__(
+        self, client, namespace: str, ttl: float = 60.0, tombstone_ttl: float = 0.0
+    ):
+        self.client = client
+        self.namespace = namespace
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception:
+            self.errors += 1
+            raw = None
+        if raw is None or raw == TOMBSTONE.encode():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        try:
+            if self.tombstone_ttl > 0:
+                if self.client.exists(self._key(TOMBSTONE)):
+                    return
+                self.client.set(
+                    self._key(key), json.dumps(value), ex=int(ttl) or 1, nx=True
+                )
+            else:
+                self.client.set(self._key(key), json.dumps(value), ex=int(ttl) or 1)
+        except Exception:
+            self.errors += 1
+
+    def pop(self, key: Hashable) -> None:
+        try:
+            if self.tombstone_ttl > 0:
+                self.client.set(self._key(key), TOMBSTONE, ex=self._tombstone_ex())
+            else:
+                self.client.delete(self._key(key))
+        except Exception:
+            self.errors += 1
+            logger.warning("failed to invalidate %s", self._key(key), exc_info=True)
+
+    # после clear метка ставится на весь namespace
+    def clear(self) -> None:
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.namespace}:*"))
+            if keys:
+                self.client.delete(*keys)
+            if self.tombstone_ttl > 0:
+                self.client.set(self._key(TOMBSTONE), 1, ex=self._tombstone_ex())
+        except Exception:
+            self.errors += 1
+            logger.warning("failed to clear %s", self.namespace, exc_info=True)
+
+    def _tombstone_ex(self) -> int:
+        return max(1, math.ceil(self.tombstone_ttl))
+
+    # вытеснения считает сам Redis (общие для всего сервера)
+    def stats(self) -> dict:
+        try:
+            evictions = self.client.info("stats").get("evicted_keys", 0)
+        except Exception:
+            evictions = None
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": evictions,
+            "errors": self.errors,
+        }
+
+
+# кеш выбранного типа: "memory" (по умолчанию) или "redis"
+# пакет redis нужен только для второго варианта
+def make_cache(
+    namespace: str,
+    backend: str = "memory",
+    maxsize: int = 1024,
+    ttl: float = 60.0,
+    redis_url: Optional[str] = None,
+    tombstone_ttl: float = 0.0,
+):
+    if backend == "memory":
+        return TTLCache(maxsize=maxsize, ttl=ttl, tombstone_ttl=tombstone_ttl)
+    if backend == "redis":
+        import redis
+
+        return RedisCache(
+            redis.Redis.from_url(redis_url),
+            namespace,
+            ttl=ttl,
+            tombstone_ttl=tombstone_ttl,
+        )
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -1,4 +1,5 @@
-from pydantic_settings import BaseSettings
+from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
@@ -7,8 +8,70 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
-    class Config:
-        env_file = ".env"
+    # асинхронный движок (asyncpg) вместо синхронного
+    # если ASYNC_DATABASE_URL не задан, он строится из DATABASE_URL
+    ASYNC_DB: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
+
+    # пул соединений
+    # DB_POOL_RECYCLE: пересоздавать соединения старше N секунд (-1 - никогда)
+    # DB_NULL_POOL: не держать пул в приложении, если используется PgBouncer
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_NULL_POOL: bool = False
+
+    # стоимость bcrypt (log2 числа раундов)
+    # хеши с другой стоимостью пересчитываются при следующем успешном логине
+    BCRYPT_ROUNDS: int = 12
+
+    # пул для bcrypt: число потоков и предел задач в работе и очереди,
+    # сверх которого /login и /register отвечают 503
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
+
+    # Cache-Control для GET книг и читателей: сколько секунд клиент может
+    # не перепроверять ответ (0 - всегда перепроверять по ETag)
+    HTTP_CACHE_MAX_AGE: int = 0
+
+    # срок выдачи книги
+    LOAN_PERIOD_DAYS: int = 14
+    # фоновая проверка просроченных выдач: период в секундах (0 - выключена)
+    # и сколько выдач обрабатывается в одной короткой транзакции
+    OVERDUE_SCAN_INTERVAL: int = 0
+    OVERDUE_SCAN_BATCH_SIZE: int = 500
+
+    # пересчет статистики выдач (/stats/*): период в секундах (0 - выключен)
+    # и сколько строк borrowed_books учитывается в одной транзакции
+    STATS_REFRESH_INTERVAL: int = 0
+    STATS_REFRESH_BATCH_SIZE: int = 5000
+
+    # метрики запросов на /metrics и лог медленных SQL-запросов
+    # по умолчанию выключены: middleware и события движка не подключаются
+    METRICS_ENABLED: bool = False
+    SLOW_QUERY_MS: float = 500
+
+    # кеш книг и читателей для чтения по id
+    # CACHE_BACKEND: memory (в процессе) или redis (нужен пакет redis)
+    CACHE_BACKEND: str = "memory"
+    CACHE_REDIS_URL: Optional[str] = None
+    CATALOG_CACHE_SIZE: int = 10000
+    CATALOG_CACHE_TTL: int = 300  # секунды
+    # сколько секунд после сброса записи кеш не принимает ее заново:
+    # запрос, прочитавший строку до изменения, не вернет в кеш старые данные
+    CATALOG_CACHE_TOMBSTONE_TTL: int = 5
+
+    # кеш пользователей по токену в get_current_user
+    PRINCIPAL_CACHE_SIZE: int = 1024
+    PRINCIPAL_CACHE_TTL: int = 60  # секунды
+
+    # кеш уже проверенных JWT (подпись не проверяется повторно)
+    VERIFIED_TOKEN_CACHE_SIZE: int = 4096
+    VERIFIED_TOKEN_CACHE_TTL: int = 3600  # не дольше срока действия токена
+
+    model_config = SettingsConfigDict(env_file=".env")
 
 
 settings = Settings()
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class PoolBusyError(Exception):
+    pass
+
+
+# отдельный ограниченный пул потоков для CPU-тяжёлых задач (bcrypt)
+# bcrypt отпускает GIL, поэтому потоков достаточно
+# max_pending ограничивает число задач в работе и в очереди:
+# при превышении задача сразу отклоняется, а не копится в очереди
+class BoundedExecutor:
+    def __init__(self, max_workers: int, max_pending: int, name: str):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    # быстрая проверка до начала работы с запросом (например, до похода в БД)
+    def check_capacity(self) -> None:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolBusyError()
+
+    async def run(self, fn: Callable, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolBusyError()
+            self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
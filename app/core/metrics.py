@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+
+logger = logging.getLogger("app.sql")
+
+# границы корзин гистограмм (как у клиентов Prometheus по умолчанию)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# слишком длинные параметры запроса в логе обрезаются
+MAX_LOGGED_PARAMS = 1000
+
+
+# гистограмма в формате Prometheus: накопительные корзины, сумма и количество
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+# метрики запросов по маршрутам
+# маршрут - шаблон пути (/books/{book_id}), а не сам путь,
+# чтобы число рядов не росло с числом id
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: dict[tuple, Histogram] = {}
+        self.sql_statements: dict[tuple, Histogram] = {}
+        self.sql_time: dict[tuple, Histogram] = {}
+        self.requests: dict[tuple, int] = {}
+        self.slow_queries = 0
+
+    def observe_request(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        duration: float,
+        statements: int,
+        sql_time: float,
+    ) -> None:
+        key = (method, route)
+        with self._lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.sql_statements[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.sql_time[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(duration)
+            self.sql_statements[key].observe(statements)
+            self.sql_time[key].observe(sql_time)
+            status_key = (method, route, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+    def observe_slow_query(self) -> None:
+        with self._lock:
+            self.slow_queries += 1
+
+    # текстовый формат Prometheus (text/plain; version=0.0.4)
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route, status), count in sorted(self.requests.items()):
+                labels = f'method="{method}",route="{route}",status="{status}"'
+                lines.append(f"http_requests_total{{{labels}}} {count}")
+            for name, histograms in (
+                ("http_request_duration_seconds", self.latency),
+                ("http_request_sql_statements", self.sql_statements),
+                ("http_request_sql_duration_seconds", self.sql_time),
+            ):
+                lines.append(f"# TYPE {name} histogram")
+                for (method, route), histogram in sorted(histograms.items()):
+                    labels = f'method="{method}",route="{route}"'
+                    lines.extend(histogram.render(name, labels))
+            lines.append("# TYPE db_slow_queries_total counter")
+            lines.append(f"db_slow_queries_total {self.slow_queries}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# счётчики SQL текущего запроса
+# contextvar копируется в пул потоков (run_in_threadpool) и в run_sync,
+# а сам объект общий, поэтому запросы из CRUD попадают в счётчик запроса
+class RequestStats:
+    __slots__ = ("statements", "sql_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_time = 0.0
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+# ASGI-middleware: время ответа, число SQL-запросов и время в БД по маршрутам
+# подключается только при METRICS_ENABLED, иначе накладных расходов нет
+class MetricsMiddleware:
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            request_stats.reset(token)
+            route = scope.get("route")
+            self.registry.observe_request(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                status,
+                duration,
+                stats.statements,
+                stats.sql_time,
+            )
+
+
+# подписка на события движка: время и число SQL-запросов текущего запроса,
+# медленные запросы (дольше slow_query_ms) пишутся в лог вместе с параметрами
+# для AsyncEngine подписывается его sync_engine
+class EngineInstrumentation:
+    def __init__(self, slow_query_ms: float, registry: MetricsRegistry = registry):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.registry = registry
+
+    def attach(self, engine) -> None:
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def detach(self, engine) -> None:
+        event.remove(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    # время начала хранится в контексте выполнения, а не в стеке на соединении:
+    # у запроса, завершившегося ошибкой, after_cursor_execute не вызывается,
+    # и его начало не должно достаться следующему запросу
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, *args
+    ):
+        if context is not None:
+            context._metrics_query_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, *args):
+        started = getattr(context, "_metrics_query_start", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        stats = request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.sql_time += elapsed
+        if elapsed >= self.slow_query_seconds:
+            self.registry.observe_slow_query()
+            logger.warning(
+                "slow query %.1f ms: %s; parameters: %.*r",
+                elapsed * 1000,
+                statement,
+                MAX_LOGGED_PARAMS,
+                parameters,
+            )
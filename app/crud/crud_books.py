@@ -1,20 +1,260 @@
+import re
+from sqlalchemy import and_, event, func, literal, literal_column, or_, tuple_
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app import models as m, schemas as s
+from app.core.cache import make_cache
+from app.core.config import settings
+from fastapi import HTTPException
 from typing import Optional
 
+# диалекты, поддерживающие INSERT ... ON CONFLICT
+UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+# кеш книг по id для GET /books/{id}
+# хранятся значения колонок, а не ORM-объекты, чтобы кеш мог жить в Redis
+book_cache = make_cache(
+    "book",
+    backend=settings.CACHE_BACKEND,
+    maxsize=settings.CATALOG_CACHE_SIZE,
+    ttl=settings.CATALOG_CACHE_TTL,
+    redis_url=settings.CACHE_REDIS_URL,
+    tombstone_ttl=settings.CATALOG_CACHE_TOMBSTONE_TTL,
+)
+
+
+# массовое удаление книг идёт мимо CRUD, поэтому сбрасываем кеш целиком
+# (массовые UPDATE в выдаче и возврате сбрасывают свою запись сами)
+@event.listens_for(Session, "do_orm_execute")
+def _clear_book_cache_on_bulk_delete(orm_execute_state):
+    if (
+        orm_execute_state.is_delete
+        and orm_execute_state.bind_mapper is m.Book.__mapper__
+    ):
+        book_cache.clear()
+
+
+def book_row(book: m.Book) -> dict:
+    return {
+        column.key: getattr(book, column.key) for column in m.Book.__table__.columns
+    }
+
 
 # создание книги
 def create_book(db: Session, book: s.BookCreate) -> m.Book:
-    db_book = m.Book(**book.dict())
+    db_book = m.Book(**book.model_dump())
     db.add(db_book)
     db.commit()
     db.refresh(db_book)
+    book_cache.pop(db_book.id)
     return db_book
 
 
-# получение всех книг
-def get_all_books(db: Session, skip: int = 0, limit: int = 100) -> list[m.Book]:
-    return db.query(m.Book).offset(skip).limit(limit).all()
+# массовая вставка книг одним INSERT ... ON CONFLICT (isbn) DO UPDATE
+# книги с уже существующим isbn обновляются, без isbn - всегда добавляются
+# у обновляемой книги available_copies сдвигается на изменение total_copies;
+# книга, у которой на руках больше экземпляров, чем новое total_copies, не меняется
+# возвращает isbn записанных строк (None - для добавленных книг без isbn)
+def upsert_books(db: Session, books: list[s.BookCreate]) -> list[Optional[str]]:
+    if not books:
+        return []
+
+    # в одном INSERT один isbn не может встречаться дважды, оставляем последний
+    rows, by_isbn = [], {}
+    for book in books:
+        row = book.model_dump()
+        row["available_copies"] = row["total_copies"]
+        if row["isbn"] is None:
+            rows.append(row)
+        else:
+            by_isbn[row["isbn"]] = row
+    rows.extend(by_isbn.values())
+
+    dialect = UPSERT_DIALECTS[db.get_bind().dialect.name]
+    stmt = dialect.insert(m.Book).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[m.Book.isbn],
+        set_={
+            **{
+                column: stmt.excluded[column]
+                for column in s.BookCreate.model_fields
+                if column != "isbn"
+            },
+            "available_copies": m.Book.available_copies
+            + stmt.excluded.total_copies
+            - m.Book.total_copies,
+            "version": m.Book.version + 1,
+        },
+        where=m.Book.total_copies - m.Book.available_copies
+        <= stmt.excluded.total_copies,
+    )
+    # строки, пропущенные условием WHERE, в RETURNING не попадают
+    written = list(db.execute(stmt.returning(m.Book.isbn)).scalars())
+    db.commit()
+    # id обновленных книг неизвестны, поэтому сбрасываем кеш целиком
+    book_cache.clear()
+    return written
+
+
+# колонки, по которым можно сортировать каталог
+# для каждой есть индекс с id в конце (ix_books_*_id и первичный ключ)
+BOOK_SORT_COLUMNS = {
+    "id": m.Book.id,
+    "title": m.Book.title,
+    "author": m.Book.author,
+    "year": m.Book.year,
+}
+
+
+# сортировка в виде "title" или "-title" (по убыванию)
+def parse_book_sort(sort: str) -> tuple[str, bool]:
+    name = sort.removeprefix("-")
+    if name not in BOOK_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort column: {name}")
+    return name, sort.startswith("-")
+
+
+# keyset-пагинация по (value, last_id) в порядке сортировки, разбитая на фазы:
+# строки со значением колонки и строки с NULL (по возрастанию NULL идут после
+# всех значений, по убыванию - перед ними, так же индекс читается в PostgreSQL)
+# каждая фаза - отдельный диапазон по индексу (колонка, id): сравнение строк
+# (колонка, id) > (value, last_id) или колонка IS NULL AND id > last_id,
+# без OR, из-за которого индекс читался бы целиком с начала
+# возвращает пары (условие, порядок); строки с NULL упорядочены только по id
+def _sort_phases(column, value, last_id: int, descending: bool) -> list:
+    if descending:
+        by_value = (column.desc(), m.Book.id.desc())
+        nulls = (and_(column.is_(None), m.Book.id < last_id), (m.Book.id.desc(),))
+        if value is None:
+            return [nulls, (column.is_not(None), by_value)]
+        return [(tuple_(column, m.Book.id) < tuple_(value, last_id), by_value)]
+    nulls = (and_(column.is_(None), m.Book.id > last_id), (m.Book.id,))
+    if value is None:
+        return [nulls]
+    by_value = (column, m.Book.id)
+    return [(tuple_(column, m.Book.id) > tuple_(value, last_id), by_value), nulls]
+
+
+# получение всех книг с фильтрами и сортировкой
+# фильтры объединяются через AND: автор, диапазон лет, наличие на полке
+# если передан after (ключ сортировки последней книги предыдущей страницы:
+# (id,) или (значение, id)), используется keyset-пагинация вместо offset
+def get_all_books(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[tuple] = None,
+    author: Optional[str] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    available: Optional[bool] = None,
+    sort: str = "id",
+) -> list[m.Book]:
+    name, descending = parse_book_sort(sort)
+
+    query = db.query(m.Book)
+    if author is not None:
+        query = query.filter(m.Book.author == author)
+    if year_from is not None:
+        query = query.filter(m.Book.year >= year_from)
+    if year_to is not None:
+        query = query.filter(m.Book.year <= year_to)
+    # литерал, а не параметр: иначе частичный индекс ix_books_available_id
+    # не подходит к запросу
+    if available is True:
+        query = query.filter(m.Book.available_copies > literal_column("0"))
+    elif available is False:
+        query = query.filter(m.Book.available_copies == literal_column("0"))
+
+    if name == "id":
+        if descending:
+            query = query.order_by(m.Book.id.desc())
+        else:
+            query = query.order_by(m.Book.id)
+        if after is not None:
+            (last_id,) = after
+            query = query.filter(
+                m.Book.id < last_id if descending else m.Book.id > last_id
+            )
+    else:
+        column = BOOK_SORT_COLUMNS[name]
+        if after is not None:
+            # фазы читаются по очереди, пока страница не заполнится
+            value, last_id = after
+            books = []
+            for phase, order in _sort_phases(column, value, last_id, descending):
+                books += (
+                    query.filter(phase).order_by(*order).limit(limit - len(books)).all()
+                )
+                if len(books) >= limit:
+                    break
+            return books
+        if descending:
+            query = query.order_by(column.desc().nulls_first(), m.Book.id.desc())
+        else:
+            query = query.order_by(column.asc().nulls_last(), m.Book.id)
+
+    if after is not None:
+        return query.limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+
+
+# документ для полнотекстового поиска
+# выражение совпадает с индексом ix_books_search (миграция 352d7bdf27d2)
+SEARCH_VECTOR = literal_column(
+    "to_tsvector('simple', coalesce(books.title, '') || ' ' "
+    "|| coalesce(books.author, '') || ' ' || coalesce(books.description, ''))"
+)
+
+
+# поиск книг по названию, автору и описанию
+# в PostgreSQL: полнотекстовый поиск (последнее слово - как префикс)
+# плюс триграммы для опечаток, результат сортируется по релевантности
+# в остальных СУБД: простой поиск подстроки
+def search_books(db: Session, q: str, limit: int = 20) -> list[m.Book]:
+    words = re.findall(r"\w+", q)
+    if not words:
+        return []
+
+    if db.get_bind().dialect.name != "postgresql":
+        pattern = f"%{q.strip()}%"
+        return (
+            db.query(m.Book)
+            .filter(
+                or_(
+                    m.Book.title.ilike(pattern),
+                    m.Book.author.ilike(pattern),
+                    m.Book.description.ilike(pattern),
+                )
+            )
+            .order_by(m.Book.title, m.Book.id)
+            .limit(limit)
+            .all()
+        )
+
+    tsquery = func.to_tsquery(
+        literal_column("'simple'"), " & ".join(words[:-1] + [words[-1] + ":*"])
+    )
+    query_text = literal(" ".join(words))
+    rank = func.ts_rank(SEARCH_VECTOR, tsquery) + func.greatest(
+        func.word_similarity(query_text, m.Book.title),
+        func.word_similarity(query_text, m.Book.author),
+    )
+    return (
+        db.query(m.Book)
+        .filter(
+            or_(
+                SEARCH_VECTOR.op("@@")(tsquery),
+                query_text.op("<%")(m.Book.title),
+                query_text.op("<%")(m.Book.author),
+            )
+        )
+        .order_by(rank.desc(), m.Book.id)
+        .limit(limit)
+        .all()
+    )
 
 
 # получение книги по ID
@@ -22,14 +262,62 @@ def get_book(db: Session, book_id: int) -> Optional[m.Book]:
     return db.query(m.Book).filter(m.Book.id == book_id).first()
 
 
+# получение книги по ID через кеш, только для отдачи клиенту
+# выдача и возврат книги кешем не пользуются, чтобы не увидеть устаревшее наличие
+# из кеша возвращается объект, не привязанный к сессии
+def get_book_cached(db: Session, book_id: int) -> Optional[m.Book]:
+    row = book_cache.get(book_id)
+    if row is not None:
+        return m.Book(**row)
+    db_book = get_book(db, book_id)
+    if db_book is not None:
+        book_cache.set(book_id, book_row(db_book))
+    return db_book
+
+
+# наличие экземпляров для списка книг одним запросом
+# несуществующие id в ответ не попадают
+def get_books_availability(db: Session, book_ids: list[int]) -> list:
+    return (
+        db.query(m.Book.id, m.Book.total_copies, m.Book.available_copies)
+        .filter(m.Book.id.in_(book_ids))
+        .order_by(m.Book.id)
+        .all()
+    )
+
+
 # обновление книги
+# total_copies меняет и available_copies на ту же разницу на стороне БД,
+# поэтому выданные в это время экземпляры не теряются
 def update_book(db: Session, book_id: int, book_data: s.BookCreate) -> Optional[m.Book]:
     db_book = get_book(db, book_id)
     if not db_book:
         return None
-    for key, value in book_data.dict().items():
+    data = book_data.model_dump()
+    total_copies = data.pop("total_copies")
+    for key, value in data.items():
         setattr(db_book, key, value)
-    db.commit()
+    db_book.available_copies = (
+        m.Book.available_copies + total_copies - m.Book.total_copies
+    )
+    db_book.total_copies = total_copies
+    db_book.version = m.Book.version + 1
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        # нарушенное ограничение различаем по тексту ошибки драйвера
+        if "ck_books_available_copies" in str(e.orig):
+            raise HTTPException(
+                status_code=400,
+                detail="total_copies is less than the number of copies on loan",
+            )
+        if "isbn" in str(e.orig):
+            raise HTTPException(
+                status_code=400, detail="Book with this isbn already exists"
+            )
+        raise
+    book_cache.pop(book_id)
     db.refresh(db_book)
     return db_book
 
@@ -41,4 +329,79 @@ def delete_book(db: Session, book_id: int) -> Optional[m.Book]:
         return None
     db.delete(db_book)
     db.commit()
+    book_cache.pop(book_id)
     return db_book
+
+
+# оценка книги читателем: оценить можно только книгу, которую читатель
+# брал и уже вернул; повторная оценка заменяет прежнюю
+# rating_sum и rating_count книги меняются в той же транзакции, что и оценка,
+# прибавлением на стороне БД, поэтому параллельные оценки не теряются
+def rate_book(db: Session, book_id: int, reader_id: int, rating: int) -> m.Book:
+    db_book = get_book(db, book_id)
+    if not db_book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    returned = (
+        db.query(m.BorrowedBook.id)
+        .filter(
+            m.BorrowedBook.book_id == book_id,
+            m.BorrowedBook.reader_id == reader_id,
+            m.BorrowedBook.return_date.is_not(None),
+        )
+        .first()
+    )
+    if returned is None:
+        raise HTTPException(status_code=400, detail="Reader has not returned this book")
+
+    dialect = UPSERT_DIALECTS[db.get_bind().dialect.name]
+    inserted = db.execute(
+        dialect.insert(m.BookRating)
+        .values(book_id=book_id, reader_id=reader_id, rating=rating)
+        .on_conflict_do_nothing(index_elements=["book_id", "reader_id"])
+        .returning(m.BookRating.id)
+    ).scalar()
+    if inserted is not None:
+        sum_delta, count_delta = rating, 1
+    else:
+        # оценка уже есть: строка блокируется, чтобы параллельная повторная
+        # оценка того же читателя сдвинула сумму от уже новой оценки
+        db_rating = (
+            db.query(m.BookRating)
+            .filter(
+                m.BookRating.book_id == book_id, m.BookRating.reader_id == reader_id
+            )
+            .with_for_update()
+            .one()
+        )
+        sum_delta, count_delta = rating - db_rating.rating, 0
+        db_rating.rating = rating
+        db_rating.rated_at = func.now()
+
+    db.execute(
+        update(m.Book)
+        .where(m.Book.id == book_id)
+        .values(
+            rating_sum=m.Book.rating_sum + sum_delta,
+            rating_count=m.Book.rating_count + count_delta,
+            version=m.Book.version + 1,
+        )
+    )
+    db.commit()
+    book_cache.pop(book_id)
+    db.refresh(db_book)
+    return db_book
+
+
+# книги с самой высокой средней оценкой (при равенстве - более новые)
+# порядок совпадает с индексом ix_books_rating_average, поэтому первые limit
+# книг читаются из индекса без сортировки всего каталога
+def get_top_rated_books(
+    db: Session, limit: int = 10, min_ratings: int = 1
+) -> list[m.Book]:
+    return (
+        db.query(m.Book)
+        .filter(m.Book.rating_count >= min_ratings)
+        .order_by(m.RATING_AVERAGE.desc(), m.Book.id.desc())
+        .limit(limit)
+        .all()
+    )
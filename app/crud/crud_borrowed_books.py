@@ -1,55 +1,269 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, case, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
 from app import models as m, schemas as s
-from datetime import datetime
-from app.crud.crud_books import get_book
+from datetime import datetime, timedelta
+from app.core.config import settings
+from app.crud.crud_books import book_cache, get_book
 from app.crud.crud_readers import get_reader
 from fastapi import HTTPException
 from typing import Optional
 
 
+# срок возврата книги, выданной в borrow_date
+def loan_due_date(borrow_date: datetime) -> datetime:
+    return borrow_date + timedelta(days=settings.LOAN_PERIOD_DAYS)
+
+
+# счётчик открытых выдач читателя (readers.active_loans)
+# меняется на стороне БД в той же транзакции, что и сама выдача или возврат
+# превышение лимита или уход в минус запрещает CHECK-ограничение
+def change_active_loans(db: Session, reader_id: int, delta: int) -> None:
+    try:
+        db.execute(
+            update(m.Reader)
+            .where(m.Reader.id == reader_id)
+            .values(active_loans=m.Reader.active_loans + delta)
+        )
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=400, detail="Reader has already borrowed 3 books"
+        )
+
+
+# связанные книга, читатель и библиотекарь нужны для BorrowedBookResponse,
+# поэтому подгружаем их в том же запросе, а не отдельным SELECT на каждую запись
+LOAD_RELATIONS = (
+    joinedload(m.BorrowedBook.book),
+    joinedload(m.BorrowedBook.reader),
+    joinedload(m.BorrowedBook.user),
+)
+
+
+# перенос экземпляра между полкой и открытыми выдачами при изменении выдачи
+# в обход выдачи и возврата: release - книга, чей экземпляр вернулся на полку,
+# take - книга, с полки которой экземпляр ушел (None - нет такой книги)
+# available_copies и version меняются на стороне БД в текущей транзакции
+# возвращает id измененных книг, их запись в кеше нужно сбросить после commit
+def _move_copies(db: Session, release: Optional[int], take: Optional[int]) -> list[int]:
+    counts = {}
+    if release is not None:
+        counts[release] = counts.get(release, 0) + 1
+    if take is not None:
+        counts[take] = counts.get(take, 0) - 1
+    counts = {book_id: n for book_id, n in counts.items() if n}
+    changed = _change_copies(db, counts)
+    if take in counts and take not in changed:
+        db.rollback()
+        if not get_book(db, take):
+            raise HTTPException(status_code=404, detail="Book not found")
+        raise HTTPException(status_code=400, detail="No available copies")
+    return list(counts)
+
+
 # создание выданной книги
+# открытая выдача забирает экземпляр с полки, как и обычная выдача
 def create_borrowed_book(
     db: Session,
     borrowed_book: s.BorrowedBookCreate,
 ) -> m.BorrowedBook:
 
-    db_borrowed_book = m.BorrowedBook(**borrowed_book.dict())
+    db_borrowed_book = m.BorrowedBook(**borrowed_book.model_dump())
+    if db_borrowed_book.due_date is None:
+        db_borrowed_book.due_date = loan_due_date(
+            borrowed_book.borrow_date or datetime.utcnow()
+        )
+    changed = []
+    if db_borrowed_book.return_date is None:
+        changed = _move_copies(db, None, db_borrowed_book.book_id)
+        change_active_loans(db, db_borrowed_book.reader_id, 1)
     db.add(db_borrowed_book)
     db.commit()
+    for book_id in changed:
+        book_cache.pop(book_id)
     db.refresh(db_borrowed_book)
     return db_borrowed_book
 
 
 # получение всех выданных книг
+# если передан after (borrow_date и id последней записи предыдущей страницы),
+# используется keyset-пагинация вместо offset
 def get_all_borrowed_books(
     db: Session,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[tuple[datetime, int]] = None,
 ) -> list[m.BorrowedBook]:
 
-    return db.query(m.BorrowedBook).offset(skip).limit(limit).all()
+    query = (
+        db.query(m.BorrowedBook)
+        .options(*LOAD_RELATIONS)
+        .order_by(m.BorrowedBook.borrow_date, m.BorrowedBook.id)
+    )
+    if after is not None:
+        return (
+            query.filter(
+                tuple_(m.BorrowedBook.borrow_date, m.BorrowedBook.id) > tuple_(*after)
+            )
+            .limit(limit)
+            .all()
+        )
+    return query.offset(skip).limit(limit).all()
+
+
+# открытые выдачи со сроком возврата раньше now, по (due_date, id)
+# читаются по частичному индексу ix_borrowed_books_open_due_date
+def _overdue_query(db: Session, now: datetime, after: Optional[tuple[datetime, int]]):
+    query = db.query(m.BorrowedBook).filter(
+        m.BorrowedBook.return_date.is_(None), m.BorrowedBook.due_date < now
+    )
+    if after is not None:
+        query = query.filter(
+            tuple_(m.BorrowedBook.due_date, m.BorrowedBook.id) > tuple_(*after)
+        )
+    return query.order_by(m.BorrowedBook.due_date, m.BorrowedBook.id)
+
+
+# просроченные выдачи с keyset-пагинацией по (due_date, id)
+def get_overdue_books(
+    db: Session,
+    now: datetime,
+    limit: int = 100,
+    after: Optional[tuple[datetime, int]] = None,
+) -> list[m.BorrowedBook]:
+    return _overdue_query(db, now, after).options(*LOAD_RELATIONS).limit(limit).all()
+
+
+# одна порция фоновой проверки: отмечает до limit просроченных выдач,
+# которые еще не отмечены, и сразу фиксирует транзакцию
+# возвращает число отмеченных выдач и ключ, с которого продолжать,
+# или None, если просроченных выдач дальше нет
+def flag_overdue_books(
+    db: Session,
+    now: datetime,
+    limit: int,
+    after: Optional[tuple[datetime, int]] = None,
+) -> tuple[int, Optional[tuple[datetime, int]]]:
+    rows = (
+        _overdue_query(db, now, after)
+        .filter(m.BorrowedBook.overdue_flagged_at.is_(None))
+        .with_entities(m.BorrowedBook.due_date, m.BorrowedBook.id)
+        .limit(limit)
+        .all()
+    )
+    if not rows:
+        db.commit()
+        return 0, None
+
+    # выдачу могли вернуть, пока шла выборка, поэтому условия повторяются
+    flagged = db.execute(
+        update(m.BorrowedBook)
+        .where(
+            m.BorrowedBook.id.in_([row.id for row in rows]),
+            m.BorrowedBook.return_date.is_(None),
+            m.BorrowedBook.overdue_flagged_at.is_(None),
+        )
+        .values(overdue_flagged_at=now)
+    ).rowcount
+    db.commit()
+    last = tuple(rows[-1])
+    return flagged, last if len(rows) == limit else None
+
+
+# плоская выборка истории выдач с полями книги и читателя для выгрузки
+# date_from включительно, date_to не включительно (по borrow_date)
+def borrowed_books_export_query(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> Select:
+
+    query = (
+        select(
+            m.BorrowedBook.id,
+            m.BorrowedBook.borrow_date,
+            m.BorrowedBook.return_date,
+            m.BorrowedBook.book_id,
+            m.Book.title.label("book_title"),
+            m.Book.author.label("book_author"),
+            m.Book.isbn.label("book_isbn"),
+            m.BorrowedBook.reader_id,
+            m.Reader.name.label("reader_name"),
+            m.Reader.email.label("reader_email"),
+            m.BorrowedBook.user_id,
+        )
+        .join(m.Book, m.Book.id == m.BorrowedBook.book_id)
+        .join(m.Reader, m.Reader.id == m.BorrowedBook.reader_id)
+        .order_by(m.BorrowedBook.borrow_date, m.BorrowedBook.id)
+    )
+    if date_from is not None:
+        query = query.where(m.BorrowedBook.borrow_date >= date_from)
+    if date_to is not None:
+        query = query.where(m.BorrowedBook.borrow_date < date_to)
+    return query
+
+
+# получение выданных книг по списку ID одним запросом
+def get_borrowed_books_by_ids(
+    db: Session, bbook_ids: list[int]
+) -> dict[int, m.BorrowedBook]:
+    bbooks = (
+        db.query(m.BorrowedBook)
+        .options(*LOAD_RELATIONS)
+        .filter(m.BorrowedBook.id.in_(bbook_ids))
+        .all()
+    )
+    return {bbook.id: bbook for bbook in bbooks}
 
 
 # получение выданной книги по ID
 def get_borrowed_book(db: Session, bbook_id: int) -> Optional[m.BorrowedBook]:
-    return db.query(m.BorrowedBook).filter(m.BorrowedBook.id == bbook_id).first()
+    return (
+        db.query(m.BorrowedBook)
+        .options(*LOAD_RELATIONS)
+        .filter(m.BorrowedBook.id == bbook_id)
+        .first()
+    )
 
 
 # обновление выданной книги
 def update_borrowed_book(
     db: Session,
     bbook_id: int,
-    bbook_data: s.BorrowedBookCreate,
+    bbook_data: s.BorrowedBookUpdate,
 ) -> Optional[m.BorrowedBook]:
 
     db_borrowed_book = get_borrowed_book(db, bbook_id)
     if not db_borrowed_book:
         return None
-    for key, value in bbook_data.dict().items():
+
+    # смена книги, читателя или даты возврата меняет наличие экземпляров
+    # и счётчики открытых выдач; сначала книги, затем читатели - в том же
+    # порядке блокировок, что и при выдаче
+    old_book_id = db_borrowed_book.book_id
+    old_reader_id = db_borrowed_book.reader_id
+    was_open = db_borrowed_book.return_date is None
+    # меняются только переданные поля, остальные остаются как были
+    for key, value in bbook_data.model_dump(exclude_unset=True).items():
         setattr(db_borrowed_book, key, value)
+    is_open = db_borrowed_book.return_date is None
+    changed = _move_copies(
+        db,
+        old_book_id if was_open else None,
+        db_borrowed_book.book_id if is_open else None,
+    )
+    if was_open and (not is_open or db_borrowed_book.reader_id != old_reader_id):
+        change_active_loans(db, old_reader_id, -1)
+    if is_open and (not was_open or db_borrowed_book.reader_id != old_reader_id):
+        change_active_loans(db, db_borrowed_book.reader_id, 1)
     db.commit()
-    db.refresh(db_borrowed_book)
-    return db_borrowed_book
+    for book_id in changed:
+        book_cache.pop(book_id)
+
+    # перечитываем запись вместе со связями: после смены book_id/reader_id
+    # ранее загруженные связи устарели, а ленивая загрузка недоступна в async-режиме
+    db.expire(db_borrowed_book)
+    return get_borrowed_book(db, bbook_id)
 
 
 # удаление выданной книги
@@ -57,8 +271,15 @@ def delete_borrowed_book(db: Session, bbook_id: int) -> Optional[m.BorrowedBook]
     db_borrowed_book = get_borrowed_book(db, bbook_id)
     if not db_borrowed_book:
         return None
+    # удаленная открытая выдача возвращает экземпляр на полку
+    changed = []
+    if db_borrowed_book.return_date is None:
+        changed = _move_copies(db, db_borrowed_book.book_id, None)
+        change_active_loans(db, db_borrowed_book.reader_id, -1)
     db.delete(db_borrowed_book)
     db.commit()
+    for book_id in changed:
+        book_cache.pop(book_id)
     return db_borrowed_book
 
 
@@ -68,7 +289,12 @@ def get_all_borrowed_books_by_reader(
     reader_id: int,
 ) -> list[m.BorrowedBook]:
 
-    return db.query(m.BorrowedBook).filter(m.BorrowedBook.reader_id == reader_id).all()
+    return (
+        db.query(m.BorrowedBook)
+        .options(*LOAD_RELATIONS)
+        .filter(m.BorrowedBook.reader_id == reader_id)
+        .all()
+    )
 
 
 # получение выданных книг по читателю
@@ -80,6 +306,7 @@ def get_unreturned_books_by_reader(
 
     return (
         db.query(m.BorrowedBook)
+        .options(*LOAD_RELATIONS)
         .filter(
             m.BorrowedBook.reader_id == reader_id, m.BorrowedBook.return_date.is_(None)
         )
@@ -90,6 +317,8 @@ def get_unreturned_books_by_reader(
 # выдача книги
 # только если книга есть в наличии
 # читателю нельзя иметь более трех книг одновременно
+# все проверки выполняются в одной транзакции на стороне БД,
+# чтобы параллельные выдачи не уводили available_copies в минус и не обходили лимит
 def issue_book(
     db: Session,
     book_id: int,
@@ -97,38 +326,54 @@ def issue_book(
     user_id: int,
 ) -> Optional[m.BorrowedBook]:
 
-    # получаем книгу
-    book = get_book(db, book_id)
-    if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-
-    if book.copies <= 0:
+    # списываем экземпляр условным UPDATE: строка книги блокируется
+    # до конца транзакции, а available_copies > 0 проверяется атомарно
+    taken = db.execute(
+        update(m.Book)
+        .where(m.Book.id == book_id, m.Book.available_copies > 0)
+        .values(
+            available_copies=m.Book.available_copies - 1, version=m.Book.version + 1
+        )
+        .returning(m.Book.id)
+    ).scalar()
+    if taken is None:
+        db.rollback()
+        if not get_book(db, book_id):
+            raise HTTPException(status_code=404, detail="Book not found")
         raise HTTPException(status_code=400, detail="No available copies")
 
-    # получаем читателя
-    reader = get_reader(db, reader_id)
-    if not reader:
-        raise HTTPException(status_code=404, detail="Reader not found")
-
-    # проверяем по количеству книг у читателя
-    # нельзя выдавать книгу, если у читателя уже есть 3 книги
-    if len(get_unreturned_books_by_reader(db, reader_id)) >= 3:
+    # занимаем место в лимите читателя тем же способом: условный UPDATE
+    # счётчика открытых выдач, без подсчета строк borrowed_books
+    # строка читателя блокируется, поэтому выдачи одному читателю идут по очереди
+    reserved = db.execute(
+        update(m.Reader)
+        .where(m.Reader.id == reader_id, m.Reader.active_loans < m.MAX_ACTIVE_LOANS)
+        .values(active_loans=m.Reader.active_loans + 1)
+        .returning(m.Reader.id)
+    ).scalar()
+    if reserved is None:
+        db.rollback()
+        if not get_reader(db, reader_id):
+            raise HTTPException(status_code=404, detail="Reader not found")
         raise HTTPException(
             status_code=400, detail="Reader has already borrowed 3 books"
         )
 
     # создаем запись о выданной книге
+    now = datetime.utcnow()
     borrowed_book = m.BorrowedBook(
-        book_id=book.id,
-        reader_id=reader.id,
+        book_id=book_id,
+        reader_id=reader_id,
         user_id=user_id,
-        borrow_date=datetime.utcnow(),
+        borrow_date=now,
+        due_date=loan_due_date(now),
     )
     db.add(borrowed_book)
-    book.copies -= 1
+    db.flush()
+    bbook_id = borrowed_book.id
     db.commit()
-    db.refresh(borrowed_book)
-    return borrowed_book
+    book_cache.pop(book_id)
+    return get_borrowed_book(db, bbook_id)
 
 
 # возврат книги
@@ -139,34 +384,219 @@ def return_book(
     bbook_id: int,
 ) -> Optional[m.BorrowedBook]:
 
-    # получаем читателя
-    reader = get_reader(db, reader_id)
-    if not reader:
-        raise HTTPException(status_code=404, detail="Reader not found")
-
-    # получаем книгу
-    book = get_book(db, book_id)
-    if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-
     # получаем запись о выдаче книги
+    # если она есть и совпадает с книгой и читателем, то и они существуют,
+    # поэтому отдельно читатель и книга запрашиваются только для текста ошибки
     bbook = get_borrowed_book(db, bbook_id)
-    if not bbook:
-        raise HTTPException(status_code=404, detail="Borrowed book not found")
-
-    # проверяем, та ли это книга и тот ли это читатель
-    if bbook.book_id != book_id or bbook.reader_id != reader_id:
+    if not bbook or bbook.book_id != book_id or bbook.reader_id != reader_id:
+        if not get_reader(db, reader_id):
+            raise HTTPException(status_code=404, detail="Reader not found")
+        if not get_book(db, book_id):
+            raise HTTPException(status_code=404, detail="Book not found")
+        if not bbook:
+            raise HTTPException(status_code=404, detail="Borrowed book not found")
+        # проверяем, та ли это книга и тот ли это читатель
         raise HTTPException(
             status_code=400, detail="This book was not borrowed by this reader"
         )
 
-    # проверяем, не возвращена ли уже книга
-    if bbook.return_date:
+    # возвращаем книгу условным UPDATE, чтобы два параллельных возврата
+    # одной выдачи не вернули на полку два экземпляра
+    returned = db.execute(
+        update(m.BorrowedBook)
+        .where(m.BorrowedBook.id == bbook_id, m.BorrowedBook.return_date.is_(None))
+        .values(return_date=datetime.utcnow())
+        .returning(m.BorrowedBook.id)
+    ).scalar()
+    if returned is None:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Book already returned")
 
-    # возвращаем книгу
-    bbook.return_date = datetime.utcnow()
-    book.copies += 1
+    # увеличиваем available_copies на стороне БД, без чтения текущего значения
+    db.execute(
+        update(m.Book)
+        .where(m.Book.id == book_id)
+        .values(
+            available_copies=m.Book.available_copies + 1, version=m.Book.version + 1
+        )
+    )
+    change_active_loans(db, reader_id, -1)
     db.commit()
+    book_cache.pop(book_id)
     db.refresh(bbook)
     return bbook
+
+
+# изменить available_copies у нескольких книг одним UPDATE
+# counts: {book_id: на сколько изменить}, уменьшение только если хватает экземпляров
+# возвращает id книг, которые были изменены
+def _change_copies(db: Session, counts: dict[int, int]) -> set[int]:
+    if not counts:
+        return set()
+    delta = case(counts, value=m.Book.id)
+    return set(
+        db.execute(
+            update(m.Book)
+            .where(m.Book.id.in_(counts), m.Book.available_copies + delta >= 0)
+            .values(
+                available_copies=m.Book.available_copies + delta,
+                version=m.Book.version + 1,
+            )
+            .returning(m.Book.id)
+        ).scalars()
+    )
+
+
+def _batch_error(item_id: int, detail: str) -> dict:
+    return {"id": item_id, "ok": False, "detail": detail}
+
+
+# пакетная выдача книг одному читателю
+# читатель, книги и открытые выдачи проверяются по одному запросу на каждое,
+# лимит MAX_ACTIVE_LOANS применяется ко всему пакету по порядку книг,
+# все выдачи записываются в одной транзакции
+# результат по каждой книге из запроса: выдача или причина отказа
+def issue_books(
+    db: Session,
+    reader_id: int,
+    book_ids: list[int],
+    user_id: int,
+) -> list[dict]:
+
+    # блокировки берутся в том же порядке, что и в issue_book: сначала книги
+    # (по возрастанию id, чтобы пакеты не ждали друг друга по кругу),
+    # затем читатель - иначе параллельные одиночная и пакетная выдачи
+    # одному читателю могут заблокировать друг друга
+    copies = dict(
+        db.query(m.Book.id, m.Book.available_copies)
+        .filter(m.Book.id.in_(book_ids))
+        .order_by(m.Book.id)
+        .with_for_update()
+        .all()
+    )
+
+    # блокируем читателя, чтобы выдачи одному читателю шли по очереди
+    # число открытых выдач берем из счётчика active_loans
+    reader = (
+        db.query(m.Reader).filter(m.Reader.id == reader_id).with_for_update().first()
+    )
+    if not reader:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Reader not found")
+    active_loans = reader.active_loans
+
+    # распределяем экземпляры и лимит по порядку книг в запросе
+    results, planned, counts = [], [], {}
+    free_slots = m.MAX_ACTIVE_LOANS - active_loans
+    for book_id in book_ids:
+        if book_id not in copies:
+            results.append(_batch_error(book_id, "Book not found"))
+        elif copies[book_id] - counts.get(book_id, 0) <= 0:
+            results.append(_batch_error(book_id, "No available copies"))
+        elif len(planned) >= free_slots:
+            results.append(_batch_error(book_id, "Reader has already borrowed 3 books"))
+        else:
+            counts[book_id] = counts.get(book_id, 0) + 1
+            planned.append(book_id)
+            results.append(None)
+
+    # списываем экземпляры одним условным UPDATE по уже заблокированным строкам
+    taken = _change_copies(db, {book_id: -n for book_id, n in counts.items()})
+
+    loans = {}
+    now = datetime.utcnow()
+    for index, book_id in enumerate(book_ids):
+        if results[index] is not None:
+            continue
+        if book_id not in taken:
+            results[index] = _batch_error(book_id, "No available copies")
+            continue
+        loans[index] = m.BorrowedBook(
+            book_id=book_id,
+            reader_id=reader_id,
+            user_id=user_id,
+            borrow_date=now,
+            due_date=loan_due_date(now),
+        )
+    db.add_all(loans.values())
+    if loans:
+        change_active_loans(db, reader_id, len(loans))
+    db.flush()
+    bbook_ids = {index: loan.id for index, loan in loans.items()}
+    db.commit()
+    for book_id in taken:
+        book_cache.pop(book_id)
+
+    bbooks = get_borrowed_books_by_ids(db, list(bbook_ids.values()))
+    for index, bbook_id in bbook_ids.items():
+        results[index] = {
+            "id": book_ids[index],
+            "ok": True,
+            "borrowed_book": bbooks[bbook_id],
+        }
+    return results
+
+
+# пакетный возврат выдач одного читателя
+# выдачи проверяются одним запросом, возвращаются одним UPDATE,
+# available_copies увеличиваются одним UPDATE, все в одной транзакции
+def return_books(db: Session, reader_id: int, bbook_ids: list[int]) -> list[dict]:
+    if not get_reader(db, reader_id):
+        raise HTTPException(status_code=404, detail="Reader not found")
+
+    loans = {
+        loan.id: loan
+        for loan in db.query(
+            m.BorrowedBook.id,
+            m.BorrowedBook.reader_id,
+            m.BorrowedBook.return_date,
+        ).filter(m.BorrowedBook.id.in_(bbook_ids))
+    }
+
+    results, planned = [], set()
+    for bbook_id in bbook_ids:
+        loan = loans.get(bbook_id)
+        if loan is None:
+            results.append(_batch_error(bbook_id, "Borrowed book not found"))
+        elif loan.reader_id != reader_id:
+            results.append(
+                _batch_error(bbook_id, "This book was not borrowed by this reader")
+            )
+        elif loan.return_date is not None or bbook_id in planned:
+            results.append(_batch_error(bbook_id, "Book already returned"))
+        else:
+            planned.add(bbook_id)
+            results.append(None)
+
+    # условный UPDATE: выдачу, возвращенную параллельно, второй раз не вернем
+    returned = dict(
+        db.execute(
+            update(m.BorrowedBook)
+            .where(m.BorrowedBook.id.in_(planned), m.BorrowedBook.return_date.is_(None))
+            .values(return_date=datetime.utcnow())
+            .returning(m.BorrowedBook.id, m.BorrowedBook.book_id)
+        ).all()
+    )
+    counts = {}
+    for book_id in returned.values():
+        counts[book_id] = counts.get(book_id, 0) + 1
+    _change_copies(db, counts)
+    if returned:
+        change_active_loans(db, reader_id, -len(returned))
+    db.commit()
+    for book_id in counts:
+        book_cache.pop(book_id)
+
+    bbooks = get_borrowed_books_by_ids(db, list(returned))
+    for index, bbook_id in enumerate(bbook_ids):
+        if results[index] is not None:
+            continue
+        if bbook_id not in returned:
+            results[index] = _batch_error(bbook_id, "Book already returned")
+        else:
+            results[index] = {
+                "id": bbook_id,
+                "ok": True,
+                "borrowed_book": bbooks[bbook_id],
+            }
+    return results
@@ -1,7 +1,36 @@
+from sqlalchemy import case, event, func, select, update
 from sqlalchemy.orm import Session
 from app import models as m, schemas as s
+from app.core.cache import make_cache
+from app.core.config import settings
 from typing import Optional
 
+# кеш читателей по id для GET /readers/{id}
+reader_cache = make_cache(
+    "reader",
+    backend=settings.CACHE_BACKEND,
+    maxsize=settings.CATALOG_CACHE_SIZE,
+    ttl=settings.CATALOG_CACHE_TTL,
+    redis_url=settings.CACHE_REDIS_URL,
+    tombstone_ttl=settings.CATALOG_CACHE_TOMBSTONE_TTL,
+)
+
+
+# массовое удаление читателей идёт мимо CRUD, поэтому сбрасываем кеш целиком
+@event.listens_for(Session, "do_orm_execute")
+def _clear_reader_cache_on_bulk_delete(orm_execute_state):
+    if (
+        orm_execute_state.is_delete
+        and orm_execute_state.bind_mapper is m.Reader.__mapper__
+    ):
+        reader_cache.clear()
+
+
+def reader_row(reader: m.Reader) -> dict:
+    return {
+        column.key: getattr(reader, column.key) for column in m.Reader.__table__.columns
+    }
+
 
 # создание читателя
 def create_reader(db: Session, reader: s.ReaderCreate) -> m.Reader:
@@ -9,12 +38,29 @@ def create_reader(db: Session, reader: s.ReaderCreate) -> m.Reader:
     db.add(db_reader)
     db.commit()
     db.refresh(db_reader)
+    reader_cache.pop(db_reader.id)
     return db_reader
 
 
 # получение всех читателей
-def get_all_readers(db: Session, skip: int = 0, limit: int = 100) -> list[m.Reader]:
-    return db.query(m.Reader).offset(skip).limit(limit).all()
+# at_limit: только читатели, у которых уже MAX_ACTIVE_LOANS книг
+# если передан after (id последнего читателя предыдущей страницы),
+# используется keyset-пагинация вместо offset
+def get_all_readers(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[int] = None,
+    at_limit: bool = False,
+) -> list[m.Reader]:
+
+    query = db.query(m.Reader).order_by(m.Reader.id)
+    # читатели, которым больше нельзя выдавать книги (по счётчику, без подсчета выдач)
+    if at_limit:
+        query = query.filter(m.Reader.active_loans >= m.MAX_ACTIVE_LOANS)
+    if after is not None:
+        return query.filter(m.Reader.id > after).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
 
 
 # получение читателя по ID
@@ -22,6 +68,17 @@ def get_reader(db: Session, reader_id: int) -> Optional[m.Reader]:
     return db.query(m.Reader).filter(m.Reader.id == reader_id).first()
 
 
+# получение читателя по ID через кеш, только для отдачи клиенту
+def get_reader_cached(db: Session, reader_id: int) -> Optional[m.Reader]:
+    row = reader_cache.get(reader_id)
+    if row is not None:
+        return m.Reader(**row)
+    db_reader = get_reader(db, reader_id)
+    if db_reader is not None:
+        reader_cache.set(reader_id, reader_row(db_reader))
+    return db_reader
+
+
 # обновление читателя
 def update_reader(
     db: Session,
@@ -32,9 +89,11 @@ def update_reader(
     db_reader = get_reader(db, reader_id)
     if not db_reader:
         return None
-    for key, value in reader_data.dict().items():
+    for key, value in reader_data.model_dump().items():
         setattr(db_reader, key, value)
+    db_reader.version = m.Reader.version + 1
     db.commit()
+    reader_cache.pop(reader_id)
     db.refresh(db_reader)
     return db_reader
 
@@ -46,4 +105,44 @@ def delete_reader(db: Session, reader_id: int) -> Optional[m.Reader]:
         return None
     db.delete(db_reader)
     db.commit()
+    reader_cache.pop(reader_id)
     return db_reader
+
+
+# пересчёт счётчика открытых выдач readers.active_loans по borrowed_books
+# возвращает читателей, у которых счётчик расходился с фактом
+# у читателя с открытыми выдачами сверх MAX_ACTIVE_LOANS счётчик ставится
+# в MAX_ACTIVE_LOANS (больше не пускает CHECK-ограничение), такие читатели
+# отмечаются over_limit и попадают в результат при каждом запуске
+# с dry_run только находит расхождения, ничего не меняя
+def reconcile_active_loans(db: Session, dry_run: bool = False) -> list[dict]:
+    open_loans = (
+        select(func.count(m.BorrowedBook.id))
+        .where(
+            m.BorrowedBook.reader_id == m.Reader.id,
+            m.BorrowedBook.return_date.is_(None),
+        )
+        .scalar_subquery()
+    )
+    mismatches = []
+    for reader_id, stored, actual in db.execute(
+        select(m.Reader.id, m.Reader.active_loans, open_loans)
+        .where(m.Reader.active_loans != open_loans)
+        .order_by(m.Reader.id)
+    ):
+        mismatch = {"reader_id": reader_id, "stored": stored, "actual": actual}
+        if actual > m.MAX_ACTIVE_LOANS:
+            mismatch["over_limit"] = True
+        mismatches.append(mismatch)
+    if mismatches and not dry_run:
+        clamped = case(
+            (open_loans > m.MAX_ACTIVE_LOANS, m.MAX_ACTIVE_LOANS), else_=open_loans
+        )
+        db.execute(
+            update(m.Reader)
+            .where(m.Reader.active_loans != clamped)
+            .values(active_loans=clamped)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    return mismatches
@@ -0,0 +1,222 @@
+from collections import Counter
+from datetime import date, datetime, timezone
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.orm import Session
+from app import models as m
+from app.crud.crud_books import UPSERT_DIALECTS
+
+STATE_ID = 1
+
+
+# день по UTC: borrow_date и return_date пишутся в UTC
+def _utc_day(value: datetime) -> date:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _insert(db: Session, model):
+    return UPSERT_DIALECTS[db.get_bind().dialect.name].insert(model)
+
+
+# строка состояния, заблокированная до конца транзакции:
+# параллельные пересчеты (в нескольких процессах) идут по очереди
+def _lock_state(db: Session) -> m.CirculationStatsState:
+    db.execute(
+        _insert(db, m.CirculationStatsState)
+        .values(id=STATE_ID)
+        .on_conflict_do_nothing()
+    )
+    return (
+        db.query(m.CirculationStatsState)
+        .filter(m.CirculationStatsState.id == STATE_ID)
+        .with_for_update()
+        .one()
+    )
+
+
+# прибавляет счётчики к агрегатам одним INSERT ... ON CONFLICT DO UPDATE
+# counts: ключ (значения колонок keys) -> {колонка: прирост}
+def _add_counts(db: Session, model, keys: list[str], counts: dict) -> None:
+    if not counts:
+        return
+    rows = [{**dict(zip(keys, key)), **values} for key, values in counts.items()]
+    columns = {column for values in counts.values() for column in values}
+    stmt = _insert(db, model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={
+            column: getattr(model, column) + stmt.excluded[column] for column in columns
+        },
+    )
+    db.execute(stmt)
+
+
+# одна порция выдач (id > issued_id, не дальше pending_issued_id)
+# агрегаты и отметка о прогрессе меняются в одной короткой транзакции
+# возвращает число учтенных выдач; меньше limit - выдачи закончились
+def refresh_issued_stats(db: Session, limit: int) -> int:
+    state = _lock_state(db)
+    pending = state.pending_issued_id
+    if pending is None or state.issued_id >= pending:
+        db.commit()
+        return 0
+
+    rows = (
+        db.query(
+            m.BorrowedBook.id,
+            m.BorrowedBook.borrow_date,
+            m.BorrowedBook.book_id,
+            m.BorrowedBook.reader_id,
+        )
+        .filter(m.BorrowedBook.id > state.issued_id, m.BorrowedBook.id <= pending)
+        .order_by(m.BorrowedBook.id)
+        .limit(limit)
+        .all()
+    )
+    daily, books, readers = Counter(), Counter(), Counter()
+    for row in rows:
+        day = _utc_day(row.borrow_date)
+        month = day.replace(day=1)
+        daily[(day,)] += 1
+        books[(month, row.book_id)] += 1
+        readers[(month, row.reader_id)] += 1
+    _add_counts(
+        db, m.DailyCirculation, ["day"], {k: {"issued": n} for k, n in daily.items()}
+    )
+    _add_counts(
+        db,
+        m.MonthlyBookCirculation,
+        ["month", "book_id"],
+        {k: {"issues": n} for k, n in books.items()},
+    )
+    _add_counts(
+        db,
+        m.MonthlyReaderCirculation,
+        ["month", "reader_id"],
+        {k: {"issues": n} for k, n in readers.items()},
+    )
+    state.issued_id = rows[-1].id if len(rows) == limit else pending
+    db.commit()
+    return len(rows)
+
+
+# одна порция возвратов по (return_date, id) после последнего учтенного,
+# не позже pending_returned_at
+def refresh_returned_stats(db: Session, limit: int) -> int:
+    state = _lock_state(db)
+    pending = state.pending_returned_at
+    if pending is None:
+        db.commit()
+        return 0
+
+    query = db.query(m.BorrowedBook.id, m.BorrowedBook.return_date).filter(
+        m.BorrowedBook.return_date.is_not(None),
+        m.BorrowedBook.return_date <= pending,
+    )
+    if state.returned_at is not None:
+        query = query.filter(
+            tuple_(m.BorrowedBook.return_date, m.BorrowedBook.id)
+            > tuple_(state.returned_at, state.returned_id)
+        )
+    rows = (
+        query.order_by(m.BorrowedBook.return_date, m.BorrowedBook.id).limit(limit).all()
+    )
+    if not rows:
+        db.commit()
+        return 0
+
+    daily = Counter((_utc_day(row.return_date),) for row in rows)
+    _add_counts(
+        db, m.DailyCirculation, ["day"], {k: {"returned": n} for k, n in daily.items()}
+    )
+    state.returned_at, state.returned_id = rows[-1].return_date, rows[-1].id
+    db.commit()
+    return len(rows)
+
+
+# запоминает границы для следующего пересчета: последний id выдачи и время
+# строки до них будут учтены в следующий раз, когда все транзакции,
+# начатые до этой отметки, уже зафиксированы
+def advance_stats_pending(db: Session, now: datetime) -> None:
+    state = _lock_state(db)
+    state.pending_issued_id = db.query(func.max(m.BorrowedBook.id)).scalar() or 0
+    state.pending_returned_at = now
+    state.refreshed_at = now
+    db.commit()
+
+
+# полный пересчет: агрегаты очищаются, а границы сразу ставятся на текущий
+# момент, так что следующие порции учтут всю историю
+def reset_circulation_stats(db: Session, now: datetime) -> None:
+    state = _lock_state(db)
+    for model in (
+        m.DailyCirculation,
+        m.MonthlyBookCirculation,
+        m.MonthlyReaderCirculation,
+    ):
+        db.execute(delete(model))
+    state.issued_id = 0
+    state.returned_at = None
+    state.returned_id = 0
+    db.commit()
+    advance_stats_pending(db, now)
+
+
+# самые выдаваемые книги месяца: чтение по индексу ix_monthly_book_circulation_top
+def get_top_books(db: Session, month: date, limit: int = 10) -> list:
+    return db.execute(
+        select(
+            m.MonthlyBookCirculation.book_id,
+            m.Book.title,
+            m.Book.author,
+            m.MonthlyBookCirculation.issues,
+        )
+        .outerjoin(m.Book, m.Book.id == m.MonthlyBookCirculation.book_id)
+        .where(m.MonthlyBookCirculation.month == month)
+        .order_by(
+            m.MonthlyBookCirculation.issues.desc(),
+            m.MonthlyBookCirculation.book_id.desc(),
+        )
+        .limit(limit)
+    ).all()
+
+
+# самые активные читатели месяца
+def get_top_readers(db: Session, month: date, limit: int = 10) -> list:
+    return db.execute(
+        select(
+            m.MonthlyReaderCirculation.reader_id,
+            m.Reader.name,
+            m.MonthlyReaderCirculation.issues,
+        )
+        .outerjoin(m.Reader, m.Reader.id == m.MonthlyReaderCirculation.reader_id)
+        .where(m.MonthlyReaderCirculation.month == month)
+        .order_by(
+            m.MonthlyReaderCirculation.issues.desc(),
+            m.MonthlyReaderCirculation.reader_id.desc(),
+        )
+        .limit(limit)
+    ).all()
+
+
+# выдачи и возвраты по дням [date_from, date_to], дни без движения - нули
+def get_daily_circulation(db: Session, date_from: date, date_to: date) -> list[dict]:
+    rows = {
+        row.day: row
+        for row in db.query(m.DailyCirculation).filter(
+            m.DailyCirculation.day >= date_from, m.DailyCirculation.day <= date_to
+        )
+    }
+    result = []
+    for ordinal in range(date_from.toordinal(), date_to.toordinal() + 1):
+        day = date.fromordinal(ordinal)
+        row = rows.get(day)
+        result.append(
+            {
+                "day": day,
+                "issued": row.issued if row else 0,
+                "returned": row.returned if row else 0,
+            }
+        )
+    return result
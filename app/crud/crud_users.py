@@ -4,16 +4,55 @@ from app.auth import hash_password
 from typing import Optional
 
 
+# получение библиотекаря по email
+def get_user_by_email(db: Session, email: str) -> Optional[m.User]:
+    return db.query(m.User).filter(m.User.email == email).first()
+
+
 # создание библиотекаря
-def create_user(db: Session, user: s.UserCreate) -> Optional[m.User]:
+# hashed_password можно посчитать заранее вне сессии (bcrypt нагружает CPU)
+def create_user(
+    db: Session,
+    user: s.UserCreate,
+    hashed_password: Optional[str] = None,
+) -> Optional[m.User]:
+
     # проверям не создан ли уже такой библиотекарь
-    db_user = db.query(m.User).filter(m.User.email == user.email).first()
+    db_user = get_user_by_email(db, user.email)
     if db_user:
         return None  # если библиотекарь уже есть, возвращаем None
 
     # создаем библиотекаря
-    db_user = m.User(email=user.email, hashed_password=hash_password(user.password))
+    if hashed_password is None:
+        hashed_password = hash_password(user.password)
+    db_user = m.User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
+
+
+# замена хеша пароля (пересчёт с новой стоимостью bcrypt)
+# хеш меняется, только если он не изменился с момента проверки пароля
+def update_password_hash(
+    db: Session, user_id: int, old_hash: str, new_hash: str
+) -> bool:
+
+    db_user = db.query(m.User).filter(m.User.id == user_id).first()
+    if db_user is None or db_user.hashed_password != old_hash:
+        return False
+
+    db_user.hashed_password = new_hash
+    db.commit()
+    return True
+
+
+# отзыв всех выданных библиотекарю токенов
+def revoke_tokens(db: Session, user_id: int) -> Optional[m.User]:
+    db_user = db.query(m.User).filter(m.User.id == user_id).first()
+    if db_user is None:
+        return None
+
+    db_user.token_version = m.User.token_version + 1
+    db.commit()
+    return db_user
@@ -1,20 +1,109 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.core.pool import engine_options
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **engine_options(settings))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+# асинхронные драйверы для поддерживаемых СУБД
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+# строим URL для асинхронного движка из обычного DATABASE_URL
+def make_async_url(url: str) -> str:
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(
+        hide_password=False
+    )
+
+
+# асинхронный режим включается флагом ASYNC_DB
+# синхронный движок остаётся для alembic, тестов и скриптов
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.ASYNC_DB:
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL or make_async_url(DATABASE_URL),
+        **engine_options(settings, is_async=True),
+    )
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_db = get_async_db if settings.ASYNC_DB else get_sync_db
+
+
+# выполнить синхронную CRUD-функцию для сессии любого режима
+# AsyncSession: через run_sync, ввод-вывод идёт через асинхронный драйвер
+# Session: в пуле потоков, чтобы не блокировать event loop
+async def run_db(db, fn, *args, **kwargs):
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+# выполнить CRUD-функцию в собственной сессии
+# для фоновых задач, которые выполняются после закрытия сессии запроса
+async def run_in_new_session(fn, *args, **kwargs):
+    if settings.ASYNC_DB:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(fn, *args, **kwargs)
+
+    def call():
+        with SessionLocal() as db:
+            return fn(db, *args, **kwargs)
+
+    return await run_in_threadpool(call)
+
+
+# как run_db, но сразу после запроса закрывает сессию и возвращает соединение в пул
+# нужно перед долгой операцией без БД (например, bcrypt)
+# для Session закрытие идёт в том же потоке: иначе соединение осталось бы занятым,
+# пока запрос ждёт свободный поток для закрытия
+async def run_db_and_release(db, fn, *args, **kwargs):
+    if isinstance(db, AsyncSession):
+        try:
+            return await db.run_sync(fn, *args, **kwargs)
+        finally:
+            await db.close()
+
+    def call():
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    return await run_in_threadpool(call)
@@ -0,0 +1,35 @@
+import hashlib
+from typing import Any, Optional
+from fastapi import Request, Response
+from app.core.config import settings
+
+# ответы зависят от пользователя (нужен токен), поэтому только private
+CACHE_CONTROL = f"private, max-age={settings.HTTP_CACHE_MAX_AGE}, must-revalidate"
+
+
+# строгий ETag из типа ресурса и версий строк
+# версия меняется при любом изменении строки, поэтому сериализация не нужна
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+# If-None-Match сравнивается слабым сравнением (RFC 9110)
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+# проставляет ETag и Cache-Control
+# если клиент прислал тот же ETag, возвращает готовый ответ 304,
+# который эндпоинт отдаёт вместо данных
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
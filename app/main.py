@@ -1,9 +1,54 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
-from app.api import auth, books, readers, borrow
+from app import database
+from app.api import auth, books, readers, borrow, monitoring, stats
+from app.core.config import settings
+from app.core.metrics import EngineInstrumentation, MetricsMiddleware
+from app.analytics import run_stats_refresher
+from app.overdue import run_overdue_scanner
 
-app = FastAPI()
+
+# фоновые задачи на время жизни приложения
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if settings.OVERDUE_SCAN_INTERVAL > 0:
+        tasks.append(
+            asyncio.create_task(
+                run_overdue_scanner(
+                    settings.OVERDUE_SCAN_INTERVAL, settings.OVERDUE_SCAN_BATCH_SIZE
+                )
+            )
+        )
+    if settings.STATS_REFRESH_INTERVAL > 0:
+        tasks.append(
+            asyncio.create_task(
+                run_stats_refresher(
+                    settings.STATS_REFRESH_INTERVAL, settings.STATS_REFRESH_BATCH_SIZE
+                )
+            )
+        )
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(auth.router)
 app.include_router(books.router)
 app.include_router(readers.router)
 app.include_router(borrow.router)
+app.include_router(monitoring.router)
+app.include_router(stats.router)
+
+# метрики подключаются только если включены
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrumentation = EngineInstrumentation(settings.SLOW_QUERY_MS)
+    instrumentation.attach(database.engine)
+    if database.async_engine is not None:
+        instrumentation.attach(database.async_engine.sync_engine)
@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, text
+from sqlalchemy import Date, UniqueConstraint, literal_column
+from sqlalchemy import CheckConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
 
+# сколько книг читатель может держать одновременно
+MAX_ACTIVE_LOANS = 3
+
 
 # модель для пользователей (библиотекарей)
 class User(Base):
@@ -11,6 +16,8 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+    # версия токенов: увеличение отзывает все выданные ранее токены
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # связь с таблицей BorrowedBooks
     borrowed_books = relationship("BorrowedBook", back_populates="user")
@@ -22,26 +29,81 @@ class User(Base):
 # модель для книг
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = (
+        # на полке не больше, чем всего, и не меньше нуля
+        CheckConstraint(
+            "available_copies >= 0 AND available_copies <= total_copies",
+            name="ck_books_available_copies",
+        ),
+        # фильтры и сортировка каталога (GET /books/)
+        # id в конце - для стабильного порядка и keyset-пагинации
+        Index("ix_books_title_id", "title", "id"),
+        Index("ix_books_author_year", "author", "year"),
+        Index("ix_books_year_id", "year", "id"),
+        # только книги в наличии
+        Index(
+            "ix_books_available_id",
+            "id",
+            postgresql_where=text("available_copies > 0"),
+            sqlite_where=text("available_copies > 0"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, index=True)
-    author = Column(String, index=True)
+    title = Column(String)
+    author = Column(String)
     year = Column(Integer, nullable=True)
     isbn = Column(String, unique=True, nullable=True)
-    copies = Column(Integer, default=1)
+    # всего экземпляров задаётся при создании и обновлении книги,
+    # на полке - меняется только выдачей и возвратом
+    total_copies = Column(Integer, nullable=False, default=1, server_default="1")
+    available_copies = Column(
+        Integer,
+        nullable=False,
+        default=lambda context: context.get_current_parameters()["total_copies"],
+    )
     description = Column(String, nullable=True)
+    # версия строки для ETag: увеличивается при каждом изменении книги
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # сумма и число оценок, меняются вместе с book_ratings в одной транзакции
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     # связь с таблицей BorrowedBooks
     borrowed_books = relationship("BorrowedBook", back_populates="book")
 
 
+# средняя оценка книги для сортировки, 0 - если оценок нет
+# (без NULL, чтобы книги без оценок в индексе шли после всех оцененных)
+# литералы, а не параметры: запрос должен совпасть с выражением индекса
+RATING_AVERAGE = func.coalesce(
+    Book.rating_sum
+    * literal_column("1.0")
+    / func.nullif(Book.rating_count, literal_column("0")),
+    literal_column("0"),
+)
+
+Index("ix_books_rating_average", RATING_AVERAGE, Book.id)
+
+
 # модель для читателей
 class Reader(Base):
     __tablename__ = "readers"
+    __table_args__ = (
+        # счётчик открытых выдач не меньше нуля и не больше лимита
+        CheckConstraint(
+            f"active_loans >= 0 AND active_loans <= {MAX_ACTIVE_LOANS}",
+            name="ck_readers_active_loans",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     email = Column(String, unique=True)
+    # версия строки для ETag: увеличивается при каждом изменении читателя
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # число невозвращенных книг, поддерживается при выдаче и возврате
+    active_loans = Column(Integer, nullable=False, default=0, server_default="0")
 
     # связь с таблицей BorrowedBooks
     borrowed_books = relationship("BorrowedBook", back_populates="reader")
@@ -50,10 +112,46 @@ class Reader(Base):
 # модель для выданных книг
 class BorrowedBook(Base):
     __tablename__ = "borrowed_books"
+    __table_args__ = (
+        # выдачи читателя (все и невозвращенные)
+        Index("ix_borrowed_books_reader_id_return_date", "reader_id", "return_date"),
+        # выдачи по книге
+        Index("ix_borrowed_books_book_id", "book_id"),
+        # только открытые выдачи: проверка лимита в 3 книги
+        Index(
+            "ix_borrowed_books_open_loans",
+            "reader_id",
+            postgresql_where=text("return_date IS NULL"),
+            sqlite_where=text("return_date IS NULL"),
+        ),
+        # keyset-пагинация и выгрузка по (borrow_date, id)
+        Index("ix_borrowed_books_borrow_date_id", "borrow_date", "id"),
+        # новые возвраты для пересчета статистики
+        # только закрытые выдачи: запросы по открытым идут по своим индексам
+        Index(
+            "ix_borrowed_books_return_date_id",
+            "return_date",
+            "id",
+            postgresql_where=text("return_date IS NOT NULL"),
+            sqlite_where=text("return_date IS NOT NULL"),
+        ),
+        # просроченные выдачи: только открытые, по (due_date, id)
+        Index(
+            "ix_borrowed_books_open_due_date",
+            "due_date",
+            "id",
+            postgresql_where=text("return_date IS NULL"),
+            sqlite_where=text("return_date IS NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     borrow_date = Column(DateTime(timezone=True), server_default=func.now())
     return_date = Column(DateTime(timezone=True), nullable=True)
+    # срок возврата: дата выдачи + LOAN_PERIOD_DAYS
+    due_date = Column(DateTime(timezone=True), nullable=True)
+    # когда фоновая проверка отметила выдачу как просроченную
+    overdue_flagged_at = Column(DateTime(timezone=True), nullable=True)
 
     book_id = Column(Integer, ForeignKey("books.id"))
     reader_id = Column(Integer, ForeignKey("readers.id"))
@@ -63,3 +161,77 @@ class BorrowedBook(Base):
     book = relationship("Book", back_populates="borrowed_books")
     reader = relationship("Reader", back_populates="borrowed_books")
     user = relationship("User", back_populates="borrowed_books")
+
+
+# оценки книг читателями (1-5), одна оценка читателя на книгу
+class BookRating(Base):
+    __tablename__ = "book_ratings"
+    __table_args__ = (
+        UniqueConstraint("book_id", "reader_id", name="uq_book_ratings_book_reader"),
+        CheckConstraint("rating >= 1 AND rating <= 5", name="ck_book_ratings_rating"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"))
+    reader_id = Column(Integer, ForeignKey("readers.id", ondelete="CASCADE"))
+    rating = Column(Integer, nullable=False)
+    rated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# ---------------- статистика выдач ----------------
+# агрегаты пересчитываются порциями по новым строкам borrowed_books
+# (см. crud_stats.refresh_circulation_stats), эндпоинты /stats/*
+# читают только их. Внешних ключей нет: удаление книги или читателя
+# не должно упираться в историю статистики
+
+
+# выдачи и возвраты по дням
+class DailyCirculation(Base):
+    __tablename__ = "daily_circulation"
+
+    day = Column(Date, primary_key=True)
+    issued = Column(Integer, nullable=False, default=0, server_default="0")
+    returned = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# число выдач книги за месяц (month - первое число месяца)
+class MonthlyBookCirculation(Base):
+    __tablename__ = "monthly_book_circulation"
+    __table_args__ = (
+        # самые популярные книги месяца
+        Index("ix_monthly_book_circulation_top", "month", "issues", "book_id"),
+    )
+
+    month = Column(Date, primary_key=True)
+    book_id = Column(Integer, primary_key=True)
+    issues = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# число выдач читателю за месяц
+class MonthlyReaderCirculation(Base):
+    __tablename__ = "monthly_reader_circulation"
+    __table_args__ = (
+        # самые активные читатели месяца
+        Index("ix_monthly_reader_circulation_top", "month", "issues", "reader_id"),
+    )
+
+    month = Column(Date, primary_key=True)
+    reader_id = Column(Integer, primary_key=True)
+    issues = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# докуда borrowed_books уже учтены в статистике (одна строка)
+# выдачи учитываются по id, возвраты - по (return_date, id)
+# pending_* - границы, запомненные при прошлом пересчете: строки до них
+# учитываются только в следующий раз, чтобы не пропустить транзакции,
+# которые к моменту пересчета еще не были зафиксированы
+class CirculationStatsState(Base):
+    __tablename__ = "circulation_stats_state"
+
+    id = Column(Integer, primary_key=True)
+    issued_id = Column(Integer, nullable=False, default=0, server_default="0")
+    pending_issued_id = Column(Integer, nullable=True)
+    returned_at = Column(DateTime(timezone=True), nullable=True)
+    returned_id = Column(Integer, nullable=False, default=0, server_default="0")
+    pending_returned_at = Column(DateTime(timezone=True), nullable=True)
+    refreshed_at = Column(DateTime(timezone=True), nullable=True)
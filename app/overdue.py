@@ -0,0 +1,64 @@
+# Фоновая проверка просроченных выдач.
+#
+# Проходит по открытым выдачам со сроком возврата в прошлом порциями
+# по OVERDUE_SCAN_BATCH_SIZE и отмечает их (overdue_flagged_at). Каждая
+# порция - отдельная короткая транзакция в своей сессии, поэтому проверка
+# не держит блокировки и соединение, пока идёт весь проход. Уже отмеченные
+# выдачи не трогаются, так что несколько процессов могут проверять
+# одновременно.
+#
+# В приложении запускается раз в OVERDUE_SCAN_INTERVAL секунд; один проход
+# можно запустить вручную (например, из cron):
+#
+#   python -m app.overdue
+
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+from app.core.config import settings
+from app.crud.crud_borrowed_books import flag_overdue_books
+from app.database import run_in_new_session
+
+logger = logging.getLogger("app.overdue")
+
+
+# один проход по просроченным выдачам, возвращает число отмеченных
+async def scan_overdue_loans(
+    batch_size: int = settings.OVERDUE_SCAN_BATCH_SIZE,
+    now: Optional[datetime] = None,
+) -> int:
+    now = now or datetime.utcnow()
+    total, after = 0, None
+    while True:
+        flagged, after = await run_in_new_session(
+            flag_overdue_books, now, batch_size, after
+        )
+        total += flagged
+        if after is None:
+            return total
+
+
+# периодическая проверка, запускается при старте приложения
+# ошибка одного прохода не останавливает следующие
+async def run_overdue_scanner(interval: float, batch_size: int) -> None:
+    while True:
+        try:
+            flagged = await scan_overdue_loans(batch_size)
+            if flagged:
+                logger.info("flagged %d overdue loans", flagged)
+        except Exception:
+            logger.exception("overdue scan failed")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фоновая проверка просроченных выдач.")
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.OVERDUE_SCAN_BATCH_SIZE
+    )
+    args = parser.parse_args()
+    flagged = asyncio.run(scan_overdue_loans(args.batch_size))
+    print(json.dumps({"flagged": flagged}, indent=2))
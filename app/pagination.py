@@ -0,0 +1,84 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Optional, Sequence
+from fastapi import HTTPException, Response
+
+# заголовок, в котором клиенту отдаётся курсор следующей страницы
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# курсор - это base64 от json-списка значений ключа сортировки
+# клиент не должен разбирать его содержимое
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(
+        [v.isoformat() if isinstance(v, datetime) else v for v in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, size: int) -> list:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+# курсор по id (книги, читатели)
+def decode_id_cursor(token: Optional[str]) -> Optional[int]:
+    if token is None:
+        return None
+    (last_id,) = decode_cursor(token, 1)
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return last_id
+
+
+# курсор по (значение колонки сортировки, id) для книг
+# значение - null или value_type (тип колонки сортировки): подмененный курсор
+# с другим типом иначе дошел бы до сравнения в SQL и упал с ошибкой БД
+def decode_sort_cursor(
+    token: Optional[str], value_type: type
+) -> Optional[tuple[Any, int]]:
+    if token is None:
+        return None
+    value, last_id = decode_cursor(token, 2)
+    if (
+        value is not None
+        and (not isinstance(value, value_type) or isinstance(value, bool))
+    ) or not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, last_id
+
+
+# курсор по (borrow_date, id) или (due_date, id) для выданных книг
+def decode_borrow_cursor(token: Optional[str]) -> Optional[tuple[datetime, int]]:
+    if token is None:
+        return None
+    borrow_date, last_id = decode_cursor(token, 2)
+    try:
+        borrow_date = datetime.fromisoformat(borrow_date)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return borrow_date, last_id
+
+
+# если страница заполнена целиком, отдаём курсор на следующую
+def set_next_cursor(
+    response: Response,
+    items: Sequence,
+    limit: int,
+    key: Callable[[Any], tuple],
+) -> Optional[str]:
+    if not items or len(items) < limit:
+        return None
+    cursor = encode_cursor(*key(items[-1]))
+    response.headers[NEXT_CURSOR_HEADER] = cursor
+    return cursor
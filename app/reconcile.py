@@ -0,0 +1,25 @@
+# Пересчёт счётчика открытых выдач readers.active_loans по borrowed_books.
+#
+# Счётчик поддерживается при выдаче и возврате, но может разойтись с фактом,
+# если borrowed_books меняли в обход API. Выводит найденные расхождения в JSON.
+#
+#   python -m app.reconcile            # исправить
+#   python -m app.reconcile --dry-run  # только показать
+
+import argparse
+import json
+from app.crud.crud_readers import reconcile_active_loans
+from app.database import SessionLocal
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Пересчёт счётчика открытых выдач readers.active_loans по borrowed_books."
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        mismatches = reconcile_active_loans(db, dry_run=args.dry_run)
+    finally:
+        db.close()
+    print(json.dumps({"fixed": not args.dry_run, "mismatches": mismatches}, indent=2))
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, computed_field
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 
 
 # -------------------Библиотекари-------------------
@@ -11,12 +11,13 @@ class UserCreate(BaseModel):
 
 
 # ответ
+# email уже проверен при создании, в ответе повторная проверка
+# EmailStr заметно дороже всей остальной сериализации
 class UserResponse(BaseModel):
     id: int
-    email: EmailStr
+    email: str
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # логин
@@ -33,7 +34,8 @@ class BookBase(BaseModel):
     author: str
     year: Optional[int] = None
     isbn: Optional[int] = None
-    copies: int = 1
+    # всего экземпляров в библиотеке (на руках и на полке)
+    total_copies: int = Field(1, ge=0)
 
 
 class BookCreate(BookBase):
@@ -45,14 +47,54 @@ class BookUpdate(BaseModel):
     author: Optional[str] = None
     year: Optional[int] = None
     isbn: Optional[int] = None
-    copies: Optional[int] = None
+    total_copies: Optional[int] = Field(None, ge=0)
 
 
 class BookResponse(BookBase):
     id: int
+    # экземпляров на полке, меняется при выдаче и возврате
+    available_copies: int
+    # средняя оценка считается из суммы и числа оценок, хранящихся в книге
+    rating_sum: int = Field(0, exclude=True)
+    rating_count: int = 0
+
+    @computed_field
+    @property
+    def rating_average(self) -> Optional[float]:
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# наличие экземпляров книги
+class BookAvailability(BaseModel):
+    id: int
+    total_copies: int
+    available_copies: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# отчёт о массовом импорте книг
+class BookImportError(BaseModel):
+    row: int
+    error: str
+
 
-    class Config:
-        orm_mode = True
+class BookImportReport(BaseModel):
+    total: int
+    imported: int
+    failed: int
+    errors: list[BookImportError]
+    errors_truncated: bool
+
+
+# оценка книги читателем, вернувшим ее
+class BookRatingCreate(BaseModel):
+    reader_id: int
+    rating: int = Field(ge=1, le=5)
 
 
 class ReturnBookRequest(BaseModel):
@@ -80,11 +122,12 @@ class ReaderUpdate(ReaderBase):
 
 
 # для ответа
+# email не проверяется повторно, как и в UserResponse
 class ReaderResponse(ReaderBase):
     id: int
+    email: str
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ----------------------Выданные книги--------------------
@@ -99,8 +142,9 @@ class BorrowedBookBase(BaseModel):
 
 
 # создание
+# без due_date срок считается от даты выдачи
 class BorrowedBookCreate(BorrowedBookBase):
-    pass
+    due_date: Optional[datetime] = None
 
 
 # обновление
@@ -115,9 +159,57 @@ class BorrowedBookUpdate(BorrowedBookBase):
 # для ответа
 class BorrowedBookResponse(BorrowedBookBase):
     id: int
+    due_date: Optional[datetime] = None
+    overdue_flagged_at: Optional[datetime] = None
     book: BookResponse
     reader: ReaderResponse
     user: UserResponse
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+# пакетная выдача: несколько книг одному читателю
+class BatchCheckoutRequest(BaseModel):
+    reader_id: int
+    book_ids: list[int] = Field(min_length=1, max_length=20)
+
+
+# пакетный возврат: несколько выдач одного читателя
+class BatchReturnRequest(BaseModel):
+    reader_id: int
+    bbook_ids: list[int] = Field(min_length=1, max_length=20)
+
+
+# результат по каждому элементу пакета (id книги или выдачи из запроса)
+class BatchItemResult(BaseModel):
+    id: int
+    ok: bool
+    detail: Optional[str] = None
+    borrowed_book: Optional[BorrowedBookResponse] = None
+
+
+# ----------------------Статистика--------------------
+
+
+class TopBook(BaseModel):
+    book_id: int
+    # книги уже может не быть в каталоге
+    title: Optional[str] = None
+    author: Optional[str] = None
+    issues: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TopReader(BaseModel):
+    reader_id: int
+    name: Optional[str] = None
+    issues: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class DailyCirculation(BaseModel):
+    day: date
+    issued: int
+    returned: int
@@ -0,0 +1,50 @@
+# Время проверки пароля bcrypt для разных значений BCRYPT_ROUNDS на этой машине.
+#
+# Для каждой стоимости выводится медианное время verify и сколько логинов
+# в секунду выдержит пул хеширования (PASSWORD_HASH_WORKERS потоков, если
+# ядер не меньше, чем потоков).
+# Результат выводится в JSON.
+#
+#   python -m benchmarks.bcrypt_cost --min-rounds 10 --max-rounds 14
+
+import argparse
+import json
+import statistics
+import time
+from passlib.context import CryptContext
+from app.core.config import settings
+
+
+def measure(rounds: int, iterations: int) -> dict:
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    hashed = context.hash("bench-password")
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        context.verify("bench-password", hashed)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        "rounds": rounds,
+        "verify_ms": round(median * 1000, 2),
+        "logins_per_sec": round(settings.PASSWORD_HASH_WORKERS / median, 1),
+        "current": rounds == settings.BCRYPT_ROUNDS,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Время проверки пароля bcrypt для разных значений BCRYPT_ROUNDS."
+    )
+    parser.add_argument("--min-rounds", type=int, default=8)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+    result = {
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "costs": [
+            measure(rounds, args.iterations)
+            for rounds in range(args.min_rounds, args.max_rounds + 1)
+        ],
+    }
+    print(json.dumps(result, indent=2))
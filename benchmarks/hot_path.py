@@ -0,0 +1,344 @@
+# Нагрузочный тест горячего пути: выдача, возврат, список книг и логин.
+#
+# В базу из DATABASE_URL (PostgreSQL или SQLite) добавляется набор данных
+# заданного размера: книги, читатели и история возвратов. Затем несколько
+# параллельных клиентов гоняют смесь запросов через приложение в том же
+# процессе (httpx + ASGITransport). По каждой операции выводится RPS,
+# p50/p95/p99 и среднее число SQL-запросов на запрос.
+#
+# Результат - JSON; его можно сохранить (--output) и сравнить с результатом
+# другого коммита (--baseline):
+#
+#   python -m benchmarks.hot_path --duration 10 --concurrency 8 --output head.json
+#   python -m benchmarks.hot_path --duration 10 --baseline head.json
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+import uuid
+from datetime import datetime, timedelta
+import httpx
+from sqlalchemy import insert
+from benchmarks.common import summary
+from app import database
+from app.auth import create_user_token, hash_password
+from app.core.metrics import EngineInstrumentation, MetricsMiddleware
+from app.core.metrics import MetricsRegistry
+from app.database import SessionLocal, engine
+from app.main import app
+from app.models import MAX_ACTIVE_LOANS, Base, Book, BorrowedBook, Reader, User
+
+# операция -> (метод, шаблон маршрута) для счётчика SQL-запросов
+ROUTES = {
+    "issue": ("POST", "/borrow/"),
+    "return": ("PUT", "/borrow/return"),
+    "list": ("GET", "/books/"),
+    "login": ("POST", "/login"),
+}
+
+CHUNK = 1000
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown operation: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def insert_returning_ids(db, model, rows: list[dict]) -> list[int]:
+    ids = []
+    for start in range(0, len(rows), CHUNK):
+        ids += db.scalars(
+            insert(model).returning(model.id), rows[start : start + CHUNK]
+        ).all()
+    return ids
+
+
+# библиотекарь с настоящим bcrypt-хешем, книги, читатели и история выдач
+# у всех читателей изначально нет книг на руках
+def seed(args, rng: random.Random) -> tuple[User, str, list[int], list[int]]:
+    Base.metadata.create_all(engine)
+    run = uuid.uuid4().hex[:8]
+    password = "bench-password"
+    db = SessionLocal()
+    try:
+        user = User(email=f"bench_{run}@library.com")
+        user.hashed_password = hash_password(password)
+        db.add(user)
+        db.commit()
+
+        book_ids = insert_returning_ids(
+            db,
+            Book,
+            [
+                {
+                    "title": f"Bench {run} {i}",
+                    "author": f"Author {i % 100}",
+                    "year": 1900 + i % 120,
+                    "total_copies": args.copies,
+                    "available_copies": args.copies,
+                }
+                for i in range(args.books)
+            ],
+        )
+        reader_ids = insert_returning_ids(
+            db,
+            Reader,
+            [
+                {"name": f"Reader {i}", "email": f"reader_{run}_{i}@example.com"}
+                for i in range(args.readers)
+            ],
+        )
+        now = datetime.now()
+        loans = []
+        for _ in range(args.loans):
+            borrowed = now - timedelta(days=rng.randint(15, 365))
+            loans.append(
+                {
+                    "book_id": rng.choice(book_ids),
+                    "reader_id": rng.choice(reader_ids),
+                    "user_id": user.id,
+                    "borrow_date": borrowed,
+                    "return_date": borrowed + timedelta(days=rng.randint(1, 14)),
+                }
+            )
+        for start in range(0, len(loans), CHUNK):
+            db.execute(insert(BorrowedBook), loans[start : start + CHUNK])
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+    finally:
+        db.close()
+    return user, password, book_ids, reader_ids
+
+
+class Worker:
+    def __init__(self, client, headers, credentials, book_ids, reader_ids, rng):
+        self.client = client
+        self.headers = headers
+        self.credentials = credentials
+        self.book_ids = book_ids
+        # свои читатели у каждого клиента, чтобы клиенты не мешали друг другу
+        self.loans = {reader_id: [] for reader_id in reader_ids}
+        self.rng = rng
+
+    async def issue(self):
+        free = [r for r, loans in self.loans.items() if len(loans) < MAX_ACTIVE_LOANS]
+        if not free:
+            return await self.return_book()
+        reader_id, book_id = self.rng.choice(free), self.rng.choice(self.book_ids)
+        response = await self.client.post(
+            "/borrow/",
+            params={"book_id": book_id, "reader_id": reader_id},
+            headers=self.headers,
+        )
+        if response.status_code == 201:
+            self.loans[reader_id].append((response.json()["id"], book_id))
+        return "issue", response
+
+    async def return_book(self):
+        busy = [r for r, loans in self.loans.items() if loans]
+        if not busy:
+            return await self.issue()
+        reader_id = self.rng.choice(busy)
+        loan_id, book_id = self.loans[reader_id].pop()
+        response = await self.client.put(
+            "/borrow/return",
+            json={"reader_id": reader_id, "book_id": book_id, "bbook_id": loan_id},
+            headers=self.headers,
+        )
+        return "return", response
+
+    async def list_books(self):
+        response = await self.client.get(
+            "/books/",
+            params={"skip": self.rng.randrange(len(self.book_ids)), "limit": 20},
+            headers=self.headers,
+        )
+        return "list", response
+
+    async def login(self):
+        response = await self.client.post("/login", json=self.credentials)
+        # как и настоящий клиент, после 503 ждем Retry-After
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+        return "login", response
+
+    async def run(self, mix: dict, stop: asyncio.Event, results: dict):
+        operations = {
+            "issue": self.issue,
+            "return": self.return_book,
+            "list": self.list_books,
+            "login": self.login,
+        }
+        names, weights = list(mix), list(mix.values())
+        while not stop.is_set():
+            start = time.perf_counter()
+            name, response = await operations[self.rng.choices(names, weights)[0]]()
+            result = results.setdefault(name, {"latencies": [], "statuses": {}})
+            result["latencies"].append(time.perf_counter() - start)
+            statuses = result["statuses"]
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def run_phase(middleware, workers, mix, duration) -> dict:
+    middleware.registry = MetricsRegistry()
+    stop, results = asyncio.Event(), {}
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(w.run(mix, stop, results)) for w in workers]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    operations = {}
+    for name, result in sorted(results.items()):
+        key = ROUTES[name]
+        statements = middleware.registry.sql_statements.get(key)
+        sql_time = middleware.registry.sql_time.get(key)
+        operations[name] = {
+            **summary(result["latencies"]),
+            "rps": round(len(result["latencies"]) / elapsed, 1),
+            "statuses": {str(c): n for c, n in sorted(result["statuses"].items())},
+            "queries_per_request": (
+                round(statements.sum / statements.count, 2) if statements else 0.0
+            ),
+            "sql_ms_per_request": (
+                round(sql_time.sum / sql_time.count * 1000, 2) if sql_time else 0.0
+            ),
+        }
+    total = sum(len(r["latencies"]) for r in results.values())
+    return {
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "operations": operations,
+    }
+
+
+# отношение метрик к результату другого запуска (>1 - стало больше)
+def compare(result: dict, baseline: dict) -> dict:
+    def ratio(new, old):
+        return round(new / old, 3) if old else None
+
+    comparison = {"rps": ratio(result["rps"], baseline["rps"]), "operations": {}}
+    for name, current in result["operations"].items():
+        previous = baseline["operations"].get(name)
+        if previous is None:
+            continue
+        comparison["operations"][name] = {
+            "rps": ratio(current["rps"], previous["rps"]),
+            "p50_ms": ratio(current["p50_ms"], previous["p50_ms"]),
+            "p99_ms": ratio(current["p99_ms"], previous["p99_ms"]),
+            "queries_per_request": round(
+                current["queries_per_request"] - previous["queries_per_request"], 2
+            ),
+        }
+    return comparison
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> dict:
+    rng = random.Random(args.seed)
+    user, password, book_ids, reader_ids = seed(args, rng)
+    credentials = {"email": user.email, "password": password}
+    headers = {"Authorization": f"Bearer {create_user_token(user)}"}
+
+    # SQL-запросы считаются тем же механизмом, что и для /metrics,
+    # но в отдельный реестр и независимо от METRICS_ENABLED
+    middleware = MetricsMiddleware(app, MetricsRegistry())
+    instrumentation = EngineInstrumentation(float("inf"))
+    app_engine = database.engine
+    if database.async_engine is not None:
+        app_engine = database.async_engine.sync_engine
+    instrumentation.attach(app_engine)
+
+    try:
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            workers = [
+                Worker(
+                    client,
+                    headers,
+                    credentials,
+                    book_ids,
+                    reader_ids[i :: args.concurrency],
+                    random.Random(args.seed + i + 1),
+                )
+                for i in range(args.concurrency)
+            ]
+            if args.warmup:
+                await run_phase(middleware, workers, args.mix, args.warmup)
+            result = await run_phase(middleware, workers, args.mix, args.duration)
+    finally:
+        instrumentation.detach(app_engine)
+
+    result = {
+        "commit": current_commit(),
+        "database": engine.dialect.name,
+        "async_db": database.async_engine is not None,
+        "config": {
+            "books": args.books,
+            "readers": args.readers,
+            "loans": args.loans,
+            "copies": args.copies,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "seed": args.seed,
+        },
+        **result,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["comparison"] = compare(result, json.load(f))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест горячего пути: выдача, возврат, список книг и логин."
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="секунд")
+    parser.add_argument("--warmup", type=float, default=1.0, help="секунд")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--readers", type=int, default=500)
+    parser.add_argument("--loans", type=int, default=10000)
+    parser.add_argument("--copies", type=int, default=100)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default="issue=4,return=4,list=10,login=1",
+        help="веса операций: issue, return, list, login",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить результат в файл")
+    parser.add_argument("--baseline", help="результат для сравнения")
+    args = parser.parse_args()
+    if args.readers < args.concurrency:
+        parser.error("--readers must be at least --concurrency")
+    result = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
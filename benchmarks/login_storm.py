@@ -0,0 +1,109 @@
+# Задержка GET /books/ во время всплеска логинов.
+#
+# Приложение запускается в том же процессе (httpx + ASGITransport) на базе
+# из DATABASE_URL. Сначала измеряется задержка /books/ без нагрузки, затем
+# под параллельным потоком /login. Результат выводится в JSON.
+#
+#   python -m benchmarks.login_storm --duration 5 --storm-concurrency 32
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+import httpx
+from benchmarks.common import summary
+from app.auth import create_access_token, hash_password, hashing_pool
+from app.database import SessionLocal, engine
+from app.main import app
+from app.models import Base, Book, User
+
+
+# библиотекарь с настоящим bcrypt-хешем и немного книг
+def seed(books: int) -> tuple[str, str]:
+    Base.metadata.create_all(engine)
+    email, password = f"bench_{uuid.uuid4().hex[:8]}@library.com", "bench-password"
+    db = SessionLocal()
+    try:
+        db.add(User(email=email, hashed_password=hash_password(password)))
+        missing = books - db.query(Book).count()
+        db.add_all(
+            Book(title=f"Bench {i}", author="Bench", total_copies=1)
+            for i in range(missing)
+        )
+        db.commit()
+    finally:
+        db.close()
+    return email, password
+
+
+async def read_books(client, headers, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/books/", params={"limit": 20}, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+
+async def login(client, credentials, stop: asyncio.Event, results: dict):
+    while not stop.is_set():
+        response = await client.post("/login", json=credentials)
+        results[response.status_code] = results.get(response.status_code, 0) + 1
+        # как и настоящий клиент, после 503 ждем Retry-After
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+async def run_phase(client, headers, credentials, args, storm: bool) -> dict:
+    stop = asyncio.Event()
+    latencies, logins = [], {}
+    tasks = [
+        asyncio.create_task(read_books(client, headers, stop, latencies))
+        for _ in range(args.readers)
+    ]
+    if storm:
+        tasks += [
+            asyncio.create_task(login(client, credentials, stop, logins))
+            for _ in range(args.storm_concurrency)
+        ]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    result = {"books": summary(latencies)}
+    if storm:
+        result["logins"] = {str(code): count for code, count in logins.items()}
+    return result
+
+
+async def main(args) -> dict:
+    email, password = seed(args.books)
+    credentials = {"email": email, "password": password}
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        baseline = await run_phase(client, headers, credentials, args, storm=False)
+        storm = await run_phase(client, headers, credentials, args, storm=True)
+
+    return {
+        "baseline": baseline,
+        "login_storm": storm,
+        "p99_ratio": round(
+            storm["books"]["p99_ms"] / max(baseline["books"]["p99_ms"], 0.001), 2
+        ),
+        "hashing_pool": hashing_pool.stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Задержка GET /books/ во время всплеска логинов."
+    )
+    parser.add_argument("--duration", type=float, default=5.0, help="секунд на фазу")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--storm-concurrency", type=int, default=32)
+    parser.add_argument("--books", type=int, default=100)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
@@ -0,0 +1,131 @@
+# Сериализация страницы из 100 выдач (list[BorrowedBookResponse]) без HTTP и БД.
+#
+# ORM-объекты собираются в памяти, затем сравниваются пути, которыми
+# ответ может попасть в JSON:
+#   dict_json   - модель -> dict -> стандартный json (обычный JSONResponse)
+#   dict_orjson - модель -> dict -> orjson (ORJSONResponse)
+#   dump_json   - модель -> JSON сразу в ядре Pydantic; так FastAPI отдает
+#                 ответы с response_model, если у маршрута нет своего
+#                 response_class
+# Валидация из ORM (from_attributes) во всех путях одинаковая и выводится
+# отдельно, в том числе для прежних схем, где email в ответе проверялся
+# как EmailStr. Результат выводится в JSON.
+#
+#   python -m benchmarks.serialization --rows 100 --repeat 7
+
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+from pydantic import EmailStr, TypeAdapter
+from app import schemas as s
+from app.models import Book, BorrowedBook, Reader, User
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# схемы ответа с прежней проверкой email
+class EmailStrUserResponse(s.UserResponse):
+    email: EmailStr
+
+
+class EmailStrReaderResponse(s.ReaderResponse):
+    email: EmailStr
+
+
+class EmailStrBorrowedBookResponse(s.BorrowedBookResponse):
+    reader: EmailStrReaderResponse
+    user: EmailStrUserResponse
+
+
+def make_rows(count: int) -> list[BorrowedBook]:
+    user = User(id=1, email="librarian@library.com", hashed_password="x")
+    now = datetime(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        book = Book(
+            id=i + 1,
+            title=f"Book {i}",
+            author=f"Author {i % 10}",
+            year=2000 + i % 20,
+            isbn=9780000000000 + i,
+            total_copies=5,
+            available_copies=4,
+            rating_sum=9,
+            rating_count=2,
+        )
+        reader = Reader(id=i + 1, name=f"Reader {i}", email=f"reader{i}@example.com")
+        rows.append(
+            BorrowedBook(
+                id=i + 1,
+                borrow_date=now + timedelta(hours=i),
+                return_date=None if i % 3 else now + timedelta(days=i),
+                book_id=book.id,
+                reader_id=reader.id,
+                user_id=user.id,
+                book=book,
+                reader=reader,
+                user=user,
+            )
+        )
+    return rows
+
+
+def best_us(fn, number: int, repeat: int) -> float:
+    return round(min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6, 1)
+
+
+def main(args) -> dict:
+    adapter = TypeAdapter(list[s.BorrowedBookResponse])
+    rows = make_rows(args.rows)
+    models = adapter.validate_python(rows)
+
+    paths = {
+        "dict_json": lambda: json.dumps(adapter.dump_python(models, mode="json")),
+        "dump_json": lambda: adapter.dump_json(models),
+    }
+    if orjson is not None:
+        paths["dict_orjson"] = lambda: orjson.dumps(
+            adapter.dump_python(models, mode="json")
+        )
+
+    # все пути дают один и тот же JSON
+    expected = json.loads(adapter.dump_json(models))
+    for fn in paths.values():
+        assert json.loads(fn()) == expected
+
+    validate_us = best_us(
+        lambda: adapter.validate_python(rows), args.number, args.repeat
+    )
+    email_str_adapter = TypeAdapter(list[EmailStrBorrowedBookResponse])
+    result = {
+        "rows": args.rows,
+        "validate_us": validate_us,
+        "validate_email_str_us": best_us(
+            lambda: email_str_adapter.validate_python(rows), args.number, args.repeat
+        ),
+        "paths": {},
+    }
+    for name, fn in paths.items():
+        serialize_us = best_us(fn, args.number, args.repeat)
+        result["paths"][name] = {
+            "serialize_us": serialize_us,
+            "total_us": round(validate_us + serialize_us, 1),
+        }
+    baseline = result["paths"]["dict_json"]["total_us"]
+    for path in result["paths"].values():
+        path["speedup"] = round(baseline / path["total_us"], 2)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Сериализация страницы выдач без HTTP и БД."
+    )
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--number", type=int, default=200, help="вызовов на замер")
+    parser.add_argument("--repeat", type=int, default=7)
+    print(json.dumps(main(parser.parse_args()), indent=2))
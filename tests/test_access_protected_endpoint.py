@@ -33,7 +33,7 @@ def mock_data(db):
     db.refresh(user)
 
     # создаем тестовую книгу
-    book = Book(title="Test Book", author="Author", copies=5)
+    book = Book(title="Test Book", author="Author", total_copies=5)
     db.add(book)
     db.commit()
     db.refresh(book)
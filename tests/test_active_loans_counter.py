@@ -0,0 +1,148 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import IntegrityError
+from app.main import app
+from app.models import MAX_ACTIVE_LOANS, User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app.crud import crud_borrowed_books, crud_readers
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря, книги и двух читателей
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    books = [Book(title=f"Book {i}", author="Author", total_copies=5) for i in range(4)]
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(2)
+    ]
+    db.add_all([user] + books + readers)
+    db.commit()
+
+    token = create_access_token(data={"sub": user.email})
+    headers = {"Authorization": f"Bearer {token}"}
+    return (
+        user.id,
+        [book.id for book in books],
+        [reader.id for reader in readers],
+        headers,
+    )
+
+
+def active_loans(db, reader_id):
+    db.expire_all()
+    return db.query(Reader).filter(Reader.id == reader_id).first().active_loans
+
+
+def test_counter_follows_issue_and_return(db, mock_data):
+    user_id, book_ids, reader_ids, headers = mock_data
+    loans = [
+        crud_borrowed_books.issue_book(db, book_id, reader_ids[0], user_id)
+        for book_id in book_ids[:3]
+    ]
+    assert active_loans(db, reader_ids[0]) == 3
+
+    with pytest.raises(HTTPException) as error:
+        crud_borrowed_books.issue_book(db, book_ids[3], reader_ids[0], user_id)
+    assert error.value.detail == "Reader has already borrowed 3 books"
+    assert active_loans(db, reader_ids[0]) == 3
+
+    crud_borrowed_books.return_book(db, reader_ids[0], book_ids[0], loans[0].id)
+    assert active_loans(db, reader_ids[0]) == 2
+
+    crud_borrowed_books.return_books(db, reader_ids[0], [loan.id for loan in loans[1:]])
+    assert active_loans(db, reader_ids[0]) == 0
+
+
+def test_batch_checkout_updates_counter(db, mock_data):
+    user_id, book_ids, reader_ids, headers = mock_data
+    results = crud_borrowed_books.issue_books(db, reader_ids[0], book_ids, user_id)
+    assert [r["ok"] for r in results] == [True, True, True, False]
+    assert active_loans(db, reader_ids[0]) == 3
+
+
+def test_check_constraint_rejects_invalid_counter(db, mock_data):
+    user_id, book_ids, reader_ids, headers = mock_data
+    reader = db.query(Reader).filter(Reader.id == reader_ids[0]).first()
+    reader.active_loans = -1
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+
+def test_readers_at_limit(db, mock_data):
+    user_id, book_ids, reader_ids, headers = mock_data
+    crud_borrowed_books.issue_books(db, reader_ids[0], book_ids[:3], user_id)
+    crud_borrowed_books.issue_book(db, book_ids[0], reader_ids[1], user_id)
+
+    response = client.get("/readers/", params={"at_limit": True}, headers=headers)
+    assert response.status_code == 200
+    assert [reader["id"] for reader in response.json()] == [reader_ids[0]]
+
+
+def test_reconcile_active_loans(db, mock_data):
+    user_id, book_ids, reader_ids, headers = mock_data
+    crud_borrowed_books.issue_book(db, book_ids[0], reader_ids[0], user_id)
+
+    # выдача, записанная в обход API, и испорченный счётчик
+    db.add(BorrowedBook(book_id=book_ids[1], reader_id=reader_ids[1], user_id=user_id))
+    db.query(Reader).filter(Reader.id == reader_ids[0]).update({"active_loans": 2})
+    db.commit()
+
+    mismatches = crud_readers.reconcile_active_loans(db, dry_run=True)
+    assert mismatches == [
+        {"reader_id": reader_ids[0], "stored": 2, "actual": 1},
+        {"reader_id": reader_ids[1], "stored": 0, "actual": 1},
+    ]
+    assert active_loans(db, reader_ids[0]) == 2
+
+    assert len(crud_readers.reconcile_active_loans(db)) == 2
+    assert active_loans(db, reader_ids[0]) == 1
+    assert active_loans(db, reader_ids[1]) == 1
+    assert crud_readers.reconcile_active_loans(db) == []
+
+
+# открытых выдач больше лимита: счётчик не может превысить MAX_ACTIVE_LOANS,
+# поэтому ставится в лимит, а читатель отмечается в результате
+def test_reconcile_clamps_readers_over_limit(db, mock_data):
+    user_id, book_ids, reader_ids, headers = mock_data
+    db.add_all(
+        BorrowedBook(book_id=book_id, reader_id=reader_ids[0], user_id=user_id)
+        for book_id in book_ids
+    )
+    db.add(BorrowedBook(book_id=book_ids[0], reader_id=reader_ids[1], user_id=user_id))
+    db.commit()
+
+    mismatches = crud_readers.reconcile_active_loans(db)
+    assert mismatches == [
+        {"reader_id": reader_ids[0], "stored": 0, "actual": 4, "over_limit": True},
+        {"reader_id": reader_ids[1], "stored": 0, "actual": 1},
+    ]
+    assert active_loans(db, reader_ids[0]) == MAX_ACTIVE_LOANS
+    assert active_loans(db, reader_ids[1]) == 1
+
+    # пока выдачи не вернут, читатель остается в отчете
+    assert crud_readers.reconcile_active_loans(db) == [
+        {"reader_id": reader_ids[0], "stored": 3, "actual": 4, "over_limit": True}
+    ]
@@ -0,0 +1,185 @@
+import pytest
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app import database
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря, книги и двух читателей
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    books = [Book(title=f"Book {i}", author="Author", total_copies=2) for i in range(4)]
+    books.append(Book(title="Unavailable", author="Author", total_copies=0))
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(2)
+    ]
+    db.add_all([user] + books + readers)
+    db.commit()
+
+    token = create_access_token(data={"sub": user.email})
+    headers = {"Authorization": f"Bearer {token}"}
+    return [book.id for book in books], [reader.id for reader in readers], headers
+
+
+# считаем SQL-запросы и коммиты движка, с которым работает приложение
+@contextmanager
+def count_statements():
+    statements = []
+    engine = database.engine
+    if database.async_engine is not None:
+        engine = database.async_engine.sync_engine
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def commit(conn):
+        statements.append("COMMIT")
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "commit", commit)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(engine, "commit", commit)
+
+
+def checkout(reader_id, book_ids, headers):
+    response = client.post(
+        "/borrow/batch",
+        json={"reader_id": reader_id, "book_ids": book_ids},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_batch_checkout_with_per_item_results(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+
+    with count_statements() as statements:
+        results = checkout(reader_ids[0], [book_ids[0], book_ids[4], 999999], headers)
+
+    assert [r["ok"] for r in results] == [True, False, False]
+    assert results[0]["borrowed_book"]["book"]["available_copies"] == 1
+    assert results[1]["detail"] == "No available copies"
+    assert results[2]["detail"] == "Book not found"
+    # одна транзакция на весь пакет
+    assert statements.count("COMMIT") == 1
+
+
+def test_batch_checkout_applies_limit_across_batch(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+    checkout(reader_ids[0], [book_ids[0]], headers)
+
+    results = checkout(reader_ids[0], book_ids[1:4], headers)
+    assert [r["ok"] for r in results] == [True, True, False]
+    assert results[2]["detail"] == "Reader has already borrowed 3 books"
+
+    # не выданная книга не списана
+    response = client.get(f"/books/{book_ids[3]}", headers=headers)
+    assert response.json()["available_copies"] == 2
+
+
+def test_batch_checkout_counts_copies_within_batch(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+
+    # у книги два экземпляра, третий запрос на нее в пакете отклоняется
+    results = checkout(reader_ids[0], [book_ids[0]] * 3, headers)
+    assert [r["ok"] for r in results] == [True, True, False]
+    assert results[2]["detail"] == "No available copies"
+
+
+# строки книг блокируются раньше строки читателя, как и в одиночной выдаче
+def test_batch_checkout_locks_books_before_reader(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+
+    with count_statements() as statements:
+        checkout(reader_ids[0], [book_ids[1], book_ids[0]], headers)
+
+    def first(table):
+        return next(i for i, sql in enumerate(statements) if f"FROM {table}" in sql)
+
+    assert first("books") < first("readers")
+    with count_statements() as statements:
+        client.post(
+            "/borrow/",
+            params={"book_id": book_ids[2], "reader_id": reader_ids[0]},
+            headers=headers,
+        )
+    tables = [sql.split()[1] for sql in statements if sql.startswith("UPDATE")]
+    assert tables[:2] == ["books", "readers"]
+
+
+def test_batch_checkout_unknown_reader(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+    response = client.post(
+        "/borrow/batch",
+        json={"reader_id": 999999, "book_ids": book_ids[:1]},
+        headers=headers,
+    )
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Reader not found"}
+
+
+def test_batch_return(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+    loans = [
+        r["borrowed_book"]["id"] for r in checkout(reader_ids[0], book_ids[:2], headers)
+    ]
+    other = checkout(reader_ids[1], book_ids[:1], headers)[0]["borrowed_book"]["id"]
+
+    with count_statements() as statements:
+        response = client.put(
+            "/borrow/return/batch",
+            json={"reader_id": reader_ids[0], "bbook_ids": loans + [other, loans[0]]},
+            headers=headers,
+        )
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["ok"] for r in results] == [True, True, False, False]
+    assert results[0]["borrowed_book"]["return_date"] is not None
+    assert results[2]["detail"] == "This book was not borrowed by this reader"
+    assert results[3]["detail"] == "Book already returned"
+    assert statements.count("COMMIT") == 1
+
+    # экземпляры вернулись на полку
+    response = client.get(f"/books/{book_ids[0]}", headers=headers)
+    assert response.json()["available_copies"] == 1
+    response = client.get(f"/books/{book_ids[1]}", headers=headers)
+    assert response.json()["available_copies"] == 2
+
+
+def test_batch_request_must_not_be_empty(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+    response = client.post(
+        "/borrow/batch",
+        json={"reader_id": reader_ids[0], "book_ids": []},
+        headers=headers,
+    )
+    assert response.status_code == 422
@@ -0,0 +1,256 @@
+import io
+import json
+import pytest
+from datetime import datetime
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app import schemas as s
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app.book_import import import_books
+from app.crud import crud_borrowed_books
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря, книги и читателя, выдаем две книги
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    books = [
+        Book(title=f"Book {i}", author="Author", isbn=str(100 + i), total_copies=3)
+        for i in range(3)
+    ]
+    reader = Reader(name="Reader", email=f"reader_{uuid.uuid4()}@example.com")
+    db.add_all([user, reader] + books)
+    db.commit()
+    crud_borrowed_books.issue_books(db, reader.id, [books[0].id] * 2, user.id)
+
+    token = create_access_token(data={"sub": user.email})
+    headers = {"Authorization": f"Bearer {token}"}
+    return [book.id for book in books], headers
+
+
+def test_new_book_is_fully_available(db, mock_data):
+    book_ids, headers = mock_data
+    book = {"title": "New", "author": "Author", "total_copies": 4}
+    response = client.post("/books/", json=book, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["total_copies"] == response.json()["available_copies"] == 4
+
+
+def test_availability_for_many_books(db, mock_data):
+    book_ids, headers = mock_data
+    response = client.get(
+        "/books/availability",
+        params={"ids": [book_ids[1], book_ids[0], 999999]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": book_ids[0], "total_copies": 3, "available_copies": 1},
+        {"id": book_ids[1], "total_copies": 3, "available_copies": 3},
+    ]
+
+
+def test_update_total_keeps_loans(db, mock_data):
+    book_ids, headers = mock_data
+    book = {"title": "Book 0", "author": "Author", "total_copies": 5}
+    response = client.put(f"/books/{book_ids[0]}", json=book, headers=headers)
+    assert response.status_code == 200
+    # две книги на руках, поэтому на полке 5 - 2
+    assert response.json()["available_copies"] == 3
+
+
+def test_total_cannot_drop_below_loans(db, mock_data):
+    book_ids, headers = mock_data
+    book = {"title": "Book 0", "author": "Author", "total_copies": 1}
+    response = client.put(f"/books/{book_ids[0]}", json=book, headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {
+        "detail": "total_copies is less than the number of copies on loan"
+    }
+
+    response = client.get(f"/books/{book_ids[0]}", headers=headers)
+    assert response.json()["total_copies"] == 3
+
+
+# ошибка уникальности isbn не выдаётся за нехватку экземпляров
+def test_update_with_duplicate_isbn(db, mock_data):
+    book_ids, headers = mock_data
+    book = {"title": "Book 1", "author": "Author", "isbn": 100, "total_copies": 3}
+    response = client.put(f"/books/{book_ids[1]}", json=book, headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Book with this isbn already exists"}
+
+    response = client.get(f"/books/{book_ids[1]}", headers=headers)
+    assert response.json()["isbn"] == 101
+
+
+def test_import_keeps_loans(db, mock_data):
+    book_ids, headers = mock_data
+    rows = [
+        {"title": "Book 0", "author": "Author", "isbn": 100, "total_copies": 4},
+        {"title": "Book 1", "author": "Author", "isbn": 101, "total_copies": 1},
+    ]
+    stream = io.StringIO("\n".join(json.dumps(row) for row in rows))
+    import_books(db, stream, "ndjson")
+
+    db.expire_all()
+    copies = {
+        book.id: (book.total_copies, book.available_copies) for book in db.query(Book)
+    }
+    assert copies[book_ids[0]] == (4, 2)
+    assert copies[book_ids[1]] == (1, 1)
+
+
+def available(db, book_id):
+    db.expire_all()
+    return db.get(Book, book_id).available_copies
+
+
+def loan_body(loan, **changes):
+    body = {
+        "borrow_date": loan.borrow_date.isoformat(),
+        "return_date": None,
+        "book_id": loan.book_id,
+        "reader_id": loan.reader_id,
+        "user_id": loan.user_id,
+    }
+    return {**body, **changes}
+
+
+@pytest.fixture
+def single_copy_loan(db, mock_data):
+    # книга в одном экземпляре, выданная читателю
+    book = Book(title="Single", author="Author", total_copies=1)
+    db.add(book)
+    db.commit()
+    user = db.query(User).first()
+    reader = db.query(Reader).first()
+    loan = crud_borrowed_books.issue_book(db, book.id, reader.id, user.id)
+    return loan, mock_data[1]
+
+
+def test_update_return_date_returns_copy(db, single_copy_loan):
+    loan, headers = single_copy_loan
+    # кеш книги заполнен до изменения выдачи
+    client.get(f"/books/{loan.book_id}", headers=headers)
+
+    body = loan_body(loan, return_date=loan.borrow_date.isoformat())
+    response = client.put(f"/borrow/{loan.id}", json=body, headers=headers)
+    assert response.status_code == 200
+    assert available(db, loan.book_id) == 1
+    response = client.get(f"/books/{loan.book_id}", headers=headers)
+    assert response.json()["available_copies"] == 1
+
+    response = client.post(
+        "/borrow/",
+        params={"book_id": loan.book_id, "reader_id": loan.reader_id},
+        headers=headers,
+    )
+    assert response.status_code == 201
+
+
+# в частичном обновлении непереданные книга и читатель не меняются
+def test_partial_update_returns_copy(db, single_copy_loan):
+    loan, headers = single_copy_loan
+    reader = db.get(Reader, loan.reader_id)
+    active_loans = reader.active_loans
+
+    body = {"return_date": loan.borrow_date.isoformat()}
+    response = client.put(f"/borrow/{loan.id}", json=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["book"]["id"] == loan.book_id
+    assert response.json()["reader"]["id"] == loan.reader_id
+    assert available(db, loan.book_id) == 1
+    assert db.get(Reader, loan.reader_id).active_loans == active_loans - 1
+
+
+def test_clear_return_date_takes_copy(db, single_copy_loan):
+    loan, headers = single_copy_loan
+    crud_borrowed_books.return_book(db, loan.reader_id, loan.book_id, loan.id)
+    assert available(db, loan.book_id) == 1
+
+    response = client.put(f"/borrow/{loan.id}", json=loan_body(loan), headers=headers)
+    assert response.status_code == 200
+    assert available(db, loan.book_id) == 0
+
+    # второй закрытой выдаче той же книги экземпляра уже не хватит
+    other = BorrowedBook(
+        book_id=loan.book_id,
+        reader_id=loan.reader_id,
+        user_id=loan.user_id,
+        borrow_date=loan.borrow_date,
+        return_date=loan.borrow_date,
+    )
+    db.add(other)
+    db.commit()
+    response = client.put(f"/borrow/{other.id}", json=loan_body(other), headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "No available copies"
+    db.expire_all()
+    assert db.get(BorrowedBook, other.id).return_date is not None
+
+
+def test_update_book_id_moves_copy(db, mock_data, single_copy_loan):
+    loan, headers = single_copy_loan
+    book_ids = mock_data[0]
+    body = loan_body(loan, book_id=book_ids[1])
+    response = client.put(f"/borrow/{loan.id}", json=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["book"]["id"] == book_ids[1]
+    assert available(db, loan.book_id) == 1
+    assert available(db, book_ids[1]) == 2
+
+    # открытая выдача переезжает дальше: экземпляр возвращается на полку
+    body = loan_body(loan, book_id=book_ids[0])
+    response = client.put(f"/borrow/{loan.id}", json=body, headers=headers)
+    assert response.status_code == 200
+    assert available(db, book_ids[1]) == 3
+    assert available(db, book_ids[0]) == 0
+
+
+def test_create_borrowed_book_takes_copy(db, mock_data):
+    book_ids, headers = mock_data
+    user = db.query(User).first()
+    reader = Reader(name="Other", email=f"reader_{uuid.uuid4()}@example.com")
+    db.add(reader)
+    db.commit()
+    data = {
+        "borrow_date": None,
+        "book_id": book_ids[0],
+        "reader_id": reader.id,
+        "user_id": user.id,
+    }
+    crud_borrowed_books.create_borrowed_book(db, s.BorrowedBookCreate(**data))
+    assert available(db, book_ids[0]) == 0
+
+    # закрытая выдача экземпляр не забирает
+    closed = {**data, "return_date": datetime.utcnow()}
+    crud_borrowed_books.create_borrowed_book(db, s.BorrowedBookCreate(**closed))
+    assert available(db, book_ids[0]) == 0
+
+    with pytest.raises(HTTPException) as error:
+        crud_borrowed_books.create_borrowed_book(db, s.BorrowedBookCreate(**data))
+    assert error.value.detail == "No available copies"
+    assert available(db, book_ids[0]) == 0
@@ -0,0 +1,142 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import User, Book, BorrowedBook
+from app.auth import create_access_token
+from app.database import SessionLocal
+from app.pagination import encode_cursor
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def headers(db):
+    # создаем тестового библиотекаря
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    db.add(user)
+
+    # книги двух авторов, одна без года, одной нет на полке
+    db.add_all(
+        [
+            Book(title="War and Peace", author="Tolstoy", year=1869, total_copies=2),
+            Book(title="Anna Karenina", author="Tolstoy", year=1878, total_copies=1),
+            Book(title="Resurrection", author="Tolstoy", year=1899, total_copies=0),
+            Book(title="Hadji Murad", author="Tolstoy", total_copies=1),
+            Book(title="The Idiot", author="Dostoevsky", year=1869, total_copies=1),
+            Book(title="Demons", author="Dostoevsky", year=1872, total_copies=3),
+        ]
+    )
+    db.commit()
+    token = create_access_token(data={"sub": user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def titles(params, headers):
+    response = client.get("/books/", params=params, headers=headers)
+    assert response.status_code == 200
+    return [book["title"] for book in response.json()]
+
+
+# проходим по всем страницам, следуя за курсором
+def walk(params, headers, limit):
+    result, after = [], None
+    while True:
+        page = {**params, "limit": limit}
+        if after:
+            page["after"] = after
+        response = client.get("/books/", params=page, headers=headers)
+        if response.status_code == 404:
+            break
+        assert response.status_code == 200
+        result += [book["title"] for book in response.json()]
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+    return result
+
+
+def test_filters_are_combined(headers):
+    assert titles({"author": "Tolstoy", "year_from": 1870}, headers) == [
+        "Anna Karenina",
+        "Resurrection",
+    ]
+    assert titles({"year_from": 1869, "year_to": 1872, "sort": "title"}, headers) == [
+        "Demons",
+        "The Idiot",
+        "War and Peace",
+    ]
+    assert titles({"author": "Tolstoy", "available": True}, headers) == [
+        "War and Peace",
+        "Anna Karenina",
+        "Hadji Murad",
+    ]
+    assert titles({"available": False}, headers) == ["Resurrection"]
+
+
+def test_sort_descending_puts_missing_year_first(headers):
+    assert titles({"author": "Tolstoy", "sort": "-year"}, headers) == [
+        "Hadji Murad",
+        "Resurrection",
+        "Anna Karenina",
+        "War and Peace",
+    ]
+
+
+@pytest.mark.parametrize("sort", ["title", "-title", "year", "-year", "-id"])
+def test_walk_sorted_books_with_cursor(db, headers, sort):
+    expected = titles({"sort": sort}, headers)
+    assert len(expected) == 6
+    assert walk({"sort": sort}, headers, limit=2) == expected
+
+
+def test_walk_filtered_books_with_cursor(headers):
+    params = {"author": "Tolstoy", "available": True, "sort": "year"}
+    assert walk(params, headers, limit=1) == [
+        "War and Peace",
+        "Anna Karenina",
+        "Hadji Murad",
+    ]
+
+
+# значение в курсоре должно совпадать по типу с колонкой сортировки
+@pytest.mark.parametrize(
+    "sort, value",
+    [("year", "1869"), ("-year", 1869.5), ("title", ["War"]), ("author", 7)],
+)
+def test_cursor_with_wrong_value_type_is_rejected(headers, sort, value):
+    params = {"sort": sort, "after": encode_cursor(value, 1)}
+    response = client.get("/books/", params=params, headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_unknown_sort_column_is_rejected(headers):
+    response = client.get("/books/", params={"sort": "description"}, headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid sort column: description"}
+
+
+def test_etag_depends_on_filters(headers):
+    first = client.get("/books/", params={"author": "Tolstoy"}, headers=headers)
+    response = client.get(
+        "/books/",
+        params={"author": "Dostoevsky"},
+        headers={**headers, "If-None-Match": first.headers["ETag"]},
+    )
+    assert response.status_code == 200
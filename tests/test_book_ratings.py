@@ -0,0 +1,183 @@
+import pytest
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook, BookRating
+from app.auth import create_access_token
+from app.crud import crud_books, crud_borrowed_books
+from app.database import SessionLocal, engine
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BookRating).delete()  # Удалить оценки
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем библиотекаря, две книги и трех читателей
+    # читатели 0 и 1 вернули первую книгу, читатель 2 держит ее на руках
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    books = [Book(title=f"Book {i}", author="Author", total_copies=5) for i in range(2)]
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(3)
+    ]
+    db.add_all([user] + books + readers)
+    db.commit()
+
+    for reader in readers:
+        loan = crud_borrowed_books.issue_book(db, books[0].id, reader.id, user.id)
+        if reader is not readers[2]:
+            crud_borrowed_books.return_book(db, reader.id, books[0].id, loan.id)
+
+    token = create_access_token(data={"sub": user.email})
+    headers = {"Authorization": f"Bearer {token}"}
+    return [b.id for b in books], [r.id for r in readers], headers
+
+
+def rate(book_id, reader_id, rating, headers):
+    return client.put(
+        f"/books/{book_id}/rating",
+        json={"reader_id": reader_id, "rating": rating},
+        headers=headers,
+    )
+
+
+def test_rating_updates_book_aggregates(mock_data):
+    book_ids, reader_ids, headers = mock_data
+    response = client.get(f"/books/{book_ids[0]}", headers=headers)
+    assert response.json()["rating_count"] == 0
+    assert response.json()["rating_average"] is None
+
+    response = rate(book_ids[0], reader_ids[0], 5, headers)
+    assert response.status_code == 200
+    response = rate(book_ids[0], reader_ids[1], 4, headers)
+    assert response.status_code == 200
+    assert response.json()["rating_count"] == 2
+    assert response.json()["rating_average"] == 4.5
+    assert "rating_sum" not in response.json()
+
+    # кеш книги сброшен
+    response = client.get(f"/books/{book_ids[0]}", headers=headers)
+    assert response.json()["rating_average"] == 4.5
+
+
+def test_rerating_replaces_previous_rating(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+    rate(book_ids[0], reader_ids[0], 5, headers)
+    response = rate(book_ids[0], reader_ids[0], 2, headers)
+    assert response.status_code == 200
+    assert response.json()["rating_count"] == 1
+    assert response.json()["rating_average"] == 2.0
+
+    book = db.get(Book, book_ids[0])
+    assert (book.rating_sum, book.rating_count) == (2, 1)
+    assert db.query(BookRating).count() == 1
+
+
+def test_only_returned_books_can_be_rated(mock_data):
+    book_ids, reader_ids, headers = mock_data
+    # книга на руках
+    response = rate(book_ids[0], reader_ids[2], 5, headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Reader has not returned this book"
+    # книгу не брал
+    response = rate(book_ids[1], reader_ids[0], 5, headers)
+    assert response.status_code == 400
+
+    response = rate(999999, reader_ids[0], 5, headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("rating", [0, 6])
+def test_rating_out_of_range(mock_data, rating):
+    book_ids, reader_ids, headers = mock_data
+    response = rate(book_ids[0], reader_ids[0], rating, headers)
+    assert response.status_code == 422
+
+
+def test_top_rated_books(db, mock_data):
+    book_ids, reader_ids, headers = mock_data
+    extra = [
+        Book(
+            title="Rated", author="Author", total_copies=1, rating_sum=9, rating_count=3
+        ),
+        Book(
+            title="Best", author="Author", total_copies=1, rating_sum=5, rating_count=1
+        ),
+    ]
+    db.add_all(extra)
+    db.commit()
+    rate(book_ids[0], reader_ids[0], 4, headers)
+    rate(book_ids[0], reader_ids[1], 5, headers)
+
+    response = client.get("/books/top-rated", headers=headers)
+    assert response.status_code == 200
+    # книга без оценок в список не попадает
+    assert [b["id"] for b in response.json()] == [extra[1].id, book_ids[0], extra[0].id]
+
+    response = client.get("/books/top-rated?min_ratings=2&limit=1", headers=headers)
+    assert [b["id"] for b in response.json()] == [book_ids[0]]
+
+
+# перехватываем SQL-запросы к books
+@contextmanager
+def capture_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if "FROM books" in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+# список лучших книг читается по индексу без сортировки каталога
+def test_top_rated_uses_rating_index(db, mock_data):
+    db.add_all(
+        Book(
+            title=f"Book {i}",
+            author="Author",
+            total_copies=1,
+            rating_sum=i % 11,
+            rating_count=i % 3,
+        )
+        for i in range(200)
+    )
+    db.commit()
+    with capture_queries() as statements:
+        crud_books.get_top_rated_books(db, limit=10)
+    assert len(statements) == 1
+
+    statement, parameters = statements[0]
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        else:
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        plan = "\n".join(str(row[-1]) for row in rows)
+        conn.rollback()
+    assert "ix_books_rating_average" in plan, plan
+    assert "TEMP B-TREE" not in plan and "Sort" not in plan, plan
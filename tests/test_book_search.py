@@ -0,0 +1,71 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import User, Book, BorrowedBook
+from app.auth import create_access_token
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def headers(db):
+    # создаем тестового библиотекаря
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    db.add(user)
+
+    # создаем книги
+    db.add_all(
+        [
+            Book(title="War and Peace", author="Leo Tolstoy", total_copies=1),
+            Book(title="Anna Karenina", author="Leo Tolstoy", total_copies=1),
+            Book(
+                title="Crime and Punishment",
+                author="Fyodor Dostoevsky",
+                description="A novel about guilt in Saint Petersburg",
+                total_copies=1,
+            ),
+        ]
+    )
+    db.commit()
+    token = create_access_token(data={"sub": user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def search(q, headers):
+    response = client.get("/books/search", params={"q": q}, headers=headers)
+    assert response.status_code == 200
+    return [book["title"] for book in response.json()]
+
+
+def test_search_by_title(db, headers):
+    assert search("peace", headers) == ["War and Peace"]
+
+
+def test_search_by_author(db, headers):
+    assert sorted(search("Tolstoy", headers)) == ["Anna Karenina", "War and Peace"]
+
+
+def test_search_by_description(db, headers):
+    assert search("Petersburg", headers) == ["Crime and Punishment"]
+
+
+def test_search_requires_query(db, headers):
+    response = client.get("/books/search", params={"q": ""}, headers=headers)
+    assert response.status_code == 422
@@ -0,0 +1,140 @@
+import pytest
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.models import User, Book, BorrowedBook
+from app.crud import crud_books
+from app.database import SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем книги разных авторов и лет, часть без года и без экземпляров на полке
+    # id заданы явно, чтобы курсоры в тестах попадали в середину выборки
+    db.add_all(
+        Book(
+            id=i + 1,
+            title=f"Book {i}",
+            author=f"Author {i % 10}",
+            year=None if i % 4 == 0 else 1900 + i % 50,
+            total_copies=i % 3,
+        )
+        for i in range(200)
+    )
+    db.commit()
+    # планы PostgreSQL не должны зависеть от предыдущих тестов и от того,
+    # успел ли autovacuum собрать статистику
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM ANALYZE books")
+
+
+# перехватываем SQL-запросы к books
+@contextmanager
+def capture_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if "FROM books" in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+# план запроса в виде текста
+# в PostgreSQL отключаем seq scan, чтобы на маленькой таблице
+# проверить, что индекс вообще может быть использован
+def explain(statement, parameters):
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        else:
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        plan = "\n".join(str(row[-1]) for row in rows)
+        conn.rollback()
+    return plan
+
+
+# таблица books читается только через индекс (или один из индексов)
+# seek - колонка (или колонки через |), по которой индекс читается с нужного
+# места (SEARCH в SQLite, Index Cond в PostgreSQL), а не просматривается целиком
+def assert_index_scan(statements, index, seek=None):
+    indexes = "|".join((index,) if isinstance(index, str) else index)
+    assert statements
+    for statement, parameters in statements:
+        plan = explain(statement, parameters)
+        if engine.dialect.name == "postgresql":
+            assert "Seq Scan on books" not in plan, plan
+            assert re.search(indexes, plan), plan
+            if seek is not None:
+                assert re.search(rf"Index Cond: .*\b({seek})\b", plan), plan
+        else:
+            assert re.search(r"(SCAN|SEARCH) books USING (COVERING )?INDEX ", plan)
+            assert not re.search(r"SCAN books$", plan, re.M), plan
+            assert re.search(indexes, plan), plan
+            if seek is not None:
+                pattern = rf"SEARCH books USING (COVERING )?INDEX ({indexes}) \(.*\b({seek})[<>=]"
+                assert re.search(pattern, plan), plan
+
+
+@pytest.mark.parametrize(
+    "filters, index, seek",
+    [
+        ({"author": "Author 1"}, "ix_books_author_year", "author"),
+        ({"author": "Author 1", "year_from": 1910}, "ix_books_author_year", "author"),
+        ({"author": "Author 1", "sort": "-year"}, "ix_books_author_year", "author"),
+        ({"year_from": 1910, "year_to": 1920}, "ix_books_year_id", "year"),
+        ({"year_from": 1910, "sort": "year"}, "ix_books_year_id", "year"),
+        ({"available": True}, "ix_books_available_id", None),
+        (
+            {"available": True, "sort": "-id", "after": (50,)},
+            "ix_books_available_id",
+            "id",
+        ),
+        ({"sort": "title"}, "ix_books_title_id", None),
+        # курсор по колонке сортировки: чтение с позиции курсора, а не с начала
+        ({"sort": "title", "after": ("Book 5", 5)}, "ix_books_title_id", "title"),
+        ({"sort": "-title", "after": ("Book 5", 5)}, "ix_books_title_id", "title"),
+        (
+            {"sort": "author", "after": ("Author 5", 5)},
+            "ix_books_author_year",
+            "author",
+        ),
+        ({"sort": "year", "after": (1910, 10)}, "ix_books_year_id", "year"),
+        ({"sort": "-year", "after": (1910, 10)}, "ix_books_year_id", "year"),
+        # курсор в хвосте из NULL: PostgreSQL не выводит порядок индекса
+        # из IS NULL и может читать эти строки по индексу id с позиции курсора
+        (
+            {"sort": "year", "after": (None, 50)},
+            ("ix_books_year_id", "books_pkey", "ix_books_id"),
+            "year|id",
+        ),
+        (
+            {"sort": "-year", "after": (None, 150)},
+            ("ix_books_year_id", "books_pkey", "ix_books_id"),
+            "year|id",
+        ),
+    ],
+)
+def test_catalogue_filters_use_index(db, mock_data, filters, index, seek):
+    with capture_queries() as statements:
+        crud_books.get_all_books(db, limit=20, **filters)
+    assert_index_scan(statements, index, seek)
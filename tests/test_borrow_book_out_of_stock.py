@@ -35,7 +35,7 @@ def mock_data(db):
     db.refresh(user)
 
     # создаем книгу с 0 копиями
-    book = Book(title="Test Book", author="Author", copies=0)
+    book = Book(title="Test Book", author="Author", total_copies=0)
     db.add(book)
     db.commit()
     db.refresh(book)
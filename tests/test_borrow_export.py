@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def headers(db):
+    # создаем тестового библиотекаря, книгу и читателя
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    book = Book(title="Test Book", author="Author", isbn="42", total_copies=5)
+    reader = Reader(name="Reader Name", email=f"reader_{uuid.uuid4()}@example.com")
+    db.add_all([user, book, reader])
+    db.commit()
+
+    # история выдач за три месяца
+    for month in (1, 2, 3):
+        db.add(
+            BorrowedBook(
+                book_id=book.id,
+                reader_id=reader.id,
+                user_id=user.id,
+                borrow_date=datetime(2025, month, 10),
+                return_date=datetime(2025, month, 20),
+            )
+        )
+    db.commit()
+
+    token = create_access_token(data={"sub": user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_export_ndjson(db, headers):
+    response = client.get("/borrow/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 3
+    assert rows[0]["book_title"] == "Test Book"
+    assert rows[0]["reader_name"] == "Reader Name"
+    assert rows[0]["borrow_date"].startswith("2025-01-10")
+
+
+def test_export_csv_with_date_range(db, headers):
+    response = client.get(
+        "/borrow/export",
+        params={"format": "csv", "date_from": "2025-02-01", "date_to": "2025-03-01"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 1
+    assert rows[0]["borrow_date"].startswith("2025-02-10")
+    assert rows[0]["book_isbn"] == "42"
+
+
+def test_export_unknown_format(db, headers):
+    response = client.get("/borrow/export", params={"format": "xml"}, headers=headers)
+    assert response.status_code == 422
@@ -33,7 +33,7 @@ def mock_data(db):
     db.refresh(user)
 
     # создаем книгу
-    book = Book(title="Test Book", author="Author", copies=5)
+    book = Book(title="Test Book", author="Author", total_copies=5)
     db.add(book)
     db.commit()
     db.refresh(book)
@@ -51,7 +51,9 @@ def test_borrow_fourth_book(db, mock_data):
     user, book, reader = mock_data
 
     # 1. Имитация добавления книги в БД
-    book_create = BookCreate(title=book.title, author=book.author, copies=book.copies)
+    book_create = BookCreate(
+        title=book.title, author=book.author, total_copies=book.total_copies
+    )
     crud_books.create_book(db, book_create)
     crud_borrowed_books.issue_book(db, book.id, reader.id, user.id)
     crud_borrowed_books.issue_book(db, book.id, reader.id, user.id)
@@ -0,0 +1,87 @@
+import pytest
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app.crud import crud_borrowed_books
+from app.database import SessionLocal, engine
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    # создаем книги и читателей, каждому читателю выдаем по 2 разные книги
+    books = [
+        Book(title=f"Book {i}", author="Author", total_copies=5) for i in range(10)
+    ]
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(5)
+    ]
+    db.add_all(books + readers)
+    db.commit()
+    for i, reader in enumerate(readers):
+        crud_borrowed_books.issue_book(db, books[2 * i].id, reader.id, user.id)
+        crud_borrowed_books.issue_book(db, books[2 * i + 1].id, reader.id, user.id)
+
+    token = create_access_token(data={"sub": user.email})
+    return {"Authorization": f"Bearer {token}"}, readers[0].id
+
+
+# считаем SQL-запросы, отправленные в базу внутри блока
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+# один запрос на пользователя из токена и один на сами записи
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/borrow/",
+        "/borrow/reader/{reader_id}/all",
+        "/borrow/reader/{reader_id}/unreturn",
+    ],
+)
+def test_borrowed_books_listing_query_count(db, mock_data, url):
+    headers, reader_id = mock_data
+    with count_queries() as statements:
+        response = client.get(url.format(reader_id=reader_id), headers=headers)
+    assert response.status_code == 200
+    assert len(response.json()) > 0
+    assert len(statements) <= 2, statements
@@ -0,0 +1,122 @@
+import pytest
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.models import User, Book, Reader, BorrowedBook
+from app.crud import crud_borrowed_books
+from app.database import SessionLocal, engine
+import uuid
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря, книги и читателей
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    books = [
+        Book(title=f"Book {i}", author="Author", total_copies=50) for i in range(5)
+    ]
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(20)
+    ]
+    db.add_all([user] + books + readers)
+    db.commit()
+    for i, reader in enumerate(readers):
+        crud_borrowed_books.issue_book(db, books[i % 5].id, reader.id, user.id)
+    return user.id, books[0].id, readers[0].id
+
+
+# перехватываем SQL-запросы к borrowed_books с фильтром по читателю или книге
+# (выборка по первичному ключу нас здесь не интересует)
+@contextmanager
+def capture_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        where = statement.partition("WHERE")[2]
+        if "FROM borrowed_books" in statement and (
+            "borrowed_books.reader_id =" in where or "borrowed_books.book_id =" in where
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+# план запроса в виде текста
+# в PostgreSQL отключаем seq scan, чтобы на маленькой таблице
+# проверить, что индекс вообще может быть использован
+def explain(statement, parameters):
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        else:
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        plan = "\n".join(str(row[-1]) for row in rows)
+        conn.rollback()
+    return plan
+
+
+def assert_index_scan(statements):
+    assert statements
+    for statement, parameters in statements:
+        plan = explain(statement, parameters)
+        if engine.dialect.name == "postgresql":
+            assert "Seq Scan on borrowed_books" not in plan, plan
+            assert "ix_borrowed_books_" in plan, plan
+        else:
+            assert "SCAN borrowed_books" not in plan, plan
+            assert re.search(
+                r"SEARCH borrowed_books USING (COVERING )?INDEX ix_borrowed_books_",
+                plan,
+            ), plan
+
+
+def test_unreturned_books_by_reader_uses_index(db, mock_data):
+    user_id, book_id, reader_id = mock_data
+    with capture_queries() as statements:
+        crud_borrowed_books.get_unreturned_books_by_reader(db, reader_id)
+    assert_index_scan(statements)
+
+
+def test_all_borrowed_books_by_reader_uses_index(db, mock_data):
+    user_id, book_id, reader_id = mock_data
+    with capture_queries() as statements:
+        crud_borrowed_books.get_all_borrowed_books_by_reader(db, reader_id)
+    assert_index_scan(statements)
+
+
+# лимит проверяется по счётчику readers.active_loans,
+# выдачи читателя при этом не читаются вовсе
+def test_issue_book_loan_limit_check_does_not_read_loans(db, mock_data):
+    user_id, book_id, reader_id = mock_data
+    with capture_queries() as statements:
+        crud_borrowed_books.issue_book(db, book_id, reader_id, user_id)
+    assert statements == []
+
+
+def test_loans_by_book_use_index(db, mock_data):
+    user_id, book_id, reader_id = mock_data
+    with capture_queries() as statements:
+        db.query(BorrowedBook).filter(BorrowedBook.book_id == book_id).all()
+    assert_index_scan(statements)
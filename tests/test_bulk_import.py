@@ -0,0 +1,124 @@
+import io
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import User, Book, BorrowedBook
+from app.auth import create_access_token
+from app.book_import import import_books
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def headers(db):
+    # создаем тестового библиотекаря
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    db.add(user)
+    db.commit()
+    token = create_access_token(data={"sub": user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+CSV_FILE = (
+    "title,author,year,isbn,total_copies\n"
+    "First,Author A,2001,1001,2\n"
+    "Second,Author B,,1002,1\n"
+    "Broken,Author C,not-a-year,1003,1\n"
+    "No ISBN,Author D,1999,,4\n"
+)
+
+
+def test_import_csv(db, headers):
+    # книга с isbn 1001 уже есть, импорт должен ее обновить
+    db.add(Book(title="Old title", author="Old", isbn="1001", total_copies=1))
+    db.commit()
+
+    response = client.post(
+        "/books/import",
+        files={"file": ("books.csv", CSV_FILE, "text/csv")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["total"] == 4
+    assert report["imported"] == 3
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 4
+    assert "year" in report["errors"][0]["error"]
+
+    db.expire_all()
+    assert db.query(Book).count() == 3
+    updated = db.query(Book).filter(Book.isbn == "1001").one()
+    assert (updated.title, updated.total_copies) == ("First", 2)
+
+
+def test_import_ndjson_in_chunks(db):
+    lines = [
+        json.dumps({"title": f"Book {i}", "author": "A", "isbn": i}) for i in range(7)
+    ]
+    lines.insert(3, "{not json")
+    lines.append(json.dumps({"title": "Book 0 again", "author": "A", "isbn": 0}))
+
+    report = import_books(db, io.StringIO("\n".join(lines)), "ndjson", chunk_size=2)
+
+    assert report["total"] == 9
+    assert report["imported"] == 8
+    assert report["errors"] == [{"row": 4, "error": report["errors"][0]["error"]}]
+    assert db.query(Book).count() == 7
+    assert db.query(Book).filter(Book.isbn == "0").one().title == "Book 0 again"
+
+
+# строки, которые не были записаны, не считаются импортированными
+def test_import_reports_skipped_rows(db, headers):
+    # у книги с isbn 1 два экземпляра на руках
+    db.add(
+        Book(title="On loan", author="A", isbn="1", total_copies=3, available_copies=1)
+    )
+    db.commit()
+    rows = [
+        {"title": "Dup", "author": "A", "isbn": 2},
+        {"title": "Less copies", "author": "A", "isbn": 1, "total_copies": 1},
+        {"title": "Dup again", "author": "A", "isbn": 2},
+        {"title": "No isbn", "author": "A"},
+    ]
+    stream = io.StringIO("\n".join(json.dumps(row) for row in rows))
+    report = import_books(db, stream, "ndjson")
+
+    assert report["total"] == 4
+    assert report["imported"] == 2
+    assert report["failed"] == 2
+    assert report["errors"] == [
+        {"row": 1, "error": "Duplicate isbn 2: replaced by row 3"},
+        {"row": 2, "error": "total_copies is less than the number of copies on loan"},
+    ]
+    db.expire_all()
+    assert db.query(Book).filter(Book.isbn == "1").one().total_copies == 3
+    assert db.query(Book).filter(Book.isbn == "2").one().title == "Dup again"
+
+
+def test_import_unknown_format(db, headers):
+    response = client.post(
+        "/books/import",
+        files={"file": ("books.xml", "<books/>", "application/xml")},
+        headers=headers,
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unsupported import format"}
@@ -0,0 +1,199 @@
+import asyncio
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.models import CirculationStatsState, DailyCirculation
+from app.models import MonthlyBookCirculation, MonthlyReaderCirculation
+from app.analytics import rebuild_circulation_stats, refresh_circulation_stats
+from app import database
+from app.auth import create_access_token
+from app.crud import crud_stats
+from app.database import SessionLocal, engine
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        # очистить статистику
+        db.query(DailyCirculation).delete()
+        db.query(MonthlyBookCirculation).delete()
+        db.query(MonthlyReaderCirculation).delete()
+        db.query(CirculationStatsState).delete()
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+def loan(book, reader, user, borrowed, returned=None):
+    return BorrowedBook(
+        book_id=book.id,
+        reader_id=reader.id,
+        user_id=user.id,
+        borrow_date=datetime.fromisoformat(borrowed),
+        return_date=datetime.fromisoformat(returned) if returned else None,
+    )
+
+
+@pytest.fixture
+def mock_data(db):
+    # история выдач за март 2024: книгу 0 брали трижды, книгу 1 - дважды
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    books = [Book(title=f"Book {i}", author="Author", total_copies=5) for i in range(3)]
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(2)
+    ]
+    db.add_all([user] + books + readers)
+    db.commit()
+    db.add_all(
+        [
+            loan(books[0], readers[0], user, "2024-03-01 10:00", "2024-03-05 10:00"),
+            loan(books[0], readers[1], user, "2024-03-01 12:00", "2024-03-02 09:00"),
+            loan(books[1], readers[0], user, "2024-03-02 10:00", "2024-03-05 11:00"),
+            loan(books[0], readers[0], user, "2024-03-10 10:00"),
+            loan(books[1], readers[0], user, "2024-03-10 11:00"),
+            loan(books[2], readers[1], user, "2024-02-20 10:00", "2024-03-02 10:00"),
+        ]
+    )
+    db.commit()
+    token = create_access_token(data={"sub": user.email})
+    return books, readers, user, {"Authorization": f"Bearer {token}"}
+
+
+def refresh(batch_size=1000):
+    return asyncio.run(refresh_circulation_stats(batch_size))
+
+
+def top_books(headers, month="2024-03"):
+    response = client.get("/stats/top-books", params={"month": month}, headers=headers)
+    assert response.status_code == 200
+    return [(book["title"], book["issues"]) for book in response.json()]
+
+
+def daily(headers, date_from="2024-03-01", date_to="2024-03-05"):
+    response = client.get(
+        "/stats/daily",
+        params={"date_from": date_from, "date_to": date_to},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return [(day["issued"], day["returned"]) for day in response.json()]
+
+
+def test_rows_are_counted_one_refresh_later(db, mock_data):
+    books, readers, user, headers = mock_data
+    # первый пересчет только запоминает границы
+    assert refresh() == {"issued": 0, "returned": 0}
+    assert top_books(headers) == []
+    assert refresh() == {"issued": 6, "returned": 4}
+
+    assert top_books(headers) == [("Book 0", 3), ("Book 1", 2)]
+    assert top_books(headers, month="2024-02") == [("Book 2", 1)]
+    response = client.get(
+        "/stats/top-readers", params={"month": "2024-03"}, headers=headers
+    )
+    assert [(r["name"], r["issues"]) for r in response.json()] == [
+        ("Reader 0", 4),
+        ("Reader 1", 1),
+    ]
+    # дни без движения заполняются нулями
+    assert daily(headers) == [(2, 0), (1, 2), (0, 0), (0, 0), (0, 2)]
+
+
+def test_refresh_is_incremental(db, mock_data):
+    books, readers, user, headers = mock_data
+    refresh()
+    refresh()
+
+    # новая выдача и возврат одной из открытых выдач сегодня
+    db.add(loan(books[2], readers[1], user, "2024-03-03 10:00"))
+    open_loan = db.query(BorrowedBook).filter(BorrowedBook.return_date.is_(None))[0]
+    open_loan.return_date = datetime.utcnow()
+    db.commit()
+
+    refresh()
+    assert refresh() == {"issued": 1, "returned": 1}
+    assert refresh() == {"issued": 0, "returned": 0}
+    assert top_books(headers) == [("Book 0", 3), ("Book 1", 2), ("Book 2", 1)]
+    assert daily(headers) == [(2, 0), (1, 2), (1, 0), (0, 0), (0, 2)]
+    today = datetime.utcnow().date().isoformat()
+    assert daily(headers, today, today) == [(0, 1)]
+
+
+def test_batches_and_rebuild_give_same_result(db, mock_data):
+    books, readers, user, headers = mock_data
+    commits = []
+
+    def commit(conn):
+        commits.append(1)
+
+    app_engine = database.engine
+    if database.async_engine is not None:
+        app_engine = database.async_engine.sync_engine
+    event.listen(app_engine, "commit", commit)
+    try:
+        refresh(batch_size=2)
+        assert refresh(batch_size=2) == {"issued": 6, "returned": 4}
+    finally:
+        event.remove(app_engine, "commit", commit)
+    # каждая порция - своя транзакция
+    assert len(commits) > 6
+    expected = top_books(headers), daily(headers)
+
+    assert asyncio.run(rebuild_circulation_stats(batch_size=3)) == {
+        "issued": 6,
+        "returned": 4,
+    }
+    assert (top_books(headers), daily(headers)) == expected
+
+
+def test_invalid_parameters(db, mock_data):
+    books, readers, user, headers = mock_data
+    response = client.get("/stats/top-books", params={"month": "март"}, headers=headers)
+    assert response.status_code == 400
+    response = client.get(
+        "/stats/daily",
+        params={"date_from": "2023-01-01", "date_to": "2024-03-01"},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+
+def test_top_books_reads_index(db, mock_data):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if "FROM monthly_book_circulation" in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        crud_stats.get_top_books(db, datetime(2024, 3, 1).date(), limit=10)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    statement, parameters = statements[0]
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        else:
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        plan = "\n".join(str(row[-1]) for row in rows)
+        conn.rollback()
+    assert "ix_monthly_book_circulation_top" in plan, plan
+    assert "TEMP B-TREE" not in plan and "Sort" not in plan, plan
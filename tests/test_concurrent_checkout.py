@@ -0,0 +1,98 @@
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from app.models import User, Book, Reader, BorrowedBook
+from app.crud import crud_borrowed_books
+from app.database import SessionLocal
+import uuid
+
+THREADS = 16
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def user(db):
+    # создаем тестового библиотекаря
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def create_readers(db, count):
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(count)
+    ]
+    db.add_all(readers)
+    db.commit()
+    return [reader.id for reader in readers]
+
+
+# запускаем выдачи одновременно, каждую в своей сессии
+# возвращает количество успешных выдач
+def issue_concurrently(requests):
+    barrier = threading.Barrier(len(requests))
+
+    def issue(args):
+        book_id, reader_id, user_id = args
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            crud_borrowed_books.issue_book(session, book_id, reader_id, user_id)
+            return True
+        except HTTPException:
+            return False
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+        return sum(pool.map(issue, requests))
+
+
+def test_no_oversell_under_concurrent_checkouts(db, user):
+    book = Book(title="Hot Book", author="Author", total_copies=5)
+    db.add(book)
+    db.commit()
+    reader_ids = create_readers(db, THREADS)
+
+    issued = issue_concurrently([(book.id, rid, user.id) for rid in reader_ids])
+
+    db.expire_all()
+    assert issued == 5
+    assert db.get(Book, book.id).available_copies == 0
+    assert db.query(BorrowedBook).filter_by(book_id=book.id).count() == 5
+
+
+def test_reader_limit_under_concurrent_checkouts(db, user):
+    books = [
+        Book(title=f"Book {i}", author="Author", total_copies=5) for i in range(THREADS)
+    ]
+    db.add_all(books)
+    db.commit()
+    (reader_id,) = create_readers(db, 1)
+
+    issued = issue_concurrently([(book.id, reader_id, user.id) for book in books])
+
+    db.expire_all()
+    assert issued == 3
+    assert db.query(BorrowedBook).filter_by(reader_id=reader_id).count() == 3
+    # книги, которые не удалось выдать, остались на полке
+    assert sum(book.available_copies for book in db.query(Book)) == 5 * THREADS - 3
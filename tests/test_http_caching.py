@@ -0,0 +1,121 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app.crud import crud_borrowed_books
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря, книги и читателя
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    books = [Book(title=f"Book {i}", author="Author", total_copies=5) for i in range(3)]
+    reader = Reader(name="Reader", email=f"reader_{uuid.uuid4()}@example.com")
+    db.add_all([user, reader] + books)
+    db.commit()
+
+    token = create_access_token(data={"sub": user.email})
+    headers = {"Authorization": f"Bearer {token}"}
+    return user.id, books[0].id, reader.id, headers
+
+
+# повторный запрос с ETag из первого ответа
+def revalidate(url, headers):
+    first = client.get(url, headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert etag.startswith('"') and first.headers["Cache-Control"].startswith("private")
+    second = client.get(url, headers={**headers, "If-None-Match": etag})
+    return etag, second
+
+
+@pytest.mark.parametrize("url", ["/books/{book_id}", "/books/", "/readers/{reader_id}"])
+def test_unchanged_resource_returns_304(db, mock_data, url):
+    user_id, book_id, reader_id, headers = mock_data
+    url = url.format(book_id=book_id, reader_id=reader_id)
+
+    etag, response = revalidate(url, headers)
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_book_update_changes_etag(db, mock_data):
+    user_id, book_id, reader_id, headers = mock_data
+    etag, response = revalidate(f"/books/{book_id}", headers)
+
+    book = {"title": "New title", "author": "Author", "total_copies": 5}
+    assert (
+        client.put(f"/books/{book_id}", json=book, headers=headers).status_code == 200
+    )
+
+    response = client.get(
+        f"/books/{book_id}", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == "New title"
+    assert response.headers["ETag"] != etag
+
+
+def test_checkout_changes_book_and_list_etag(db, mock_data):
+    user_id, book_id, reader_id, headers = mock_data
+    book_etag, _ = revalidate(f"/books/{book_id}", headers)
+    list_etag, _ = revalidate("/books/", headers)
+
+    # выдача меняет available_copies, поэтому меняется и версия книги
+    crud_borrowed_books.issue_book(db, book_id, reader_id, user_id)
+
+    response = client.get(
+        f"/books/{book_id}", headers={**headers, "If-None-Match": book_etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["available_copies"] == 4
+    response = client.get("/books/", headers={**headers, "If-None-Match": list_etag})
+    assert response.status_code == 200
+
+
+def test_reader_update_changes_etag(db, mock_data):
+    user_id, book_id, reader_id, headers = mock_data
+    etag, _ = revalidate(f"/readers/{reader_id}", headers)
+
+    reader = {"name": "Renamed", "email": f"reader_{uuid.uuid4()}@example.com"}
+    response = client.put(f"/readers/{reader_id}", json=reader, headers=headers)
+    assert response.status_code == 200
+
+    response = client.get(
+        f"/readers/{reader_id}", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["name"] == "Renamed"
+
+
+def test_weak_and_listed_etags_match(db, mock_data):
+    user_id, book_id, reader_id, headers = mock_data
+    etag, _ = revalidate(f"/books/{book_id}", headers)
+
+    response = client.get(
+        f"/books/{book_id}",
+        headers={**headers, "If-None-Match": f'"other", W/{etag}'},
+    )
+    assert response.status_code == 304
@@ -0,0 +1,105 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app.crud import crud_borrowed_books
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    # создаем 7 книг
+    books = [Book(title=f"Book {i}", author="Author", total_copies=5) for i in range(7)]
+    db.add_all(books)
+    db.commit()
+
+    # создаем читателей и выдаем каждому по две книги
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(3)
+    ]
+    db.add_all(readers)
+    db.commit()
+    for reader in readers:
+        crud_borrowed_books.issue_book(db, books[0].id, reader.id, user.id)
+        crud_borrowed_books.issue_book(db, books[1].id, reader.id, user.id)
+
+    token = create_access_token(data={"sub": user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+# проходим по всем страницам, следуя за курсором
+def walk(url, headers, limit):
+    ids, after = [], None
+    while True:
+        params = {"limit": limit}
+        if after:
+            params["after"] = after
+        response = client.get(url, params=params, headers=headers)
+        if response.status_code == 404:
+            break
+        assert response.status_code == 200
+        ids += [item["id"] for item in response.json()]
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+    return ids
+
+
+def test_walk_books_with_cursor(db, mock_data):
+    expected = [book.id for book in db.query(Book).order_by(Book.id)]
+    assert walk("/books/", mock_data, limit=3) == expected
+
+
+def test_walk_readers_with_cursor(db, mock_data):
+    expected = [reader.id for reader in db.query(Reader).order_by(Reader.id)]
+    assert walk("/readers/", mock_data, limit=2) == expected
+
+
+def test_walk_borrowed_books_with_cursor(db, mock_data):
+    expected = [
+        bbook.id
+        for bbook in db.query(BorrowedBook).order_by(
+            BorrowedBook.borrow_date, BorrowedBook.id
+        )
+    ]
+    assert walk("/borrow/", mock_data, limit=4) == expected
+
+
+def test_skip_limit_still_works(db, mock_data):
+    response = client.get("/books/", params={"skip": 5, "limit": 5}, headers=mock_data)
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_invalid_cursor(db, mock_data):
+    response = client.get("/books/", params={"after": "garbage"}, headers=mock_data)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
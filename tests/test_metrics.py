@@ -0,0 +1,157 @@
+import logging
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from fastapi.testclient import TestClient
+from app import main
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app import database
+from app.core.config import settings
+from app.core.metrics import EngineInstrumentation, MetricsMiddleware
+from app.core.metrics import MetricsRegistry, RequestStats, request_stats
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+# тесты не зависят от METRICS_ENABLED в окружении: подключенные в app.main
+# middleware и подписка на движок на время теста снимаются,
+# иначе запросы считались бы дважды
+@pytest.fixture(autouse=True)
+def global_metrics_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+    middleware = [m for m in app.user_middleware if m.cls is not MetricsMiddleware]
+    monkeypatch.setattr(app, "user_middleware", middleware)
+    monkeypatch.setattr(app, "middleware_stack", None)
+    instrumentation = getattr(main, "instrumentation", None)
+    engines = [database.engine]
+    if database.async_engine is not None:
+        engines.append(database.async_engine.sync_engine)
+    if instrumentation is not None:
+        for engine in engines:
+            instrumentation.detach(engine)
+    yield
+    if instrumentation is not None:
+        for engine in engines:
+            instrumentation.attach(engine)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря и книгу
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    book = Book(title="Book", author="Author", total_copies=1)
+    db.add_all([user, book])
+    db.commit()
+
+    token = create_access_token(data={"sub": user.email})
+    return book.id, {"Authorization": f"Bearer {token}"}
+
+
+# отдельный реестр и приложение, обернутое в middleware,
+# подписка на движок, с которым работает приложение
+@pytest.fixture
+def metrics(request):
+    registry = MetricsRegistry()
+    slow_query_ms = getattr(request, "param", 10_000)
+    instrumentation = EngineInstrumentation(slow_query_ms, registry)
+    engine = database.engine
+    if database.async_engine is not None:
+        engine = database.async_engine.sync_engine
+    instrumentation.attach(engine)
+    try:
+        yield registry, TestClient(MetricsMiddleware(app, registry))
+    finally:
+        instrumentation.detach(engine)
+
+
+def test_requests_are_labeled_by_route_template(mock_data, metrics):
+    book_id, headers = mock_data
+    registry, metrics_client = metrics
+    for _ in range(2):
+        response = metrics_client.get(f"/books/{book_id}", headers=headers)
+        assert response.status_code == 200
+    metrics_client.get("/books/999999", headers=headers)
+    metrics_client.get("/no-such-path")
+
+    assert registry.requests[("GET", "/books/{book_id}", 200)] == 2
+    assert registry.requests[("GET", "/books/{book_id}", 404)] == 1
+    assert registry.requests[("GET", "unmatched", 404)] == 1
+    assert registry.latency[("GET", "/books/{book_id}")].count == 3
+
+
+def test_sql_statements_are_counted_per_request(mock_data, metrics):
+    book_id, headers = mock_data
+    registry, metrics_client = metrics
+    response = metrics_client.get("/books/", headers=headers)
+    assert response.status_code == 200
+
+    statements = registry.sql_statements[("GET", "/books/")]
+    assert statements.count == 1
+    assert statements.sum >= 1
+    assert registry.sql_time[("GET", "/books/")].sum > 0
+
+
+@pytest.mark.parametrize("metrics", [0], indirect=True)
+def test_slow_queries_are_logged(mock_data, metrics, caplog):
+    book_id, headers = mock_data
+    registry, metrics_client = metrics
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        metrics_client.get("/books/", headers=headers)
+
+    assert registry.slow_queries >= 1
+    assert any("slow query" in r.getMessage() for r in caplog.records)
+
+
+# запрос с ошибкой не оставляет время начала на соединении
+# и не сбивает замер следующего запроса
+def test_failed_statement_does_not_leak_timing(db):
+    registry = MetricsRegistry()
+    instrumentation = EngineInstrumentation(10_000, registry)
+    instrumentation.attach(database.engine)
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    try:
+        with database.engine.connect() as conn:
+            with pytest.raises(DBAPIError):
+                conn.execute(text("SELECT * FROM no_such_table"))
+            conn.rollback()
+            conn.execute(text("SELECT 1"))
+            assert not conn.info.get("query_start")
+    finally:
+        request_stats.reset(token)
+        instrumentation.detach(database.engine)
+
+    assert stats.statements == 1
+    assert 0 < stats.sql_time < 1
+
+
+def test_metrics_endpoint(mock_data, monkeypatch):
+    response = client.get("/metrics")
+    assert response.status_code == 404
+
+    monkeypatch.setattr(settings, "METRICS_ENABLED", True)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert "db_slow_queries_total" in response.text
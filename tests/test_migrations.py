@@ -0,0 +1,108 @@
+import importlib.util
+import pathlib
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+VERSIONS = pathlib.Path(__file__).parent.parent / "alembic" / "versions"
+
+
+# модуль миграции по номеру ревизии
+def load_migration(revision: str):
+    (path,) = VERSIONS.glob(f"{revision}_*.py")
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# выполняет upgrade() одной миграции на соединении
+def upgrade(engine, revision: str) -> None:
+    module = load_migration(revision)
+    with engine.begin() as conn:
+        with Operations.context(MigrationContext.configure(conn)):
+            module.upgrade()
+
+
+# отдельная база SQLite со схемой до миграции (только нужные ей таблицы)
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migration.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE readers (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(
+            text(
+                "CREATE TABLE books (id INTEGER PRIMARY KEY, title TEXT, copies INTEGER)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE TABLE borrowed_books (id INTEGER PRIMARY KEY, "
+                "book_id INTEGER, reader_id INTEGER, return_date DATETIME)"
+            )
+        )
+    yield engine
+    engine.dispose()
+
+
+def add_loans(engine, book_id, reader_id, count, returned=False):
+    with engine.begin() as conn:
+        for _ in range(count):
+            conn.execute(
+                text(
+                    "INSERT INTO borrowed_books (book_id, reader_id, return_date) "
+                    "VALUES (:book_id, :reader_id, :return_date)"
+                ),
+                {
+                    "book_id": book_id,
+                    "reader_id": reader_id,
+                    "return_date": "2024-01-01" if returned else None,
+                },
+            )
+
+
+# у читателя 4 открытые выдачи: счётчик ставится в лимит, миграция проходит
+def test_active_loans_backfill_is_clamped(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO readers (id, name) VALUES (1, 'a'), (2, 'b')"))
+    add_loans(engine, 1, 1, 4)
+    add_loans(engine, 1, 2, 2)
+    add_loans(engine, 1, 2, 1, returned=True)
+
+    upgrade(engine, "e4a2c9b71f35")
+
+    with engine.connect() as conn:
+        counts = conn.execute(
+            text("SELECT id, active_loans FROM readers ORDER BY id")
+        ).all()
+    assert counts == [(1, 3), (2, 2)]
+    with pytest.raises(IntegrityError):
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE readers SET active_loans = 4 WHERE id = 1"))
+
+
+# отрицательный остаток после гонки при выдаче: на полке 0, всего = на руках
+def test_negative_copies_are_clamped_before_split(engine):
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO books (id, title, copies) "
+                "VALUES (1, 'a', -1), (2, 'b', 2), (3, 'c', NULL)"
+            )
+        )
+    add_loans(engine, 1, 1, 3)
+    add_loans(engine, 2, 1, 1)
+    add_loans(engine, 2, 1, 1, returned=True)
+
+    upgrade(engine, "b93d5f0e2c68")
+
+    with engine.connect() as conn:
+        copies = conn.execute(
+            text("SELECT id, available_copies, total_copies FROM books ORDER BY id")
+        ).all()
+    assert copies == [(1, 0, 3), (2, 2, 3), (3, 0, 0)]
+    with pytest.raises(IntegrityError):
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE books SET available_copies = 4 WHERE id = 2"))
@@ -0,0 +1,164 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app import database
+from app.core.config import settings
+from app.crud import crud_borrowed_books
+from app.database import SessionLocal, engine
+from app.overdue import scan_overdue_loans
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем библиотекаря, книгу и читателей с выдачами:
+    # 5 просроченных, 1 просроченная, но возвращенная, 1 со сроком в будущем
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    book = Book(title="Book", author="Author", total_copies=10)
+    readers = [
+        Reader(name=f"Reader {i}", email=f"reader_{uuid.uuid4()}@example.com")
+        for i in range(7)
+    ]
+    db.add_all([user, book] + readers)
+    db.commit()
+
+    now = datetime.utcnow()
+    loans = []
+    for i, reader in enumerate(readers):
+        loan = crud_borrowed_books.issue_book(db, book.id, reader.id, user.id)
+        loan.due_date = now - timedelta(days=10 - i) if i < 6 else now + timedelta(1)
+        loans.append(loan)
+    db.commit()
+    crud_borrowed_books.return_book(db, readers[5].id, book.id, loans[5].id)
+
+    token = create_access_token(data={"sub": user.email})
+    headers = {"Authorization": f"Bearer {token}"}
+    return [loan.id for loan in loans[:5]], headers
+
+
+def test_issue_sets_due_date(db, mock_data):
+    user = db.query(User).first()
+    book = db.query(Book).first()
+    reader = Reader(name="New", email=f"reader_{uuid.uuid4()}@example.com")
+    db.add(reader)
+    db.commit()
+    loan = crud_borrowed_books.issue_book(db, book.id, reader.id, user.id)
+    assert loan.due_date - loan.borrow_date == timedelta(days=settings.LOAN_PERIOD_DAYS)
+
+
+def test_overdue_endpoint(db, mock_data):
+    overdue_ids, headers = mock_data
+    response = client.get("/borrow/overdue", headers=headers)
+    assert response.status_code == 200
+    assert [loan["id"] for loan in response.json()] == overdue_ids
+
+
+def test_walk_overdue_with_cursor(db, mock_data):
+    overdue_ids, headers = mock_data
+    ids, after = [], None
+    while True:
+        params = {"limit": 2, **({"after": after} if after else {})}
+        response = client.get("/borrow/overdue", params=params, headers=headers)
+        assert response.status_code == 200
+        ids += [loan["id"] for loan in response.json()]
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+    assert ids == overdue_ids
+
+
+def test_scanner_flags_overdue_loans_in_batches(db, mock_data):
+    overdue_ids, headers = mock_data
+    commits = []
+
+    def commit(conn):
+        commits.append(1)
+
+    app_engine = database.engine
+    if database.async_engine is not None:
+        app_engine = database.async_engine.sync_engine
+    event.listen(app_engine, "commit", commit)
+    try:
+        assert asyncio.run(scan_overdue_loans(batch_size=2)) == 5
+    finally:
+        event.remove(app_engine, "commit", commit)
+    # каждая порция - отдельная транзакция: 2 + 2 + 1
+    assert len(commits) == 3
+
+    db.expire_all()
+    flagged = [
+        loan.id
+        for loan in db.query(BorrowedBook).filter(
+            BorrowedBook.overdue_flagged_at.is_not(None)
+        )
+    ]
+    assert sorted(flagged) == sorted(overdue_ids)
+
+    # повторный проход ничего не меняет
+    assert asyncio.run(scan_overdue_loans(batch_size=2)) == 0
+
+
+# перехватываем SQL-запросы к borrowed_books с фильтром по due_date
+def explain_overdue_queries(fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if "borrowed_books.due_date <" in statement and statement.startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    plans = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if engine.dialect.name == "postgresql":
+                conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+                rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+            else:
+                rows = conn.exec_driver_sql(
+                    "EXPLAIN QUERY PLAN " + statement, parameters
+                )
+            plans.append("\n".join(str(row[-1]) for row in rows))
+        conn.rollback()
+    return plans
+
+
+def test_overdue_queries_use_partial_index(db, mock_data):
+    now = datetime.utcnow()
+    plans = explain_overdue_queries(
+        lambda: (
+            crud_borrowed_books.get_overdue_books(db, now, limit=2),
+            crud_borrowed_books.get_overdue_books(db, now, limit=2, after=(now, 0)),
+            crud_borrowed_books.flag_overdue_books(db, now, limit=2),
+        )
+    )
+    assert len(plans) == 3
+    for plan in plans:
+        assert "ix_borrowed_books_open_due_date" in plan, plan
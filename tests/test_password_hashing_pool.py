@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import User, BorrowedBook
+from app.auth import hash_password, hashing_pool
+from app.core.hashing import BoundedExecutor, PoolBusyError
+from app.database import SessionLocal
+import threading
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()
+        db.query(User).delete()  # Удалить пользователей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def credentials(db):
+    # библиотекарь с настоящим bcrypt-хешем
+    email = f"test_{uuid.uuid4()}@library.com"
+    db.add(User(email=email, hashed_password=hash_password("secret")))
+    db.commit()
+    return {"email": email, "password": "secret"}
+
+
+def test_login_through_hashing_pool(db, credentials):
+    completed = hashing_pool.stats()["completed"]
+    response = client.post("/login", json=credentials)
+    assert response.status_code == 200
+    assert "access_token" in response.json()
+    assert hashing_pool.stats()["completed"] == completed + 1
+
+
+def test_login_rejected_when_pool_is_full(db, credentials, monkeypatch):
+    monkeypatch.setattr(hashing_pool, "max_pending", 0)
+    response = client.post("/login", json=credentials)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_bounded_executor_rejects_over_limit():
+    executor = BoundedExecutor(max_workers=1, max_pending=2, name="test")
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(PoolBusyError):
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert (stats["completed"], stats["rejected"], stats["pending"]) == (2, 1, 0)
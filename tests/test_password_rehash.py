@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from app.main import app
+from app.models import User, BorrowedBook
+from app.auth import hash_password, needs_rehash
+from app.core.config import settings
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()
+        db.query(User).delete()  # Удалить пользователей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+def add_user(db, hashed_password):
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password=hashed_password
+    )
+    db.add(user)
+    db.commit()
+    return user.id, user.email
+
+
+def stored_hash(db, user_id):
+    db.expire_all()
+    return db.query(User).filter(User.id == user_id).first().hashed_password
+
+
+def test_outdated_hash_is_rehashed_on_login(db):
+    # хеш с минимальной стоимостью, как после старой настройки
+    weak = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    assert needs_rehash(weak)
+    user_id, email = add_user(db, weak)
+
+    # фоновые задачи TestClient выполняет до возврата ответа
+    response = client.post("/login", json={"email": email, "password": "secret"})
+    assert response.status_code == 200
+
+    new_hash = stored_hash(db, user_id)
+    assert new_hash != weak
+    assert f"${settings.BCRYPT_ROUNDS:02d}$" in new_hash
+    assert not needs_rehash(new_hash)
+
+    # по новому хешу можно войти
+    response = client.post("/login", json={"email": email, "password": "secret"})
+    assert response.status_code == 200
+
+
+def test_current_hash_is_not_rehashed(db):
+    current = hash_password("secret")
+    user_id, email = add_user(db, current)
+
+    response = client.post("/login", json={"email": email, "password": "secret"})
+    assert response.status_code == 200
+    assert stored_hash(db, user_id) == current
+
+
+def test_failed_login_does_not_rehash(db):
+    weak = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    user_id, email = add_user(db, weak)
+
+    response = client.post("/login", json={"email": email, "password": "wrong"})
+    assert response.status_code == 400
+    assert stored_hash(db, user_id) == weak
@@ -0,0 +1,71 @@
+import pytest
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc
+from app.main import app
+from app.models import User
+from app.auth import create_access_token
+from app.core.config import settings
+from app.core.pool import engine_options, pool_stats
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def valid_token(db):
+    # создаем тестового библиотекаря
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    db.add(user)
+    db.commit()
+    return create_access_token(data={"sub": user.email})
+
+
+def test_pool_stats_endpoint(valid_token):
+    response = client.get(
+        "/pool-stats", headers={"Authorization": f"Bearer {valid_token}"}
+    )
+    assert response.status_code == 200
+    stats = response.json()["sync"]
+    assert stats["pool"] == "TimedQueuePool"
+    assert stats["size"] == settings.DB_POOL_SIZE
+    assert stats["acquired"] > 0
+    assert {"checked_out", "overflow", "wait_max_seconds"} <= set(stats)
+
+
+# пул из одного соединения без overflow: второе соединение ждет и падает по таймауту
+def test_pool_timeout_is_counted():
+    options = SimpleNamespace(
+        DB_NULL_POOL=False,
+        DB_POOL_SIZE=1,
+        DB_MAX_OVERFLOW=0,
+        DB_POOL_TIMEOUT=0.1,
+        DB_POOL_RECYCLE=-1,
+        DB_POOL_PRE_PING=True,
+    )
+    engine = create_engine(settings.DATABASE_URL, **engine_options(options))
+    try:
+        with engine.connect():
+            assert pool_stats(engine.pool)["checked_out"] == 1
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+
+        stats = pool_stats(engine.pool)
+        assert stats["checked_out"] == 0
+        assert stats["acquired"] == 1
+        assert stats["timeouts"] == 1
+        assert stats["wait_max_seconds"] >= 0.1
+    finally:
+        engine.dispose()
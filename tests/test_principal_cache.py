@@ -0,0 +1,126 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import auth
+from app.main import app
+from app.models import User, Book, BorrowedBook
+from app.auth import (
+    create_access_token,
+    create_user_token,
+    load_principal,
+    principal_cache,
+)
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db):
+    # создаем тестового библиотекаря
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    # создаем тестовую книгу
+    book = Book(title="Test Book", author="Author", total_copies=5)
+    db.add(book)
+    db.commit()
+
+    token = create_access_token(data={"sub": user.email})
+    return user, {"Authorization": f"Bearer {token}"}
+
+
+def test_repeated_requests_hit_cache(db, mock_data):
+    user, headers = mock_data
+
+    assert client.get("/books/", headers=headers).status_code == 200
+    stats = principal_cache.stats()
+
+    assert client.get("/books/", headers=headers).status_code == 200
+    assert principal_cache.stats()["hits"] == stats["hits"] + 1
+    assert principal_cache.stats()["misses"] == stats["misses"]
+
+
+def test_password_change_invalidates_cache(db, mock_data):
+    user, headers = mock_data
+    assert client.get("/books/", headers=headers).status_code == 200
+
+    # смена пароля сбрасывает запись в кеше
+    user.hashed_password = "new_hashed_password"
+    db.commit()
+
+    misses = principal_cache.stats()["misses"]
+    assert client.get("/books/", headers=headers).status_code == 200
+    assert principal_cache.stats()["misses"] == misses + 1
+
+
+def test_deleted_user_is_not_served_from_cache(db, mock_data):
+    user, headers = mock_data
+    assert client.get("/books/", headers=headers).status_code == 200
+
+    db.delete(user)
+    db.commit()
+
+    response = client.get("/books/", headers=headers)
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Could not validate credentials"}
+
+
+# пользователь, попавший в кеш между flush и commit отзыва токенов,
+# сбрасывается после commit
+def test_user_cached_before_commit_is_invalidated(db, mock_data):
+    user, _ = mock_data
+    headers = {"Authorization": f"Bearer {create_user_token(user)}"}
+    assert client.get("/books/", headers=headers).status_code == 200
+
+    user.token_version += 1
+    db.flush()
+    other = SessionLocal()
+    try:
+        stale = load_principal(other, user_id=user.id)
+    finally:
+        other.close()
+    principal_cache.set(("uid", user.id), stale)
+    db.commit()
+    assert client.get("/books/", headers=headers).status_code == 401
+
+
+# запрос, прочитавший пользователя до commit отзыва, не кладёт его в кеш
+def test_user_read_during_commit_is_not_cached(db, mock_data, monkeypatch):
+    user, _ = mock_data
+    headers = {"Authorization": f"Bearer {create_user_token(user)}"}
+
+    def load_then_revoke(*args, **kwargs):
+        stale = load_principal(*args, **kwargs)
+        user.token_version += 1
+        db.commit()
+        return stale
+
+    monkeypatch.setattr(auth, "load_principal", load_then_revoke)
+    assert client.get("/books/", headers=headers).status_code == 200
+    monkeypatch.undo()
+    assert client.get("/books/", headers=headers).status_code == 401
+
+
+def test_cache_stats_endpoint(db, mock_data):
+    user, headers = mock_data
+    response = client.get("/cache-stats", headers=headers)
+    assert response.status_code == 200
+    assert set(response.json()["principals"]) >= {"hits", "misses", "size"}
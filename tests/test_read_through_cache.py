@@ -0,0 +1,235 @@
+import fnmatch
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app import schemas as s
+from app.main import app
+from app.models import User, Book, Reader, BorrowedBook
+from app.auth import create_access_token
+from app.core.cache import RedisCache, TTLCache
+from app.crud import crud_books, crud_readers, crud_borrowed_books
+from app.database import SessionLocal
+import uuid
+
+client = TestClient(app)
+
+
+# простая замена Redis в памяти: только команды, которые использует RedisCache
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self.get(key) is not None:
+            return None
+        self.data[key] = (str(value).encode(), time.monotonic() + ex if ex else None)
+        return True
+
+    def exists(self, key):
+        return int(self.get(key) is not None)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+    def info(self, section):
+        return {"evicted_keys": 0}
+
+
+@pytest.fixture(params=["memory", "redis"])
+def caches(request, monkeypatch):
+    # подменяем кеши на чистые: в памяти или поверх FakeRedis
+    if request.param == "memory":
+        book_cache = TTLCache(100, 60, tombstone_ttl=5)
+        reader_cache = TTLCache(100, 60, tombstone_ttl=5)
+    else:
+        redis = FakeRedis()
+        book_cache = RedisCache(redis, "book", ttl=60, tombstone_ttl=5)
+        reader_cache = RedisCache(redis, "reader", ttl=60, tombstone_ttl=5)
+    monkeypatch.setattr(crud_books, "book_cache", book_cache)
+    monkeypatch.setattr(crud_borrowed_books, "book_cache", book_cache)
+    monkeypatch.setattr(crud_readers, "reader_cache", reader_cache)
+    return book_cache, reader_cache
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()  # Удалить заимствованные книги
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.query(Reader).delete()  # Удалить читателей
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def mock_data(db, caches):
+    # создаем тестового библиотекаря, книгу и читателя
+    user = User(
+        email=f"test_{uuid.uuid4()}@library.com", hashed_password="hashed_password"
+    )
+    book = Book(title="Test Book", author="Author", total_copies=2)
+    reader = Reader(name="Reader", email=f"reader_{uuid.uuid4()}@example.com")
+    db.add_all([user, book, reader])
+    db.commit()
+
+    token = create_access_token(data={"sub": user.email})
+    headers = {"Authorization": f"Bearer {token}"}
+    return user.id, book.id, reader.id, headers
+
+
+def test_repeated_reads_hit_cache(db, mock_data, caches):
+    user_id, book_id, reader_id, headers = mock_data
+    book_cache, reader_cache = caches
+
+    for _ in range(2):
+        assert client.get(f"/books/{book_id}", headers=headers).status_code == 200
+        assert client.get(f"/readers/{reader_id}", headers=headers).status_code == 200
+
+    assert (book_cache.stats()["hits"], book_cache.stats()["misses"]) == (1, 1)
+    assert (reader_cache.stats()["hits"], reader_cache.stats()["misses"]) == (1, 1)
+
+
+def test_update_and_delete_invalidate(db, mock_data):
+    user_id, book_id, reader_id, headers = mock_data
+    client.get(f"/books/{book_id}", headers=headers)
+
+    book = {"title": "New title", "author": "Author", "total_copies": 2}
+    client.put(f"/books/{book_id}", json=book, headers=headers)
+    response = client.get(f"/books/{book_id}", headers=headers)
+    assert response.json()["title"] == "New title"
+
+    client.delete(f"/books/{book_id}", headers=headers)
+    assert client.get(f"/books/{book_id}", headers=headers).status_code == 404
+
+    client.get(f"/readers/{reader_id}", headers=headers)
+    reader = {"name": "Renamed", "email": f"reader_{uuid.uuid4()}@example.com"}
+    client.put(f"/readers/{reader_id}", json=reader, headers=headers)
+    response = client.get(f"/readers/{reader_id}", headers=headers)
+    assert response.json()["name"] == "Renamed"
+
+
+def test_checkout_never_uses_cached_copies(db, mock_data, caches):
+    user_id, book_id, reader_id, headers = mock_data
+    book_cache, reader_cache = caches
+
+    # в кеше устаревшая запись: экземпляров нет
+    row = crud_books.book_row(crud_books.get_book(db, book_id))
+    book_cache.set(book_id, {**row, "available_copies": 0})
+
+    # выдача читает available_copies из БД и сбрасывает запись в кеше
+    bbook = crud_borrowed_books.issue_book(db, book_id, reader_id, user_id)
+    assert bbook.book.available_copies == 1
+    response = client.get(f"/books/{book_id}", headers=headers)
+    assert response.json()["available_copies"] == 1
+
+    # возврат тоже сбрасывает запись
+    crud_borrowed_books.return_book(db, reader_id, book_id, bbook.id)
+    response = client.get(f"/books/{book_id}", headers=headers)
+    assert response.json()["available_copies"] == 2
+
+
+def test_bulk_import_invalidates(db, mock_data, caches):
+    user_id, book_id, reader_id, headers = mock_data
+    book_cache, reader_cache = caches
+    client.get(f"/books/{book_id}", headers=headers)
+
+    crud_books.upsert_books(db, [s.BookCreate(title="Imported", author="Author")])
+    assert book_cache.get(book_id) is None
+
+
+# запрос, прочитавший строку до изменения, не возвращает ее в кеш
+def test_stale_row_is_not_cached_after_invalidation(db, mock_data, caches):
+    user_id, book_id, reader_id, headers = mock_data
+    book_cache, reader_cache = caches
+    stale_book = crud_books.book_row(crud_books.get_book(db, book_id))
+    stale_reader = crud_readers.reader_row(crud_readers.get_reader(db, reader_id))
+
+    crud_borrowed_books.issue_book(db, book_id, reader_id, user_id)
+    reader = s.ReaderUpdate(name="Renamed", email=f"reader_{uuid.uuid4()}@ex.com")
+    crud_readers.update_reader(db, reader_id, reader)
+
+    book_cache.set(book_id, stale_book)
+    reader_cache.set(reader_id, stale_reader)
+    assert book_cache.get(book_id) is None
+    assert reader_cache.get(reader_id) is None
+    response = client.get(f"/books/{book_id}", headers=headers)
+    assert response.json()["available_copies"] == 1
+    response = client.get(f"/readers/{reader_id}", headers=headers)
+    assert response.json()["name"] == "Renamed"
+
+    # после сброса всего кеша метка действует на все ключи
+    book_cache.clear()
+    book_cache.set(book_id, stale_book)
+    assert book_cache.get(book_id) is None
+
+
+def test_tombstone_expires(caches, monkeypatch):
+    book_cache, reader_cache = caches
+    book_cache.pop(1)
+    book_cache.set(1, {"id": 1})
+    assert book_cache.get(1) is None
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+    book_cache.set(1, {"id": 1})
+    assert book_cache.get(1) == {"id": 1}
+
+
+def test_redis_errors_fall_back_to_database(db, mock_data, monkeypatch):
+    user_id, book_id, reader_id, headers = mock_data
+
+    class BrokenRedis(FakeRedis):
+        def get(self, key):
+            raise ConnectionError("redis is down")
+
+    broken = RedisCache(BrokenRedis(), "book", ttl=60)
+    monkeypatch.setattr(crud_books, "book_cache", broken)
+    assert client.get(f"/books/{book_id}", headers=headers).status_code == 200
+    assert broken.stats()["errors"] == 1
+
+
+# сброс кеша идет после commit: недоступный Redis не ломает выдачу и возврат
+def test_redis_invalidation_errors_do_not_fail_writes(db, mock_data, monkeypatch):
+    user_id, book_id, reader_id, headers = mock_data
+
+    class BrokenRedis(FakeRedis):
+        def set(self, key, value, ex=None, nx=False):
+            raise ConnectionError("redis is down")
+
+        def delete(self, *keys):
+            raise ConnectionError("redis is down")
+
+    broken = RedisCache(BrokenRedis(), "book", ttl=60, tombstone_ttl=5)
+    monkeypatch.setattr(crud_books, "book_cache", broken)
+    monkeypatch.setattr(crud_borrowed_books, "book_cache", broken)
+
+    params = {"book_id": book_id, "reader_id": reader_id}
+    response = client.post("/borrow/", params=params, headers=headers)
+    assert response.status_code == 201
+    body = {**params, "bbook_id": response.json()["id"]}
+    response = client.put("/borrow/return", json=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["return_date"] is not None
+    broken.clear()
+    assert broken.stats()["errors"] == 3
+
+
+def test_cache_stats_include_catalog_caches(db, mock_data):
+    user_id, book_id, reader_id, headers = mock_data
+    response = client.get("/cache-stats", headers=headers)
+    assert {"books", "readers"} <= set(response.json())
@@ -34,7 +34,7 @@ def mock_data(db):
     db.refresh(user)
 
     # создаем книгу с 5 копиями
-    book = Book(title="Test Book", author="Author", copies=5)
+    book = Book(title="Test Book", author="Author", total_copies=5)
     db.add(book)
     db.commit()
     db.refresh(book)
@@ -58,7 +58,9 @@ def test_return_borrowed_book(db, mock_data):
     borrowed_books = db.query(BorrowedBook).filter_by(reader_id=reader.id).all()
     assert len(borrowed_books) == 1
     assert borrowed_books[0].return_date is None  # Книга еще не возвращена
-    assert book.copies == 4  # Количество доступных копий должно уменьшиться на 1
+    assert (
+        book.available_copies == 4
+    )  # Количество доступных копий должно уменьшиться на 1
 
     # 3. Возврат книги
     borrowed_book = borrowed_books[0]
@@ -71,5 +73,5 @@ def test_return_borrowed_book(db, mock_data):
     # Мы делаем запрос снова к базе данных, чтобы проверить актуальное значение.
     book = db.query(Book).filter_by(id=book.id).first()  # Запрос к базе
     assert (
-        book.copies == 5
+        book.available_copies == 5
     )  # Количество доступных копий должно увеличиться обратно на 1
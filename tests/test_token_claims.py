@@ -0,0 +1,115 @@
+import pytest
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import event
+from app.main import app
+from app.models import User, Book, BorrowedBook
+from app.auth import create_access_token, hash_password, verified_token_cache
+from app.database import SessionLocal, engine
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        db.query(BorrowedBook).delete()
+        db.query(User).delete()  # Удалить пользователей
+        db.query(Book).delete()  # Удалить книги
+        db.commit()
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def credentials(db):
+    # библиотекарь с настоящим bcrypt-хешем
+    email = f"test_{uuid.uuid4()}@library.com"
+    db.add(User(email=email, hashed_password=hash_password("secret")))
+    db.commit()
+    return {"email": email, "password": "secret"}
+
+
+def login(credentials):
+    response = client.post("/login", json=credentials)
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    return token, {"Authorization": f"Bearer {token}"}
+
+
+# считаем SQL-запросы к таблице users
+@contextmanager
+def count_users_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_token_contains_user_id_and_version(db, credentials):
+    token, headers = login(credentials)
+    user = db.query(User).filter(User.email == credentials["email"]).first()
+
+    claims = jwt.get_unverified_claims(token)
+    assert claims["sub"] == user.email
+    assert claims["uid"] == user.id
+    assert claims["ver"] == user.token_version == 0
+
+
+def test_repeated_requests_skip_verification_and_users_lookup(db, credentials):
+    token, headers = login(credentials)
+    assert client.get("/cache-stats", headers=headers).status_code == 200
+
+    hits = verified_token_cache.stats()["hits"]
+    with count_users_queries() as statements:
+        assert client.get("/cache-stats", headers=headers).status_code == 200
+    assert verified_token_cache.stats()["hits"] == hits + 1
+    assert statements == []
+
+
+def test_logout_revokes_issued_tokens(db, credentials):
+    token, headers = login(credentials)
+    assert client.get("/cache-stats", headers=headers).status_code == 200
+
+    assert client.post("/logout", headers=headers).status_code == 204
+
+    # старый токен больше не принимается, даже из кеша
+    response = client.get("/cache-stats", headers=headers)
+    assert response.status_code == 401
+
+    # новый токен выдается с новой версией
+    new_token, new_headers = login(credentials)
+    assert jwt.get_unverified_claims(new_token)["ver"] == 1
+    assert client.get("/cache-stats", headers=new_headers).status_code == 200
+
+
+def test_token_without_user_id_is_revoked_too(db, credentials):
+    # токен старого формата, только с email
+    legacy = create_access_token(data={"sub": credentials["email"]})
+    legacy_headers = {"Authorization": f"Bearer {legacy}"}
+    assert client.get("/cache-stats", headers=legacy_headers).status_code == 200
+
+    token, headers = login(credentials)
+    assert client.post("/logout", headers=headers).status_code == 204
+    assert client.get("/cache-stats", headers=legacy_headers).status_code == 401
+
+
+def test_tampered_token_is_rejected(db, credentials):
+    token, headers = login(credentials)
+    assert client.get("/cache-stats", headers=headers).status_code == 200
+
+    header, payload, signature = token.split(".")
+    forged = f"{header}.{payload}x.{signature}"
+    response = client.get("/cache-stats", headers={"Authorization": f"Bearer {forged}"})
+    assert response.status_code == 401